@@ -1,90 +1,78 @@
-import os, re, unicodedata, datetime as dt, random
+import os, datetime as dt, random
 from typing import Dict, Any, List, Optional
-import httpx
+from gazetteer import local_geocode
+from geocache import make_geocache
+from http_clients import HTTP
+from metrics import span, timed
+from intents import CLASSIFIER, norm_text
+from search_index import SEARCH, SEARCH_ENABLED
+from sharedcache import SHARED
 
 NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+WIKI_CACHE_TTL = float(os.getenv("WIKI_CACHE_TTL", "86400"))   # s; espacio "wikipedia" de sharedcache
 UA = {"User-Agent": "Riaar/assistant 0.1 (contact: dev@example.com)"}
 
-def _norm(s: str) -> str:
-    s = unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("ascii")
-    return s.lower().strip()
+_norm = norm_text
+
+# espacio "geocode" compartido entre workers; la consulta no es la de app.py (sin
+# viewbox/bounded ni idioma), así que sus claves llevan otro prefijo y no se mezclan
+_GEO_CACHE = make_geocache()
+_GEO_PREFIX = "ai:"
+_WIKI_CACHE = SHARED.namespace("wikipedia", WIKI_CACHE_TTL)
 
 async def geocode(place: str) -> Dict[str, Any]:
-    async with httpx.AsyncClient(timeout=8.0, headers=UA) as client:
-        r = await client.get(NOMINATIM_URL, params={"format": "json", "q": place, "countrycodes": "ni", "limit": 1})
-        r.raise_for_status()
-        data = r.json()
-        if not data:
-            raise RuntimeError("no geocode")
-        hit = data[0]
-        lat, lon = float(hit["lat"]), float(hit["lon"])
-        bb = hit.get("boundingbox", ["10.6", "15.1", "-87.8", "-83.0"])  # [south, north, west, east]
-        south, north, west, east = map(float, bb)
-        return {"center": {"lat": lat, "lon": lon}, "bbox": {"west": west, "south": south, "east": east, "north": north}}
+    local = local_geocode(place)
+    if local:
+        return local
+    return await _GEO_CACHE.get(_GEO_PREFIX + (place or "").strip().lower(), lambda: _nominatim_fetch(place))
+
+async def _nominatim_fetch(place: str) -> Dict[str, Any]:
+    with span("nominatim"):
+        r = await HTTP.get("nominatim", NOMINATIM_URL, headers=UA,
+                           params={"format": "json", "q": place, "countrycodes": "ni", "limit": 1})
+    data = r.json()
+    if not data:
+        raise RuntimeError("no geocode")
+    hit = data[0]
+    lat, lon = float(hit["lat"]), float(hit["lon"])
+    bb = hit.get("boundingbox", ["10.6", "15.1", "-87.8", "-83.0"])  # [south, north, west, east]
+    south, north, west, east = map(float, bb)
+    return {"center": {"lat": lat, "lon": lon}, "bbox": {"west": west, "south": south, "east": east, "north": north}}
+
+def local_articles(query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """Artículos del corpus local (buscador BM25), mismo formato que wiki_search."""
+    if not SEARCH_ENABLED:
+        return []
+    return [{"title": d["title"], "snippet": d["snippet"], "url": d.get("url")}
+            for d in SEARCH.search(query, section="articulos", limit=limit, prefix=False)]
 
 async def wiki_search(query: str) -> List[Dict[str, Any]]:
-    """Búsqueda simple en Wikipedia (es). Sin API key."""
-    async with httpx.AsyncClient(timeout=8.0, headers=UA) as client:
-        # 1) obtener títulos sugeridos
-        s = await client.get("https://es.wikipedia.org/w/api.php", params={
-            "action": "opensearch", "search": query, "limit": 5, "namespace": 0, "format": "json"
+    """Búsqueda simple en Wikipedia (es). Sin API key; compartida entre workers por sharedcache."""
+    return await _WIKI_CACHE.get_or_load(_norm(query), lambda: _wiki_fetch(query))
+
+@timed("wikipedia")
+async def _wiki_fetch(query: str) -> List[Dict[str, Any]]:
+    # 1) obtener títulos sugeridos
+    s = await HTTP.get("wikipedia", "https://es.wikipedia.org/w/api.php", headers=UA, params={
+        "action": "opensearch", "search": query, "limit": 5, "namespace": 0, "format": "json"
+    })
+    sug = s.json()  # [query, titles[], descriptions[], urls[]]
+    titles, descs, urls = sug[1], sug[2], sug[3]
+    res = []
+    for i, title in enumerate(titles):
+        res.append({
+            "title": title,
+            "snippet": descs[i] if i < len(descs) else "",
+            "url": urls[i] if i < len(urls) else f"https://es.wikipedia.org/wiki/{title.replace(' ', '_')}",
         })
-        s.raise_for_status()
-        sug = s.json()  # [query, titles[], descriptions[], urls[]]
-        titles, descs, urls = sug[1], sug[2], sug[3]
-        res = []
-        for i, title in enumerate(titles):
-            res.append({
-                "title": title,
-                "snippet": descs[i] if i < len(descs) else "",
-                "url": urls[i] if i < len(urls) else f"https://es.wikipedia.org/wiki/{title.replace(' ', '_')}",
-            })
-        return res
+    return res
 
 def _map_severity(text: str) -> Optional[str]:
-    if re.search(r"(muy grande|morado|morada)", text): return "purple"
-    if re.search(r"(grave|severa|alto)", text):         return "red"
-    if re.search(r"(medio|media|amarill)", text):       return "yellow"
-    if re.search(r"(leve|verde)", text):                return "green"
-    if re.search(r"(transito|tr[aá]nsito|azul)", text): return "blue"
-    return None
+    return CLASSIFIER.severity(text)
 
 def _detect_intent(q: str) -> Dict[str, Any]:
-    t = _norm(q)
-
-    # artículos
-    if re.search(r"(articul|noticia|informacion|que es|definicion|definici[oó]n)", t):
-        m = re.search(r"(?:sobre|de)\s+(.*)$", t)
-        query = m.group(1) if m else q
-        return {"type": "articles", "query": query}
-
-    # incidencias
-    if re.search(r"(incidencia|insidencia|accidente|evento|alerta)", t):
-        sev = _map_severity(t)
-        m = re.search(r"(?:en)\s+(.+)$", t)
-        place = m.group(1) if m else ""
-        return {"type": "incidents", "place": place, "severity": sev}
-
-    # navegar
-    m = re.search(r"(?:(?:ir|ve|vamos)\s+a|buscar|donde queda|ubicaci[oó]n de)\s+(.+)$", t)
-    if m:
-        return {"type": "navigate", "place": m.group(1)}
-
-    # tips de seguridad
-    if re.search(r"(transito|trafico|conducir|accidente)", t):     return {"type": "tips", "topic": "transito"}
-    if re.search(r"(terremoto|sismo)", t):                         return {"type": "tips", "topic": "terremoto"}
-    if re.search(r"(inundaci[oó]n|lluvia|crecida)", t):            return {"type": "tips", "topic": "inundacion"}
-    if re.search(r"(huracan|tormenta)", t):                        return {"type": "tips", "topic": "huracan"}
-    if re.search(r"(incendio|fuego)", t):                          return {"type": "tips", "topic": "incendio"}
-    if re.search(r"(deslizamiento|derrumbe)", t):                  return {"type": "tips", "topic": "deslizamiento"}
-    if re.search(r"(volcan|erupcion|ceniza)", t):                  return {"type": "tips", "topic": "volcan"}
-    if re.search(r"(seguridad|desastres|emergencia|prevencion)", t): return {"type": "tips", "topic": "general"}
-
-    # fallback: intenta navegar si hay "en ..."
-    m = re.search(r"(?:en)\s+(.+)$", t)
-    if m:
-        return {"type": "navigate", "place": m.group(1)}
-    return {"type": "unknown"}
+    # reglas compiladas en intents.py (un solo barrido por mensaje)
+    return CLASSIFIER.classify(q)
 
 async def assistant(message: str) -> Dict[str, Any]:
     intent = _detect_intent(message)
@@ -110,7 +98,7 @@ async def assistant(message: str) -> Dict[str, Any]:
     if intent["type"] == "articles":
         out["reply"] = f"Buscando artículos sobre **{intent['query']}**…"
         try:
-            res = await wiki_search(intent["query"])
+            res = local_articles(intent["query"]) or await wiki_search(intent["query"])
             out["articles"] = res
             if not res:
                 out["reply"] = "No encontré artículos para ese tema."
@@ -1,17 +1,46 @@
 import os
+import json
+import time
+import base64
 import datetime as dt
-from typing import Any, Dict, Optional, List
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, List, Sequence, Tuple
 
-from fastapi import FastAPI, Query, HTTPException
+import asyncio
+
+from fastapi import FastAPI, Query, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import httpx
-
 # Mantengo tu import del asistente actual como fallback
 from ai import assistant as ai_assistant
 
-from db import query_one, query_all  # ← usamos ambos
+import db
+from db import pool_stats
+from db_async import aquery_rows, astream, executor_stats, shutdown as db_shutdown
+from spatial_index import INDEX as SPATIAL_INDEX, SPATIAL_INDEX_ENABLED
+from gazetteer import local_geocode
+from http_clients import HTTP
+from geocache import make_geocache
+from bulk_import import BULK_BATCH_SIZE, aiter_lines, aiter_records, aimport_records
+from live_feed import FEED, FEED_ENABLED, FEED_HEARTBEAT, parse_filters
+from tiles import TILES, TILE_MAX_ZOOM
+from assistant_hedge import HedgedAssistant
+from search_index import SEARCH, SEARCH_ENABLED
+from metrics import METRICS, MetricsMiddleware, PROFILER, PROFILER_ENABLED, timed
+from breakers import BREAKERS, BreakerOpen
+from clusters import CLUSTERS, CLUSTER_ENABLED, COLLAPSE_WHERE, REPORTS_SELECT
+from rollups import STATS, STATS_ENABLED
+from migrations import SCHEMA, bbox_where, severity_where
+from changes import CHANGES, TOKEN_COL, delta_where, etag, matches
+from regions import REGIONS, REGIONS_ENABLED
+from sharedcache import SHARED, SHARED_CACHE_HOT_TTL, Namespace
+from nearby import NEARBY_DAYS, NEARBY_MAX_K, NEARBY_MAX_RADIUS_KM, nearest
+from serializers import (
+    COLOR_SET, LOGICAL_TO_COLOR, normalize_severity, INCIDENT_SELECT, INCIDENT_OUTPUT, ID, LAT, LON, FECHA,
+    dumps, incident_dict, incidents_payload, incident_line, incident_created_payload, nearby_payload,
+)
 
 load_dotenv()
 
@@ -29,17 +58,112 @@ UA_APP = os.getenv("UA_APP", "Riaar")
 UA_CONTACT = os.getenv("UA_CONTACT", "soporte@mint.gob.ni")
 UA_HEADER = {"User-Agent": f"{UA_APP}/{API_VERSION} ({UA_CONTACT})"}
 
-# --- Caché simple para geocoding (opcional) ---
-try:
-    from cachetools import TTLCache
-    _GEO_CACHE: "TTLCache[str, Dict[str, Any]]" = TTLCache(maxsize=1024, ttl=1800)  # 30 min
-except Exception:
-    _GEO_CACHE = {}  # si no hay cachetools, cae a dict (sin TTL)
+# --- Caché de geocoding (memoria + caché compartida, single-flight, negativos) ---
+_GEO_CACHE = make_geocache()
+
+# --- Respuestas calientes por ETag, compartidas entre workers (sharedcache.py) ---
+# El ETag ya incluye el token de cambio y todos los parámetros: un alta lo cambia
+# y la entrada vieja deja de pedirse (vence por TTL o la expulsa el LRU).
+_HOT_ENABLED = SHARED.enabled and SHARED_CACHE_HOT_TTL > 0
+_HOT_INCIDENTS = SHARED.namespace("incidents", SHARED_CACHE_HOT_TTL)
+_HOT_TILES = SHARED.namespace("tiles", SHARED_CACHE_HOT_TTL)
+
+async def _hot_get(ns: Namespace, tag: Optional[str]) -> Optional[bytes]:
+    return await ns.aget_bytes(tag) if tag and _HOT_ENABLED else None
+
+def _hot_put(ns: Namespace, tag: Optional[str], payload: bytes, t0: float) -> None:
+    if tag and _HOT_ENABLED:
+        ns.note_load(time.perf_counter() - t0)
+        ns.set_bytes(tag, payload)
+
+# --- Métricas: valores leídos de stats() al momento del scrape ---
+_GEO_GAUGES = ("size", "inflight")
+METRICS.register_collector("geocache_events", "Eventos de la caché de geocoding (hits, misses, stale_hits, …)",
+                           lambda: {k: v for k, v in _GEO_CACHE.stats().items() if k not in _GEO_GAUGES},
+                           kind="counter", label="event")
+METRICS.register_collector("geocache", "Tamaño y búsquedas en vuelo de la caché de geocoding",
+                           lambda: {k: v for k, v in _GEO_CACHE.stats().items() if k in _GEO_GAUGES})
+METRICS.register_collector("shared_cache_hits", "Aciertos de la caché compartida en este worker",
+                           lambda: {n: ns.local["hits"] for n, ns in SHARED.namespaces.items()},
+                           kind="counter", label="namespace")
+METRICS.register_collector("shared_cache_misses", "Fallos de la caché compartida en este worker",
+                           lambda: {n: ns.local["misses"] for n, ns in SHARED.namespaces.items()},
+                           kind="counter", label="namespace")
+METRICS.register_collector("db_pool", "Estado del pool de conexiones", lambda: pool_stats())
+METRICS.register_collector("db_executor", "Estado del executor de BD", lambda: executor_stats())
+METRICS.register_collector("breaker_state", "Circuit breakers: 0 cerrado, 1 semiabierto, 2 abierto",
+                           lambda: BREAKERS.states(), label="dependency")
+
+# --- Sondeos de los circuit breakers (ver breakers.py) ---
+# La BD se sondea siempre; los upstreams HTTP sólo mientras su circuito está abierto.
+async def _probe_db() -> None:
+    await asyncio.to_thread(db.ping, max(1, int(BREAKERS.timeout)))
+
+async def _probe_nominatim() -> None:
+    url = NOMINATIM_URL.rsplit("/", 1)[0] + "/status"
+    r = await HTTP.client("nominatim").get(url, params={"format": "json"}, headers=UA_HEADER, timeout=BREAKERS.timeout)
+    r.raise_for_status()
+
+async def _probe_rasa() -> None:
+    url = RASA_URL.split("/webhooks", 1)[0] + "/"
+    r = await HTTP.client("rasa").get(url, timeout=BREAKERS.timeout)
+    r.raise_for_status()
+
+async def _probe_wikipedia() -> None:
+    r = await HTTP.client("wikipedia").get("https://es.wikipedia.org/w/api.php", headers=UA_HEADER,
+                                           params={"action": "query", "meta": "siteinfo", "format": "json"},
+                                           timeout=BREAKERS.timeout)
+    r.raise_for_status()
+
+BREAKERS.set_probe("db", _probe_db, always=True)
+BREAKERS.set_probe("nominatim", _probe_nominatim)
+BREAKERS.set_probe("wikipedia", _probe_wikipedia)
+if RASA_ENABLED:
+    BREAKERS.set_probe("rasa", _probe_rasa)
 
 # Nicaragua bbox aprox (west, south, east, north)
 NI_BBOX = (-87.8, 10.6, -83.0, 15.1)
 
-app = FastAPI(title=API_TITLE, version=API_VERSION)
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # conexiones mínimas del pool en un hilo: el arranque no espera a la BD (si está caída, se abren al usarlas)
+    asyncio.get_running_loop().create_task(asyncio.to_thread(db.warmup_pool)) \
+        .add_done_callback(lambda t: t.cancelled() or t.exception())
+    HTTP.start()
+    BREAKERS.start()
+    SCHEMA.schedule_refresh()             # versión del esquema: elige las consultas por Celda/SevCode
+    if SPATIAL_INDEX_ENABLED:
+        CHANGES.listen(SPATIAL_INDEX.on_changes, SPATIAL_INDEX.window_days)
+    CHANGES.listen(TILES.on_changes, TILES.index.window_days if TILES.index else 30)
+    if CLUSTER_ENABLED:
+        CHANGES.listen(CLUSTERS.on_changes, 1)   # reportes de otros workers (ventana de minutos)
+    CHANGES.start()                       # token de cambio para ETag / since=; pone al día índice y teselas
+    if FEED_ENABLED:
+        await FEED.start()
+    if SPATIAL_INDEX_ENABLED:
+        SPATIAL_INDEX.schedule_rebuild()  # en segundo plano: el arranque no depende de la BD
+    if SEARCH_ENABLED:
+        SEARCH.schedule_start()           # snapshot en mmap + puesta al día desde la BD
+    if CLUSTER_ENABLED:
+        CLUSTERS.schedule_start()         # tabla IncidenteClusters + ventana reciente en memoria
+    if STATS_ENABLED:
+        STATS.schedule_start()            # resúmenes de estadísticas en memoria + relectura periódica
+    if REGIONS_ENABLED:
+        await REGIONS.start()             # rejilla point-in-polygon (en un hilo) + etiquetado de filas pendientes
+    yield
+    await REGIONS.stop()
+    await STATS.stop()
+    await CLUSTERS.stop()
+    await CHANGES.stop()
+    await SCHEMA.stop()
+    await BREAKERS.stop()
+    await FEED.stop()
+    await HTTP.aclose()
+    await asyncio.to_thread(SHARED.close)  # vuelca contadores y escrituras pendientes de este worker
+    db_shutdown()
+
+app = FastAPI(title=API_TITLE, version=API_VERSION, lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,13 +172,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# --------- MODELOS ---------
-class SearchResult(BaseModel):
-    id: str
-    title: str
-    snippet: str
+@app.exception_handler(BreakerOpen)
+async def breaker_open_handler(_: Request, exc: BreakerOpen) -> ORJSONResponse:
+    """Dependencia con el circuito abierto y sin alternativa: 503 inmediato en vez de esperar timeouts."""
+    return ORJSONResponse(status_code=503, content={"detail": str(exc), "dependency": exc.name},
+                          headers={"Retry-After": str(max(1, int(exc.retry_after + 0.5)))})
 
+# --------- MODELOS ---------
 class LoginReq(BaseModel):
     username: str
     password: str
@@ -108,13 +234,9 @@ async def nominatim_geocode(place: str) -> Dict[str, Any]:
     Devuelve center y bbox (contrato intacto).
     """
     key = (place or "").strip().lower()
-    try:
-        cached = _GEO_CACHE.get(key)
-        if cached:
-            return cached
-    except Exception:
-        pass
+    return await _GEO_CACHE.get(key, lambda: _nominatim_fetch(place))
 
+async def _nominatim_fetch(place: str) -> Dict[str, Any]:
     params = {
         "format": "json",
         "q": place,
@@ -127,66 +249,73 @@ async def nominatim_geocode(place: str) -> Dict[str, Any]:
         "bounded": 1
     }
 
-    async with httpx.AsyncClient(timeout=8.0, headers=UA_HEADER) as client:
-        r = await client.get(NOMINATIM_URL, params=params)
-        r.raise_for_status()
-        data = r.json()
-        if not data:
-            raise RuntimeError("No geocode result")
-        hit = data[0]
-        lat, lon = float(hit["lat"]), float(hit["lon"])
-        # boundingbox: ["south","north","west","east"]
-        bb = hit.get("boundingbox", ["10.6", "15.1", "-87.8", "-83.0"])
-        south, north, west, east = map(float, bb)
-        result = {
-            "center": {"lat": lat, "lon": lon},
-            "bbox": {"west": west, "south": south, "east": east, "north": north},
-        }
-
-    try:
-        _GEO_CACHE[key] = result
-    except Exception:
-        pass
-    return result
-
-# mapear etiquetas lógicas → color
-LOGICAL_TO_COLOR = {
-    "grave": "red",
-    "medio": "yellow",
-    "leve": "green",
-    "transito_menor": "blue",
-    "muy_grande": "purple",
-}
-COLOR_SET = {"red", "yellow", "green", "blue", "purple"}
-
-def normalize_severity(value: str) -> str:
-    v = (value or "").strip().lower()
-    if v in COLOR_SET:
-        return v
-    return LOGICAL_TO_COLOR.get(v, "yellow")
+    with METRICS.span("nominatim"):
+        r = await HTTP.get("nominatim", NOMINATIM_URL, params=params, headers=UA_HEADER)
+    data = r.json()
+    if not data:
+        raise RuntimeError("No geocode result")
+    hit = data[0]
+    lat, lon = float(hit["lat"]), float(hit["lon"])
+    # boundingbox: ["south","north","west","east"]
+    bb = hit.get("boundingbox", ["10.6", "15.1", "-87.8", "-83.0"])
+    south, north, west, east = map(float, bb)
+    return {
+        "center": {"lat": lat, "lon": lon},
+        "bbox": {"west": west, "south": south, "east": east, "north": north},
+    }
 
 # --------- ENDPOINTS BÁSICOS ---------
 @app.get("/health")
-def health():
-    db_ok = True
+async def health():
+    # estado cacheado por el sondeo de los breakers: responde al instante aunque la BD esté caída
+    return {"status": "ok", "db": BREAKERS.healthy("db"), "breakers": BREAKERS.stats(),
+            "pool": pool_stats(), "executor": executor_stats(),
+            "spatial_index": SPATIAL_INDEX.stats(), "upstreams": HTTP.stats(),
+            "geocache": _GEO_CACHE.stats(), "shared_cache": await SHARED.astats(),
+            "feed": FEED.stats(), "tiles": TILES.cache.stats(),
+            "assistant": ASSISTANT.stats(), "search": SEARCH.stats(), "clusters": CLUSTERS.stats(),
+            "stats": STATS.stats(), "schema": SCHEMA.stats(),
+            "changes": CHANGES.stats(), "regions": REGIONS.stats()}
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    """Métricas en formato de texto de Prometheus (por worker)."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/debug/profile")
+async def debug_profile(seconds: float = Query(10.0, gt=0)) -> Dict[str, Any]:
+    """
+    Perfilado por muestreo de todos los hilos del worker durante `seconds`.
+    Devuelve pilas colapsadas para flamegraph.pl / speedscope. Requiere PROFILER_ENABLED=1.
+    """
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Perfilador deshabilitado")
     try:
-        _ = query_one("SELECT 1 AS ok")
-    except Exception:
-        db_ok = False
-    return {"status": "ok", "db": db_ok}
+        return await asyncio.to_thread(PROFILER.sample, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 @app.get("/menu")
 def get_menu():
     return {"menu": MENU}
 
 @app.get("/search")
-def search(q: str = Query("", min_length=0), section: str = "", item: str = "") -> Dict[str, Any]:
-    scope = f"{section}{' / ' + item if item else ''}".strip() or "global"
-    results = [
-        SearchResult(id="1", title=f"{scope}: {q} — resultado A", snippet="Ejemplo A"),
-        SearchResult(id="2", title=f"{scope}: {q} — resultado B", snippet="Ejemplo B"),
-    ]
-    return {"query": q, "section": section, "item": item, "results": [r.model_dump() for r in results]}
+async def search(q: str = Query("", min_length=0), section: str = "", item: str = "",
+                 limit: int = Query(20, ge=1, le=100), prefix: bool = True) -> Dict[str, Any]:
+    """
+    Búsqueda BM25 en incidentes, consejos de prevención y artículos locales.
+    `section` (incidentes | prevencion | articulos) e `item` (tipo, riesgo o tema) acotan;
+    con `prefix` el último término se completa (type-ahead).
+    """
+    results = SEARCH.search(q, section, item, limit, prefix) if SEARCH_ENABLED else []
+    return {"query": q, "section": section, "item": item, "results": results}
+
+@app.post("/search/index/rebuild")
+async def rebuild_search_index() -> Dict[str, Any]:
+    """Reconstruye el índice de búsqueda desde la BD y reescribe el snapshot."""
+    if not SEARCH_ENABLED:
+        raise HTTPException(status_code=404, detail="Buscador deshabilitado")
+    return {"index": await SEARCH.rebuild()}
 
 @app.get("/geocode")
 async def geocode(place: str = Query("Nicaragua")) -> Dict[str, Any]:
@@ -196,6 +325,9 @@ async def geocode(place: str = Query("Nicaragua")) -> Dict[str, Any]:
         "bbox": {"west": -87.8, "south": 10.6, "east": -83.0, "north": 15.1},
         "source": "fallback",
     }
+    local = local_geocode(place)  # gazetteer local: sin red
+    if local:
+        return {"place": place, **local, "source": "gazetteer"}
     try:
         g = await nominatim_geocode(place)
         return {"place": place, **g, "source": "nominatim"}
@@ -212,109 +344,484 @@ def login(payload: LoginReq) -> Dict[str, Any]:
     }]})
 
 # --------- INCIDENTES (GET conectado a BD) ---------
+INCIDENTS_PAGE_MAX = int(os.getenv("INCIDENTS_PAGE_MAX", "1000"))      # límite por página (JSON)
+INCIDENTS_STREAM_MAX = int(os.getenv("INCIDENTS_STREAM_MAX", "50000"))  # límite por respuesta NDJSON
+
+def _encode_cursor(r: Sequence[Any]) -> str:
+    """Cursor opaco con la clave de orden (Fecha, Id) de la última fila entregada."""
+    ts = r[FECHA]
+    raw = json.dumps([ts.isoformat() if hasattr(ts, "isoformat") else str(ts), r[ID]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[dt.datetime, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, last_id = json.loads(raw)
+        return dt.datetime.fromisoformat(ts), last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor inválido")
+
 @app.get("/incidents")
-async def incidents(place: str = Query("Nicaragua"), severity: Optional[str] = Query(None)):
+async def incidents(request: Request, place: str = Query("Nicaragua"), severity: Optional[str] = Query(None),
+                    limit: int = Query(200, ge=1), cursor: Optional[str] = Query(None),
+                    format: str = Query("json", pattern="^(json|ndjson)$"),
+                    collapse: bool = Query(False, description="un representante por cluster de reportes duplicados"),
+                    since: Optional[str] = Query(None, description="token de una respuesta anterior: sólo lo cambiado"),
+                    department: Optional[str] = Query(None, description="departamento (en lugar de place)"),
+                    municipio: Optional[str] = Query(None, description="municipio (en lugar de place)")):
     """
     Devuelve incidentes desde la tabla Incidentes cerca del lugar indicado.
     Tabla: Id, Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha
+
+    Paginación por keyset sobre (Fecha, Id) DESC: la respuesta trae `next_cursor`
+    si hay más filas; se reenvía como `cursor=` para la página siguiente.
+    Con `format=ndjson` se emite un incidente por línea a medida que se leen del
+    cursor de la BD; si quedan filas, la última línea es `{"next_cursor": "..."}`.
+    Con `collapse=1` los reportes duplicados (mismo evento, ver clusters.py) se
+    reducen al primero de su cluster, que trae `reports` con el total agrupado.
+
+    Sincronización incremental (changes.py): las respuestas JSON traen `token`
+    y un ETag. Con `since=<token>` sólo vuelven las filas insertadas o
+    modificadas desde entonces (por orden de cambio, `has_more` si no caben en
+    `limit`) junto con el token nuevo. Con `If-None-Match` y sin cambios se
+    responde 304 sin consultar la BD.
+
+    Con `department=` y/o `municipio=` (esquema ≥ 5, regions.py) se filtra por
+    las columnas Departamento/Municipio fijadas al insertar: igualdad sobre un
+    índice, sin geocodificar ni recortar un bbox alrededor del centro.
     """
+    collapse = collapse and CLUSTER_ENABLED
+    stream = format == "ndjson"
+    since_token: Optional[int] = None
+    if since is not None:
+        if stream or collapse or cursor:
+            raise HTTPException(status_code=400, detail="since no se combina con format=ndjson, collapse ni cursor")
+        try:
+            since_token = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="since inválido")
+        if not CHANGES.available:
+            raise HTTPException(status_code=503, detail="Sincronización incremental no disponible",
+                                headers={"Retry-After": "5"})
+    token = CHANGES.token if CHANGES.available else None
+    tag: Optional[str] = None
+    # collapse depende de IncidenteClusters (el reagrupamiento en lote no cambia el token)
+    if token is not None and not stream and not collapse:
+        tag = etag(token, place, severity, limit, cursor, since, department, municipio)
+        if matches(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers={"ETag": tag})
+        # otro worker ya armó esta misma respuesta con este token
+        hot = await _hot_get(_HOT_INCIDENTS, tag)
+        if hot is not None:
+            return Response(hot, media_type="application/json", headers={"ETag": tag})
+    t0 = time.perf_counter()
+    region = _region_filter(department, municipio)
+    if region is None and (department or municipio):
+        place = municipio or department   # esquema sin Departamento/Municipio: geocode + bbox
     try:
-        g = await geocode(place)
-        c = g["center"]
+        c = region[2] if region else (await geocode(place))["center"]
     except Exception:
         c = {"lat": 12.865, "lon": -85.207}
 
+    limit = min(limit, INCIDENTS_STREAM_MAX if stream else INCIDENTS_PAGE_MAX)
+    before = _decode_cursor(cursor) if cursor else None
+
     lat_min, lat_max = float(c["lat"]) - 0.25, float(c["lat"]) + 0.25
     lon_min, lon_max = float(c["lon"]) - 0.25, float(c["lon"]) + 0.25
 
+    if region:
+        place = region[1] or region[0]
+        bbox_sql, bbox_params = _region_where(region)
+    else:
+        # con el esquema migrado (migrations.py) el bbox y la severidad usan Celda/SevCode: sargables
+        bbox_sql, bbox_params = bbox_where(lat_min, lat_max, lon_min, lon_max, cells=SCHEMA.cells)
     sev_sql = ""
-    params: List[Any] = [lat_min, lat_max, lon_min, lon_max]
+    sev_values: Optional[set] = None
+    sev_colors: Optional[set] = None
+    # TOP limit+1: la fila extra sólo indica si hay página siguiente
+    params: List[Any] = [limit + 1, *bbox_params]
     if severity:
         sev = severity.lower()
         logical = next((k for k, v in LOGICAL_TO_COLOR.items() if v == sev), None)
-        sev_sql = " AND (LOWER(Severidad) = ? OR LOWER(Severidad) = ?) "
-        params.extend([sev, logical or sev])
+        color = sev if sev in COLOR_SET else LOGICAL_TO_COLOR.get(sev)
+        if SCHEMA.cells and color:
+            where, values = severity_where([color])
+            sev_sql = f" AND {where} "
+            params.extend(values)
+            sev_colors = {color}   # el índice filtra igual que SevCode: por color normalizado
+        else:
+            sev_sql = " AND (LOWER(Severidad) = ? OR LOWER(Severidad) = ?) "
+            params.extend([sev, logical or sev])
+            sev_values = {sev, logical or sev}
+
+    cursor_sql = ""
+    if before:
+        cursor_sql = " AND (Fecha < ? OR (Fecha = ? AND Id < ?)) "
+        params.extend([before[0], before[0], before[1]])
+
+    if since_token is not None:
+        payload = await _incidents_delta(place, c, since_token, token, limit, bbox_sql, sev_sql, params)
+        _hot_put(_HOT_INCIDENTS, tag, payload, t0)
+        return Response(payload, media_type="application/json", headers={"ETag": tag} if tag else None)
+
+    rows = None
+    # con collapse el índice sólo sirve si ya se cargaron las pertenencias a clusters
+    if SPATIAL_INDEX_ENABLED and not region and (not collapse or CLUSTERS.ready):
+        rows = SPATIAL_INDEX.query(lat_min, lat_max, lon_min, lon_max, sev_values, limit=limit + 1, before=before,
+                                   exclude=CLUSTERS.members if collapse else None, colors=sev_colors)
+        if rows is None and not SPATIAL_INDEX.is_fresh():
+            SPATIAL_INDEX.schedule_rebuild()
+        elif rows is not None and collapse:
+            rows = [(*r, CLUSTERS.size(r[ID])) for r in rows]
+        if rows is not None and not SPATIAL_INDEX.current(token):
+            tag = None   # el índice aún no tiene los cambios de otros workers hasta este token
 
     sql = f"""
-      SELECT TOP 200
-        Id, Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha
+      SELECT TOP (?) {INCIDENT_SELECT}{", " + REPORTS_SELECT if collapse else ""}
       FROM Incidentes
-      WHERE Lat BETWEEN ? AND ?
-        AND Lon BETWEEN ? AND ?
+      WHERE {bbox_sql}
         {sev_sql}
-      ORDER BY Fecha DESC
+        {cursor_sql}
+        {COLLAPSE_WHERE if collapse else ""}
+      ORDER BY Fecha DESC, Id DESC
     """
-    rows = query_all(sql, tuple(params))
 
-    def to_color(value: str) -> str:
-        v = (value or "").lower()
-        if v in COLOR_SET:
-            return v
-        return LOGICAL_TO_COLOR.get(v, "yellow")
-
-    items: List[Dict[str, Any]] = []
+    if stream:
+        async def lines():
+            source = astream(sql, tuple(params)) if rows is None else _aiter(rows)
+            n = 0
+            last: Optional[Sequence[Any]] = None
+            try:
+                async for r in source:
+                    if n == limit:
+                        yield dumps({"next_cursor": _encode_cursor(last)}) + b"\n"
+                        break
+                    yield incident_line(r)
+                    last = r
+                    n += 1
+            finally:
+                await source.aclose()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if rows is None:
+        rows = await aquery_rows(sql, tuple(params))
+
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    extra = {"token": str(token)} if token is not None else {}
+    payload = incidents_payload(place, c, rows[:limit], next_cursor, **extra)
+    _hot_put(_HOT_INCIDENTS, tag, payload, t0)
+    return Response(payload, media_type="application/json", headers={"ETag": tag} if tag else None)
+
+def _region_filter(department: Optional[str], municipio: Optional[str]
+                   ) -> Optional[Tuple[Optional[str], Optional[str], Dict[str, float]]]:
+    """
+    (departamento, municipio, centro) canónicos si la BD ya tiene las columnas
+    etiquetadas; None sin filtro o con un esquema anterior. 400 si el nombre no existe.
+    """
+    if not (department or municipio) or not (REGIONS_ENABLED and SCHEMA.regions):
+        return None
+    dep = REGIONS.department(department) if department else None
+    if department and dep is None:
+        raise HTTPException(status_code=400, detail=f"departamento desconocido: {department}")
+    mun = REGIONS.municipality(municipio) if municipio else None
+    if municipio and mun is None:
+        raise HTTPException(status_code=400, detail=f"municipio desconocido: {municipio}")
+    return dep, mun, REGIONS.center(dep, mun) or {"lat": 12.865, "lon": -85.207}
+
+def _region_where(region: Tuple[Optional[str], Optional[str], Dict[str, float]]) -> Tuple[str, List[Any]]:
+    """Igualdad sobre IX_Incidentes_Departamento_Fecha / IX_Incidentes_Municipio_Fecha."""
+    dep, mun = region[0], region[1]
+    parts, params = [], []
+    if mun:
+        parts.append("Municipio = ?")
+        params.append(mun)
+    if dep:
+        parts.append("Departamento = ?")
+        params.append(dep)
+    return " AND ".join(parts), params
+
+async def _incidents_delta(place: str, c: Dict[str, Any], since: int, token: int, limit: int,
+                           bbox_sql: str, sev_sql: str, params: List[Any]) -> bytes:
+    """Filas de la zona cambiadas en (since, token], en orden de cambio."""
+    rows: List[Tuple] = []
+    if since < token:
+        sql = f"""
+          SELECT TOP (?) {INCIDENT_SELECT}, {TOKEN_COL}
+          FROM Incidentes
+          WHERE {delta_where()}
+            AND {bbox_sql}
+            {sev_sql}
+          ORDER BY Cambio
+        """
+        # params = [TOP, bbox…, severidad…] (sin cursor: since no lo admite)
+        rows = await aquery_rows(sql, (params[0], since, token, *params[1:]))
+    has_more = len(rows) > limit
+    new_token = rows[limit - 1][-1] if has_more else token
+    return incidents_payload(place, c, [r[:-1] for r in rows[:limit]], None,
+                             token=str(new_token), has_more=has_more)
+
+async def _aiter(rows: List[Sequence[Any]]) -> AsyncIterator[Sequence[Any]]:
     for r in rows:
-        color = to_color(str(r.get("Severidad", "")))
-        ts = r.get("Fecha")
-        ts_iso = ts.isoformat() if hasattr(ts, "isoformat") else (str(ts) if ts is not None else dt.datetime.utcnow().isoformat()+"Z")
-        items.append({
-            "id": str(r.get("Id")),
-            "title": r.get("Titulo") or "Incidente",
-            "description": r.get("Descripcion") or "",
-            "severity": color,
-            "type": r.get("Tipo") or "general",
-            "lat": float(r["Lat"]),
-            "lon": float(r["Lon"]),
-            "timestamp": ts_iso,
-        })
-
-    return {"place": place, "center": c, "incidents": items}
+        yield r
+
+@app.get("/incidents/nearby")
+async def incidents_nearby(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                           radius_km: float = Query(5.0, gt=0, le=NEARBY_MAX_RADIUS_KM),
+                           k: int = Query(20, ge=1, le=NEARBY_MAX_K),
+                           days: int = Query(NEARBY_DAYS, ge=1, le=3650, description="antigüedad máxima"),
+                           severity: Optional[str] = Query(None, description="colores o etiquetas, separados por coma")) -> Response:
+    """
+    Los k incidentes más cercanos a (lat, lon) dentro de radius_km, del más
+    cercano al más lejano, con `distance_km` (haversine). Candidatos por celda
+    (índice espacial en memoria si cubre los días pedidos; si no, Celda/bbox en
+    la BD) y ranking vectorizado en NumPy.
+    """
+    sevs = {normalize_severity(s) for s in severity.split(",") if s.strip()} if severity else None
+    ranked, source = await nearest(lat, lon, radius_km, k, days, sevs)
+    return Response(nearby_payload({"lat": lat, "lon": lon}, ranked, radius_km=radius_km, k=k, source=source),
+                    media_type="application/json")
 
 # --------- INCIDENCIAS (POST: crear registro) ---------
 @app.post("/incidents")
-def create_incident(payload: IncidentCreate) -> Dict[str, Any]:
+async def create_incident(payload: IncidentCreate) -> Response:
     """
     Crea una incidencia en la tabla Incidentes y devuelve el registro insertado.
     """
     sev = normalize_severity(payload.severity)
+    params: List[Any] = [payload.title, payload.description or "", sev, payload.type,
+                         float(payload.lat), float(payload.lon)]
+    region_cols = region_values = ""
+    if REGIONS_ENABLED and SCHEMA.regions:
+        # departamento/municipio por point-in-polygon (regions.py) para los filtros de /incidents
+        region_cols, region_values = ", Departamento, Municipio", ", ?, ?"
+        params.extend(REGIONS.tag_one(float(payload.lat), float(payload.lon)))
+        if SCHEMA.region_source:
+            region_cols, region_values = region_cols + ", RegionFuente", region_values + ", ?"
+            params.append(REGIONS.signature)
 
-    sql = """
-        INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha)
-        OUTPUT INSERTED.Id, INSERTED.Titulo, INSERTED.Descripcion, INSERTED.Severidad,
-               INSERTED.Tipo, INSERTED.Lat, INSERTED.Lon, INSERTED.Fecha
-        VALUES (?, ?, ?, ?, ?, ?, GETDATE());
+    sql = f"""
+        INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha{region_cols})
+        OUTPUT {INCIDENT_OUTPUT}
+        VALUES (?, ?, ?, ?, ?, ?, GETDATE(){region_values});
     """
-    row = query_one(sql, (
-        payload.title, payload.description or "", sev, payload.type,
-        float(payload.lat), float(payload.lon)
-    ))
+    rows = await aquery_rows(sql, tuple(params))
+    row = rows[0]
+
+    if SPATIAL_INDEX_ENABLED:
+        SPATIAL_INDEX.add(row)
+    TILES.cache.invalidate_point(float(row[LAT]), float(row[LON]))
+    if SEARCH_ENABLED:
+        SEARCH.add_incident(row)
+    if FEED_ENABLED:
+        await FEED.publish(incident_dict(row))
+
+    cluster = None
+    if CLUSTER_ENABLED:
+        try:
+            cluster = await CLUSTERS.attach(row)
+        except Exception:
+            pass  # el incidente ya está guardado; el reagrupamiento en lote lo asignará
+    if STATS_ENABLED:
+        try:
+            await STATS.record(row)
+        except Exception:
+            pass  # POST /stats/rebuild recalcula los resúmenes desde Incidentes
+    if CHANGES.available:
+        try:
+            await CHANGES.poll()   # el mismo cliente no debe recibir un 304 desactualizado
+        except Exception:
+            pass
+    return Response(incident_created_payload(row, cluster=cluster), media_type="application/json")
 
-    color = normalize_severity(row.get("Severidad"))
-    ts = row.get("Fecha")
-    ts_iso = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
+# --------- TESELAS CON CLUSTERS (mapa) ---------
+@app.get("/incidents/tiles/{z}/{x}/{y}")
+async def incident_tile(request: Request, z: int, x: int, y: int,
+                        severity: Optional[str] = Query(None, description="colores o etiquetas, separados por coma")) -> Response:
+    """
+    Clusters pre-agregados de una tesela XYZ: por celda, cantidad, centroide y
+    severidad dominante. El mapa dibuja pocos marcadores en vez de miles de puntos.
+    """
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Tesela fuera de rango")
+    headers = {"Cache-Control": "public, max-age=30"}
+    tag: Optional[str] = None
+    token = CHANGES.token if CHANGES.available else None
+    if token is not None:
+        # la fecha: la ventana de días del índice también cambia el contenido
+        tag = etag(token, z, x, y, severity, dt.date.today())
+        if matches(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers={**headers, "ETag": tag})
+        hot = await _hot_get(_HOT_TILES, tag)
+        if hot is not None:
+            return Response(hot, media_type="application/json", headers={**headers, "ETag": tag})
+    t0 = time.perf_counter()
+    sevs = {normalize_severity(s) for s in severity.split(",") if s.strip()} if severity else None
+    payload = await TILES.tile(z, x, y, sevs)
+    # caché/índice sin los cambios de otros workers hasta este token: sin ETag ni copia compartida
+    if tag is not None and TILES.current(token):
+        headers["ETag"] = tag
+        _hot_put(_HOT_TILES, tag, payload, t0)
+    return Response(payload, media_type="application/json", headers=headers)
+
+# --------- INCIDENTES EN TIEMPO REAL (SSE / WebSocket) ---------
+def _feed_subscribe(bbox: Optional[str], severity: Optional[str]):
+    if not FEED_ENABLED:
+        raise HTTPException(status_code=404, detail="Feed en tiempo real deshabilitado")
+    try:
+        box, sevs = parse_filters(bbox, severity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FEED.subscribe(box, sevs)
+
+@app.get("/incidents/stream")
+async def incidents_stream(request: Request,
+                           bbox: Optional[str] = Query(None, description="west,south,east,north"),
+                           severity: Optional[str] = Query(None, description="colores o etiquetas, separados por coma")):
+    """
+    Server-Sent Events con los incidentes nuevos que caen en el bbox/severidad pedidos.
+    Reemplaza el re-sondeo periódico de GET /incidents.
+    """
+    sub = _feed_subscribe(bbox, severity)
 
-    return {
-        "incident": {
-            "id": str(row.get("Id")),
-            "title": row.get("Titulo"),
-            "description": row.get("Descripcion"),
-            "severity": color,
-            "type": row.get("Tipo") or "general",
-            "lat": float(row["Lat"]),
-            "lon": float(row["Lon"]),
-            "timestamp": ts_iso,
-        }
-    }
+    async def events():
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(sub.queue.get(), timeout=FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield b": ping\n\n"
+                    continue
+                yield b"event: incident\ndata: " + data + b"\n\n"
+        finally:
+            FEED.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/incidents/ws")
+async def incidents_ws(ws: WebSocket, bbox: Optional[str] = None, severity: Optional[str] = None):
+    """Mismo feed por WebSocket: un mensaje JSON por incidente nuevo."""
+    try:
+        sub = _feed_subscribe(bbox, severity)
+    except HTTPException as e:
+        await ws.close(code=1008, reason=str(e.detail))
+        return
+    await ws.accept()
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(sub.queue.get(), timeout=FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await ws.send_text('{"type":"ping"}')
+                continue
+            await ws.send_text(data.decode())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        FEED.unsubscribe(sub)
+
+@app.post("/incidents/bulk")
+async def bulk_incidents(request: Request,
+                         format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+                         batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=20000),
+                         dry_run: bool = Query(False)) -> Dict[str, Any]:
+    """
+    Importación masiva (CSV con cabecera o NDJSON) leída en streaming del cuerpo.
+    Campos: title, description, severity, type, lat, lon y opcional timestamp (ISO 8601).
+    Devuelve el throughput por lote y las filas rechazadas con su motivo.
+    """
+    ctype = request.headers.get("content-type", "")
+    fmt = format or ("ndjson" if ("ndjson" in ctype or "jsonl" in ctype) else "csv")
+    records = aiter_records(aiter_lines(request.stream()), fmt)
+    report = await aimport_records(records, IncidentCreate, batch_size, dry_run=dry_run,
+                                   insert=STATS.insert_params if STATS_ENABLED else None,
+                                   tag=(REGIONS.tag_params_source if SCHEMA.region_source else REGIONS.tag_params)
+                                   if REGIONS_ENABLED and SCHEMA.regions else None)
+    if report.accepted and not dry_run:
+        if not CHANGES.available:
+            # con token, el poll de abajo entrega las filas nuevas (o pide recargar si son muchas)
+            TILES.cache.clear()
+            if SPATIAL_INDEX_ENABLED:
+                SPATIAL_INDEX.schedule_rebuild()
+        if SEARCH_ENABLED:
+            SEARCH.schedule_catch_up()
+        if CLUSTER_ENABLED:
+            CLUSTERS.schedule_rebuild()
+        if CHANGES.available:
+            try:
+                await CHANGES.poll()
+            except Exception:
+                pass
+    return report.to_dict()
+
+@app.post("/incidents/index/rebuild")
+async def rebuild_incident_index() -> Dict[str, Any]:
+    """
+    Recarga bajo demanda el índice espacial de incidentes recientes.
+    """
+    if not SPATIAL_INDEX_ENABLED:
+        raise HTTPException(status_code=404, detail="Índice espacial deshabilitado")
+    return {"index": await SPATIAL_INDEX.rebuild()}
+
+@app.post("/incidents/clusters/rebuild")
+async def rebuild_incident_clusters() -> Dict[str, Any]:
+    """
+    Reagrupa en lote toda la historia de Incidentes (NumPy) y sincroniza
+    IncidenteClusters con el resultado.
+    """
+    if not CLUSTER_ENABLED:
+        raise HTTPException(status_code=404, detail="Agrupación deshabilitada")
+    return {"clusters": await CLUSTERS.rebuild()}
+
+# --------- ESTADÍSTICAS (Reportes → Estadísticas) ---------
+def _csv_set(value: Optional[str], norm=lambda v: v) -> Optional[set]:
+    items = {norm(v.strip()) for v in (value or "").split(",") if v.strip()}
+    return items or None
+
+@app.get("/stats")
+async def incident_stats(bucket: str = Query("day", pattern="^(hour|day|week)$"),
+                         date_from: Optional[dt.date] = Query(None, alias="from"),
+                         date_to: Optional[dt.date] = Query(None, alias="to"),
+                         severity: Optional[str] = Query(None, description="colores o etiquetas, separados por coma"),
+                         type: Optional[str] = Query(None, description="tipos separados por coma"),
+                         department: Optional[str] = Query(None, description="departamentos separados por coma")) -> Dict[str, Any]:
+    """
+    Conteos por severidad, tipo y departamento, y serie temporal por hora/día/semana
+    para los gráficos (Recharts). Sale de los resúmenes pre-agregados en memoria:
+    el coste depende del rango pedido, no del tamaño de Incidentes.
+    """
+    if not STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Estadísticas deshabilitadas")
+    if STATS.loaded_at is None:
+        raise HTTPException(status_code=503, detail="Estadísticas cargándose", headers={"Retry-After": "5"})
+    end = dt.datetime.combine(date_to, dt.time(23, 59, 59)) if date_to else None
+    start = dt.datetime.combine(date_from, dt.time()) if date_from else None
+    try:
+        return STATS.query(bucket, start, end,
+                           severities=_csv_set(severity, normalize_severity),
+                           types=_csv_set(type, str.lower),
+                           departments=_csv_set(department))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/stats/rebuild")
+async def rebuild_stats() -> Dict[str, Any]:
+    """Recalcula en lote ResumenHora/ResumenDia desde toda la historia de Incidentes."""
+    if not STATS_ENABLED:
+        raise HTTPException(status_code=404, detail="Estadísticas deshabilitadas")
+    return {"stats": await STATS.rebuild()}
 
 # --------- ASISTENTE IA ---------
+@timed("rasa")
 async def _ask_rasa(text: str) -> Optional[Dict[str, Any]]:
     """
     Envía el texto a Rasa (REST) y devuelve {reply, actions} o None si no hay respuesta útil.
     """
-    async with httpx.AsyncClient(timeout=RASA_TIMEOUT) as client:
-        resp = await client.post(RASA_URL, json={"sender": "user", "message": text})
-        resp.raise_for_status()
-        payload = resp.json()  # lista de mensajes
+    resp = await HTTP.post("rasa", RASA_URL, json={"sender": "user", "message": text}, timeout=RASA_TIMEOUT)
+    payload = resp.json()  # lista de mensajes
     reply_parts: List[str] = []
     actions: List[Dict[str, Any]] = []
     for m in payload:
@@ -327,22 +834,14 @@ async def _ask_rasa(text: str) -> Optional[Dict[str, Any]]:
         return None
     return {"reply": reply, "actions": actions}
 
+ASSISTANT = HedgedAssistant(_ask_rasa if RASA_ENABLED else None, ai_assistant)
+
 @app.post("/assistant")
 async def assistant_api(body: AssistantReq):
     """
     1) Intenta con Rasa si está habilitado.
-    2) Si Rasa no responde/errores, cae al asistente existente (ai_assistant).
+    2) Si Rasa no contesta en ASSISTANT_HEDGE_DELAY, lanza también el asistente
+       local (ai_assistant) y devuelve la primera respuesta útil.
+    3) Consejos e incidencias se memorizan por texto normalizado.
     """
-    text = body.message or ""
-    if RASA_ENABLED:
-        try:
-            rasa_out = await _ask_rasa(text)
-            if rasa_out:
-                return rasa_out
-        except Exception:
-            pass  # fallback silencioso
-
-    result = await ai_assistant(text)  # tu lógica anterior sigue viva
-    if isinstance(result, str):
-        return {"reply": result, "actions": []}
-    return result
\ No newline at end of file
+    return await ASSISTANT.answer(body.message or "")
@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from breakers import BREAKERS
+from intents import CLASSIFIER, norm_text
+from sharedcache import SHARED, Namespace
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+ASSISTANT_HEDGE       = os.getenv("ASSISTANT_HEDGE", "1") != "0"
+ASSISTANT_HEDGE_DELAY = float(os.getenv("ASSISTANT_HEDGE_DELAY", "0.35"))  # s antes de lanzar el asistente local
+ASSISTANT_MEMO        = os.getenv("ASSISTANT_MEMO", "1") != "0"
+ASSISTANT_MEMO_TTL    = float(os.getenv("ASSISTANT_MEMO_TTL", "600"))       # s; espacio "assistant" de sharedcache
+# intenciones cuya respuesta sólo depende del texto (no de datos externos)
+ASSISTANT_MEMO_INTENTS = {"tips", "incidents"}
+
+Answer = Dict[str, Any]
+Engine = Callable[[str], Awaitable[Optional[Answer]]]
+
+class EngineStats:
+    def __init__(self):
+        self.calls = 0
+        self.wins = 0
+        self.errors = 0
+        self.empty = 0
+        self.cancelled = 0
+        self._lat_sum = 0.0
+        self._lat_n = 0
+        self.lat_max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self._lat_sum += seconds
+        self._lat_n += 1
+        self.lat_max = max(self.lat_max, seconds)
+
+    def to_dict(self, races: int) -> Dict[str, Any]:
+        return {
+            "calls": self.calls, "wins": self.wins, "errors": self.errors,
+            "empty": self.empty, "cancelled": self.cancelled,
+            "win_rate": round(self.wins / races, 3) if races else None,
+            "latency_avg_ms": round(self._lat_sum / self._lat_n * 1000, 1) if self._lat_n else None,
+            "latency_max_ms": round(self.lat_max * 1000, 1),
+        }
+
+class HedgedAssistant:
+    """
+    Rasa primero; si no contesta en `delay` segundos se lanza también el
+    asistente local y gana la primera respuesta útil (la otra tarea se cancela).
+    Las respuestas de intenciones deterministas se memorizan por texto
+    normalizado en la caché compartida: la que respondió un worker la reutilizan
+    los demás.
+    """
+
+    def __init__(self, primary: Optional[Engine], fallback: Engine, delay: float = ASSISTANT_HEDGE_DELAY,
+                 hedge: bool = ASSISTANT_HEDGE, memo: Optional[Namespace] = None):
+        self.engines: Dict[str, Optional[Engine]] = {"rasa": primary, "local": fallback}
+        self.delay = delay
+        self.hedge = hedge
+        if memo is None and ASSISTANT_MEMO and SHARED.enabled:
+            memo = SHARED.namespace("assistant", ASSISTANT_MEMO_TTL)
+        self.memo = memo
+        self.stats_by_engine = {name: EngineStats() for name in self.engines}
+        self.requests = 0
+        self.memo_hits = 0
+        self.unanswered = 0   # ningún motor dio respuesta útil (no cuenta como victoria)
+
+    # ---- motores ----
+    async def _run(self, name: str, text: str) -> Optional[Answer]:
+        """Ejecuta un motor; None si falla o no tiene respuesta útil."""
+        st = self.stats_by_engine[name]
+        st.calls += 1
+        t0 = time.perf_counter()
+        try:
+            out = await self.engines[name](text)
+        except asyncio.CancelledError:
+            st.cancelled += 1
+            raise
+        except Exception:
+            st.errors += 1
+            return None
+        st.observe(time.perf_counter() - t0)
+        if isinstance(out, str):
+            out = {"reply": out, "actions": []}
+        if not out:
+            st.empty += 1
+            return None
+        return out
+
+    async def _race(self, text: str) -> Tuple[Optional[str], Answer]:
+        """(motor ganador, respuesta); (None, vacía) si ninguno dio una respuesta útil."""
+        tasks: Dict[asyncio.Task, str] = {}
+        try:
+            # con el circuito de Rasa abierto se va directo al asistente local
+            if self.engines["rasa"] is not None and not BREAKERS.is_open("rasa"):
+                tasks[asyncio.ensure_future(self._run("rasa", text))] = "rasa"
+                done, _ = await asyncio.wait(tasks, timeout=self.delay if self.hedge else None)
+                for t in done:
+                    if t.result():
+                        return "rasa", t.result()
+            tasks[asyncio.ensure_future(self._run("local", text))] = "local"
+            pending = {t for t in tasks if not t.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.result():
+                        return tasks[t], t.result()
+            return None, {"reply": "", "actions": []}
+        finally:
+            # también si se cancela la petición durante la espera del hedge
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+
+    async def answer(self, text: str) -> Answer:
+        self.requests += 1
+        key = norm_text(text)
+        memo = self.memo is not None and CLASSIFIER.classify(text)["type"] in ASSISTANT_MEMO_INTENTS
+        if memo:
+            hit = await self.memo.aget(key)
+            if hit is not None:
+                self.memo_hits += 1
+                return hit
+        t0 = time.perf_counter()
+        winner, out = await self._race(text)
+        if winner is None:
+            self.unanswered += 1
+            return out
+        self.stats_by_engine[winner].wins += 1
+        if memo and out.get("reply"):
+            self.memo.note_load(time.perf_counter() - t0)
+            self.memo.set(key, out)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        races = self.requests - self.memo_hits
+        return {
+            "hedge": self.hedge,
+            "delay_s": self.delay,
+            "requests": self.requests,
+            "unanswered": self.unanswered,
+            "memo": {"enabled": self.memo is not None, "ttl_s": self.memo.ttl if self.memo else None,
+                     "hits": self.memo_hits},
+            "engines": {name: st.to_dict(races) for name, st in self.stats_by_engine.items()},
+        }
@@ -0,0 +1,119 @@
+"""
+Clasificador de intenciones: regresión y mensajes/s, antes vs. después.
+
+  antes:   ai._detect_intent con ~20 re.search secuenciales (copia fiel abajo)
+  después: intents.CLASSIFIER.classify / classify_batch (una alternancia compilada)
+
+Primero comprueba que las tres variantes dan exactamente el resultado esperado
+en bench/intent_corpus.jsonl; luego mide el rendimiento.
+
+Uso (desde services/backend):  python bench/bench_intents.py [repeticiones]
+                               python bench/bench_intents.py --regen   (reescribe "expected" con la versión anterior)
+"""
+import os
+import re
+import sys
+import json
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import CLASSIFIER  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.jsonl")
+
+# ── Versión anterior (copia fiel de ai.py antes del cambio) ───────────────────
+def _norm(s: str) -> str:
+    s = unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("ascii")
+    return s.lower().strip()
+
+def _map_severity(text):
+    if re.search(r"(muy grande|morado|morada)", text): return "purple"
+    if re.search(r"(grave|severa|alto)", text):         return "red"
+    if re.search(r"(medio|media|amarill)", text):       return "yellow"
+    if re.search(r"(leve|verde)", text):                return "green"
+    if re.search(r"(transito|tr[aá]nsito|azul)", text): return "blue"
+    return None
+
+def old_detect_intent(q):
+    t = _norm(q)
+    if re.search(r"(articul|noticia|informacion|que es|definicion|definici[oó]n)", t):
+        m = re.search(r"(?:sobre|de)\s+(.*)$", t)
+        query = m.group(1) if m else q
+        return {"type": "articles", "query": query}
+    if re.search(r"(incidencia|insidencia|accidente|evento|alerta)", t):
+        sev = _map_severity(t)
+        m = re.search(r"(?:en)\s+(.+)$", t)
+        place = m.group(1) if m else ""
+        return {"type": "incidents", "place": place, "severity": sev}
+    m = re.search(r"(?:(?:ir|ve|vamos)\s+a|buscar|donde queda|ubicaci[oó]n de)\s+(.+)$", t)
+    if m:
+        return {"type": "navigate", "place": m.group(1)}
+    if re.search(r"(transito|trafico|conducir|accidente)", t):     return {"type": "tips", "topic": "transito"}
+    if re.search(r"(terremoto|sismo)", t):                         return {"type": "tips", "topic": "terremoto"}
+    if re.search(r"(inundaci[oó]n|lluvia|crecida)", t):            return {"type": "tips", "topic": "inundacion"}
+    if re.search(r"(huracan|tormenta)", t):                        return {"type": "tips", "topic": "huracan"}
+    if re.search(r"(incendio|fuego)", t):                          return {"type": "tips", "topic": "incendio"}
+    if re.search(r"(deslizamiento|derrumbe)", t):                  return {"type": "tips", "topic": "deslizamiento"}
+    if re.search(r"(volcan|erupcion|ceniza)", t):                  return {"type": "tips", "topic": "volcan"}
+    if re.search(r"(seguridad|desastres|emergencia|prevencion)", t): return {"type": "tips", "topic": "general"}
+    m = re.search(r"(?:en)\s+(.+)$", t)
+    if m:
+        return {"type": "navigate", "place": m.group(1)}
+    return {"type": "unknown"}
+
+# ── Corpus ────────────────────────────────────────────────────────────────────
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def regen() -> None:
+    cases = load_corpus()
+    with open(CORPUS, "w", encoding="utf-8") as f:
+        for c in cases:
+            f.write(json.dumps({"message": c["message"], "expected": old_detect_intent(c["message"])},
+                               ensure_ascii=False) + "\n")
+    print(f"{len(cases)} casos regenerados")
+
+def check(cases) -> int:
+    msgs = [c["message"] for c in cases]
+    batch = CLASSIFIER.classify_batch(msgs)
+    failures = 0
+    for c, b in zip(cases, batch):
+        got = {"antes": old_detect_intent(c["message"]), "classify": CLASSIFIER.classify(c["message"]), "batch": b}
+        for name, res in got.items():
+            if res != c["expected"]:
+                failures += 1
+                print(f"  FALLO [{name}] {c['message']!r}: {res} != {c['expected']}")
+    return failures
+
+def bench(fn, msgs, repeat: int) -> float:
+    fn(msgs)  # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(msgs)
+    return len(msgs) * repeat / (time.perf_counter() - t0)
+
+def main() -> int:
+    if "--regen" in sys.argv:
+        regen()
+        return 0
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cases = load_corpus()
+    failures = check(cases)
+    print(f"Regresión: {len(cases)} casos, {failures} fallos")
+    if failures:
+        return 1
+    msgs = [c["message"] for c in cases]
+    print(f"Clasificación ({len(msgs)} mensajes × {repeat})")
+    before = bench(lambda ms: [old_detect_intent(m) for m in ms], msgs, repeat)
+    single = bench(lambda ms: [CLASSIFIER.classify(m) for m in ms], msgs, repeat)
+    batch = bench(CLASSIFIER.classify_batch, msgs, repeat)
+    print(f"  antes:            {before:12,.0f} mensajes/s")
+    print(f"  después (1 a 1):  {single:12,.0f} mensajes/s   (×{single / before:.1f})")
+    print(f"  después (lote):   {batch:12,.0f} mensajes/s   (×{batch / before:.1f})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
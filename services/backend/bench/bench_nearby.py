@@ -0,0 +1,70 @@
+"""
+Micro-benchmark de GET /incidents/nearby sobre el índice espacial en memoria.
+
+Carga N incidentes sintéticos (por defecto 10^6) alrededor de los municipios
+del gazetteer y mide, para radios de 1, 5, 20 y 50 km, la latencia de
+nearby.nearest_from_index (candidatos por celda + haversine NumPy) frente a
+una pasada completa en NumPy sobre todas las filas. Verifica además que ambos
+devuelven los mismos incidentes.
+
+Uso (desde services/backend):  python bench/bench_nearby.py [filas] [consultas]
+"""
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest"))
+
+from nearby import nearest_from_index, rank  # noqa: E402
+from seed import centers, synthetic_rows  # noqa: E402
+from spatial_index import IncidentIndex  # noqa: E402
+
+def build(n: int) -> IncidentIndex:
+    index = IncidentIndex(cell_deg=0.1, window_days=365, max_age=1e9)
+    rows = ((i + 1, *r) for i, r in enumerate(synthetic_rows(n)))
+    index.replace(rows, has_history=False)
+    return index
+
+def brute(index: IncidentIndex, lat: float, lon: float, radius_km: float, k: int):
+    la = np.frombuffer(index._lat, dtype=np.float64)
+    lo = np.frombuffer(index._lon, dtype=np.float64)
+    ts = np.frombuffer(index._ts, dtype=np.float64)
+    order, km = rank(lat, lon, la, lo, ts, radius_km, k)
+    out = [index.row(int(p))[0] for p in order]
+    del la, lo, ts
+    return out
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    q = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    t0 = time.perf_counter()
+    index = build(n)
+    print(f"índice: {n:,} filas, {len(index._grid)} celdas en {time.perf_counter() - t0:.1f}s")
+
+    rnd = random.Random(1)
+    pts = centers()
+    for radius in (1.0, 5.0, 20.0, 50.0):
+        queries = [(lat + rnd.gauss(0, 0.05), lon + rnd.gauss(0, 0.05)) for _, lat, lon in
+                   (rnd.choice(pts) for _ in range(q))]
+        ms = []
+        for lat, lon in queries:
+            t = time.perf_counter()
+            nearest_from_index(lat, lon, radius, 20, 365, index=index)
+            ms.append((time.perf_counter() - t) * 1000)
+        full = []
+        for lat, lon in queries[:20]:
+            t = time.perf_counter()
+            brute(index, lat, lon, radius, 20)
+            full.append((time.perf_counter() - t) * 1000)
+        same = all([r[0][0] for r in nearest_from_index(lat, lon, radius, 20, 365, index=index)]
+                   == brute(index, lat, lon, radius, 20) for lat, lon in queries[:20])
+        print(f"radio {radius:5.1f} km  índice p50 {np.percentile(ms, 50):7.2f} ms  p95 {np.percentile(ms, 95):7.2f} ms"
+              f"  |  pasada completa p50 {np.percentile(full, 50):7.2f} ms  |  mismos resultados: {same}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark del etiquetado por departamento/municipio (regions.py).
+
+Arma la rejilla sobre los polígonos configurados (REGIONS_PATH, o la partición
+aproximada del gazetteer), etiqueta N puntos sintéticos de seed.py (por
+defecto 10^6) y compara con el test de rayo contra todos los polígonos cuyo
+bbox contiene el punto, sin rejilla. Informa qué fracción resuelve la rejilla
+sin test de polígono y verifica que ambos etiquetan igual.
+
+Uso (desde services/backend):  python bench/bench_regions.py [filas] [filas_verificadas]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest"))
+
+from regions import REGIONS, Region  # noqa: E402
+from seed import synthetic_rows  # noqa: E402
+
+def ray(region: Region, x: float, y: float) -> bool:
+    inside = False
+    for ring in region.rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        m = (y1 > y) != (y2 > y)
+        xs = x1[m] + (y - y1[m]) * (x2[m] - x1[m]) / (y2[m] - y1[m])
+        inside ^= bool(int((xs > x).sum()) % 2)
+    return inside
+
+def brute(regions, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    out = np.full(len(lat), -1, dtype=np.int32)
+    for i, (y, x) in enumerate(zip(lat.tolist(), lon.tolist())):
+        for ri, r in enumerate(regions):
+            if r.west <= x <= r.east and r.south <= y <= r.north and ray(r, x, y):
+                out[i] = ri
+                break
+    return out
+
+def main() -> int:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    check = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    t0 = time.perf_counter()
+    index = REGIONS.load()
+    s = index.stats()
+    print(f"regiones: {s['regions']} ({REGIONS.source}), rejilla {s['grid'][0]}×{s['grid'][1]} de {s['cell_deg']}°: "
+          f"{s['cells_inside']} celdas dentro, {s['cells_edge']} de borde, armada en {time.perf_counter() - t0:.2f}s")
+
+    rows = list(synthetic_rows(n))
+    lat = np.array([r[4] for r in rows], dtype=np.float64)
+    lon = np.array([r[5] for r in rows], dtype=np.float64)
+    t = time.perf_counter()
+    found = index.locate(lat, lon)
+    grid_s = time.perf_counter() - t
+    tests = index.polygon_tests
+    print(f"rejilla: {n:,} puntos en {grid_s:.2f}s ({n / grid_s:,.0f} puntos/s), "
+          f"{tests:,} tests de polígono ({tests / n:.1%} de los puntos), {int((found < 0).sum()):,} fuera")
+
+    t = time.perf_counter()
+    expected = brute(index.regions, lat[:check], lon[:check])
+    brute_s = time.perf_counter() - t
+    print(f"sin rejilla (bbox + rayo): {check:,} puntos en {brute_s:.2f}s ({check / brute_s:,.0f} puntos/s)")
+    print(f"mismas etiquetas: {bool((expected == found[:check]).all())}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark de serialización de incidentes (filas/s), antes vs. después.
+
+  antes:   tuplas → dict por fila (_rows_to_dicts) → dict de salida (to_color,
+           float, isoformat) → jsonable_encoder → json.dumps (JSONResponse)
+  después: tuplas → serializers.incidents_payload (orjson, bytes)
+
+Uso (desde services/backend):  python bench/bench_serialization.py [filas] [repeticiones]
+"""
+import os
+import sys
+import json
+import time
+import random
+import datetime as dt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from serializers import (  # noqa: E402
+    INCIDENT_COLUMNS, LOGICAL_TO_COLOR, COLOR_SET, incidents_payload, incident_created_payload,
+)
+
+def synthetic_rows(n: int):
+    now = dt.datetime.now()
+    sevs = ["red", "yellow", "grave", "leve", "blue", "muy_grande"]
+    return [(
+        i, f"Incidente {i}", "Descripción de prueba con acentos: árbol caído", random.choice(sevs),
+        random.choice(["flood", "fire", "traffic"]), random.uniform(10.7, 15.0), random.uniform(-87.6, -83.2),
+        now - dt.timedelta(seconds=i),
+    ) for i in range(n)]
+
+# ── Ruta anterior (copia fiel de app.py antes del cambio) ─────────────────────
+def _rows_to_dicts(rows):
+    cols = list(INCIDENT_COLUMNS)
+    return [dict(zip(cols, r)) for r in rows]
+
+def old_get(rows) -> bytes:
+    def to_color(value: str) -> str:
+        v = (value or "").lower()
+        if v in COLOR_SET:
+            return v
+        return LOGICAL_TO_COLOR.get(v, "yellow")
+    items = []
+    for r in _rows_to_dicts(rows):
+        color = to_color(str(r.get("Severidad", "")))
+        ts = r.get("Fecha")
+        ts_iso = ts.isoformat() if hasattr(ts, "isoformat") else str(ts)
+        items.append({
+            "id": str(r.get("Id")), "title": r.get("Titulo") or "Incidente",
+            "description": r.get("Descripcion") or "", "severity": color,
+            "type": r.get("Tipo") or "general", "lat": float(r["Lat"]), "lon": float(r["Lon"]),
+            "timestamp": ts_iso,
+        })
+    body = {"place": "Managua", "center": {"lat": 12.13, "lon": -86.25}, "incidents": items}
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def old_post(row) -> bytes:
+    r = _rows_to_dicts([row])[0]
+    ts = r.get("Fecha")
+    body = {"incident": {
+        "id": str(r.get("Id")), "title": r.get("Titulo"), "description": r.get("Descripcion"),
+        "severity": LOGICAL_TO_COLOR.get(str(r.get("Severidad")).lower(), str(r.get("Severidad")).lower()),
+        "type": r.get("Tipo") or "general", "lat": float(r["Lat"]), "lon": float(r["Lon"]),
+        "timestamp": ts.isoformat(),
+    }}
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# ── Ruta nueva ────────────────────────────────────────────────────────────────
+def new_get(rows) -> bytes:
+    return incidents_payload("Managua", {"lat": 12.13, "lon": -86.25}, rows)
+
+def new_post(row) -> bytes:
+    return incident_created_payload(row)
+
+def bench(fn, arg, rows_per_call: int, repeat: int) -> float:
+    fn(arg)  # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(arg)
+    return rows_per_call * repeat / (time.perf_counter() - t0)
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rows = synthetic_rows(n)
+    print(f"GET /incidents  ({n} filas × {repeat})")
+    before = bench(old_get, rows, n, repeat)
+    after = bench(new_get, rows, n, repeat)
+    print(f"  antes:   {before:12,.0f} filas/s")
+    print(f"  después: {after:12,.0f} filas/s   (×{after / before:.1f})")
+    print(f"POST /incidents (1 fila × {repeat * 20})")
+    before = bench(old_post, rows[0], 1, repeat * 20)
+    after = bench(new_post, rows[0], 1, repeat * 20)
+    print(f"  antes:   {before:12,.0f} filas/s")
+    print(f"  después: {after:12,.0f} filas/s   (×{after / before:.1f})")
+
+if __name__ == "__main__":
+    main()
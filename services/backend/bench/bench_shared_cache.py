@@ -0,0 +1,113 @@
+"""
+Micro-benchmark de la caché compartida (sharedcache.py) con varios procesos.
+
+Simula N workers que piden claves con distribución Zipf (pocos lugares muy
+consultados, cola larga) y comparan dos configuraciones:
+- un LRU por proceso (lo que había: cada worker calienta su propia caché),
+- el espacio compartido en SQLite/mmap (lo que uno resuelve lo aprovechan todos).
+Informa tasa de aciertos, latencia de get y de encolar un set (la escritura
+la hace el hilo escritor), escrituras descartadas por cola llena y que el
+archivo respeta el tope.
+
+Cada fallo cuesta LOAD_MS (la consulta a Nominatim/BD que la caché evita);
+sin ese coste el bucle no deja tiempo al hilo escritor y la cola se llena.
+
+Uso (desde services/backend):  python bench/bench_shared_cache.py [procesos] [peticiones_por_proceso] [load_ms]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+from collections import OrderedDict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+KEYS = 20_000      # lugares distintos
+ZIPF = 1.1
+LRU_SIZE = 1024    # GEOCACHE_MAXSIZE por defecto
+LOAD_S = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.002
+VALUE = {"center": {"lat": 12.1364, "lon": -86.2514},
+         "bbox": {"west": -86.4, "south": 12.0, "east": -86.1, "north": 12.3}}
+
+def keys_for(seed: int, n: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.zipf(ZIPF, n) - 1) % KEYS
+
+def run_local(seed: int, n: int, out: "mp.Queue") -> None:
+    lru: "OrderedDict[int, dict]" = OrderedDict()
+    hits = 0
+    for k in keys_for(seed, n).tolist():
+        if k in lru:
+            lru.move_to_end(k)
+            hits += 1
+            continue
+        lru[k] = VALUE
+        if len(lru) > LRU_SIZE:
+            lru.popitem(last=False)
+    out.put((hits, n, [], [], 0))
+
+def run_shared(url: str, seed: int, n: int, out: "mp.Queue") -> None:
+    os.environ["SHARED_CACHE_URL"] = url
+    from sharedcache import SharedCache
+    cache = SharedCache(url)
+    ns = cache.namespace("geocode", 3600)
+    hits, get_s, set_s = 0, [], []
+    for k in keys_for(seed, n).tolist():
+        t = time.perf_counter()
+        v = ns.get(f"place-{k}")
+        get_s.append(time.perf_counter() - t)
+        if v is not None:
+            hits += 1
+            continue
+        time.sleep(LOAD_S)
+        t = time.perf_counter()
+        ns.set(f"place-{k}", VALUE)
+        set_s.append(time.perf_counter() - t)
+    cache.close()
+    out.put((hits, n, get_s, set_s, cache.dropped))
+
+def launch(target, args_for, procs: int):
+    q: "mp.Queue" = mp.Queue()
+    ps = [mp.Process(target=target, args=(*args_for(i), q)) for i in range(procs)]
+    t = time.perf_counter()
+    for p in ps:
+        p.start()
+    res = [q.get() for _ in ps]
+    for p in ps:
+        p.join()
+    return res, time.perf_counter() - t
+
+def main() -> int:
+    procs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    tmp = tempfile.mkdtemp()
+    url = "sqlite:" + os.path.join(tmp, "shared.sqlite3")
+
+    res, _ = launch(run_local, lambda i: (i, n), procs)
+    hits = sum(r[0] for r in res)
+    print(f"LRU por proceso ({procs} procesos × {LRU_SIZE}): aciertos {hits / (procs * n):.1%}")
+
+    res, secs = launch(run_shared, lambda i: (url, i, n), procs)
+    hits = sum(r[0] for r in res)
+    gets = np.array([x for r in res for x in r[2]]) * 1e6
+    sets = np.array([x for r in res for x in r[3]]) * 1e6
+    print(f"compartida ({procs} procesos): aciertos {hits / (procs * n):.1%}, "
+          f"{procs * n / secs:,.0f} peticiones/s en total")
+    print(f"  get p50 {np.percentile(gets, 50):.0f}µs p99 {np.percentile(gets, 99):.0f}µs · "
+          f"set (encolar) p50 {np.percentile(sets, 50):.0f}µs p99 {np.percentile(sets, 99):.0f}µs · "
+          f"descartadas {sum(r[4] for r in res):,}")
+
+    from sharedcache import SharedCache
+    cache = SharedCache(url)
+    cache.namespace("geocode", 3600)
+    s = cache.stats()
+    ns = s["namespaces"]["geocode"]["all"]
+    print(f"  archivo: {ns.get('entries', 0):,} entradas, {ns.get('bytes', 0) / 1e6:.1f} MB "
+          f"(tope {s['max_mb']} MB), contadores de todos: {ns['hits']:,} aciertos / {ns['misses']:,} fallos")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
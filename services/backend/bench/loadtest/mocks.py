@@ -0,0 +1,93 @@
+"""
+Servidores simulados para las pruebas de carga, con latencia configurable.
+
+  nominatim:  GET  /search                 → [{lat, lon, boundingbox, display_name}] dentro de Nicaragua
+  rasa:       POST /webhooks/rest/webhook  → [{text}] (y payload custom para "ir a ...")
+
+Uso:  python bench/loadtest/mocks.py nominatim --port 18081 --latency 0.15 --jitter 0.05
+      python bench/loadtest/mocks.py rasa --port 18082 --latency 0.4 --error-rate 0.02
+"""
+import sys
+import zlib
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+def _delay(args: argparse.Namespace) -> float:
+    return max(0.0, args.latency + random.uniform(-args.jitter, args.jitter))
+
+async def _maybe_fail(args: argparse.Namespace) -> None:
+    await asyncio.sleep(_delay(args))
+    if args.error_rate and random.random() < args.error_rate:
+        raise HTTPException(status_code=503, detail="simulated failure")
+
+def nominatim_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping() -> Dict[str, Any]:
+        return {"ok": True}
+
+    @app.get("/status")
+    async def status() -> Dict[str, Any]:
+        # sondeo del circuit breaker (como /status?format=json de Nominatim)
+        return {"status": 0, "message": "OK"}
+
+    @app.get("/search")
+    async def search(q: str = "") -> List[Dict[str, Any]]:
+        await _maybe_fail(args)
+        h = zlib.crc32(q.lower().encode())
+        if h % 10 == 0:
+            return []   # ~10 %: lugar desconocido
+        lat = 10.8 + (h % 4000) / 1000.0
+        lon = -87.5 + ((h >> 12) % 4300) / 1000.0
+        return [{
+            "lat": f"{lat:.6f}", "lon": f"{lon:.6f}", "display_name": f"{q}, Nicaragua",
+            "boundingbox": [f"{lat - 0.05:.6f}", f"{lat + 0.05:.6f}", f"{lon - 0.05:.6f}", f"{lon + 0.05:.6f}"],
+        }]
+
+    return app
+
+def rasa_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping() -> Dict[str, Any]:
+        return {"ok": True}
+
+    @app.get("/")
+    async def root() -> str:
+        # sondeo del circuit breaker (Rasa responde "Hello from Rasa: <versión>")
+        return "Hello from Rasa: mock"
+
+    @app.post("/webhooks/rest/webhook")
+    async def webhook(request: Request) -> List[Dict[str, Any]]:
+        body = await request.json()
+        await _maybe_fail(args)
+        text = str(body.get("message", ""))
+        if text.lower().startswith("ir a "):
+            place = text[5:]
+            return [{"text": f"Te llevo a **{place}**.",
+                     "custom": {"type": "navigate", "place": place, "destination": {"lat": 12.13, "lon": -86.25}}}]
+        return [{"text": f"Entendido: {text}"}]
+
+    return app
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("kind", choices=["nominatim", "rasa"])
+    ap.add_argument("--port", type=int, required=True)
+    ap.add_argument("--latency", type=float, default=0.1, help="s por respuesta")
+    ap.add_argument("--jitter", type=float, default=0.0, help="± s aleatorios")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    args = ap.parse_args()
+    app = nominatim_app(args) if args.kind == "nominatim" else rasa_app(args)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Planes de ejecución y latencia de las consultas de Incidentes antes y después
+de las migraciones (migrations.py: SevCode, Celda e índices (Celda, Fecha)).
+
+Con SQLite (por defecto) copia la base sembrada por seed.py a un archivo de
+trabajo sin migrar, mide, aplica las migraciones y vuelve a medir. Con SQL
+Server (DB_BACKEND=mssql, conexión de .env) mide el estado actual; si la base
+aún no está migrada, pasar --upgrade para aplicar y medir el "después".
+
+Uso (desde services/backend):
+    python bench/loadtest/plans.py --rows 2000000
+    DB_BACKEND=mssql python bench/loadtest/plans.py --upgrade
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime as dt
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(os.path.dirname(HERE))
+sys.path.insert(0, BACKEND)
+
+from seed import centers, seed  # noqa: E402
+
+Case = Callable[[float, float, bool], Tuple[str, List[Any]]]   # (lat, lon, migrado) → (sql, params)
+
+# ── Consultas medidas (mismas formas que app.py / tiles.py) ───────────────────
+def _cases() -> Dict[str, Case]:
+    from migrations import bbox_where, severity_where
+    from serializers import INCIDENT_SELECT
+
+    def incidents(lat: float, lon: float, cells: bool) -> Tuple[str, List[Any]]:
+        where, params = bbox_where(lat - 0.25, lat + 0.25, lon - 0.25, lon + 0.25, cells)
+        return (f"SELECT TOP (?) {INCIDENT_SELECT} FROM Incidentes WHERE {where} ORDER BY Fecha DESC, Id DESC",
+                [201, *params])
+
+    def incidents_severity(lat: float, lon: float, cells: bool) -> Tuple[str, List[Any]]:
+        where, params = bbox_where(lat - 0.25, lat + 0.25, lon - 0.25, lon + 0.25, cells)
+        if cells:
+            sev, sev_params = severity_where(["red"])
+        else:
+            sev, sev_params = "(LOWER(Severidad) = ? OR LOWER(Severidad) = ?)", ["red", "grave"]
+        return (f"SELECT TOP (?) {INCIDENT_SELECT} FROM Incidentes WHERE {where} AND {sev} "
+                f"ORDER BY Fecha DESC, Id DESC", [201, *params, *sev_params])
+
+    def tile(lat: float, lon: float, cells: bool) -> Tuple[str, List[Any]]:
+        # tesela z10 aprox. (0.35°) con la ventana de 30 días de tiles.py
+        where, params = bbox_where(lat - 0.17, lat + 0.17, lon - 0.17, lon + 0.17, cells)
+        return (f"SELECT Lat, Lon, Severidad FROM Incidentes WHERE {where} AND Fecha >= ?",
+                [*params, dt.datetime.now() - dt.timedelta(days=30)])
+
+    return {"incidents": incidents, "incidents_severity": incidents_severity, "tile": tile}
+
+# ── Plan y latencia ───────────────────────────────────────────────────────────
+def explain(cur: Any, sql: str, params: Sequence[Any], sqlite_backend: bool) -> List[str]:
+    if sqlite_backend:
+        cur.execute("EXPLAIN QUERY PLAN " + sql, list(params))
+        return [str(r[3]) for r in cur.fetchall()]
+    # SQL Server: plan estimado en texto, sin ejecutar la consulta
+    cur.execute("SET SHOWPLAN_TEXT ON")
+    try:
+        cur.execute(sql, list(params))
+        lines: List[str] = []
+        while True:
+            lines.extend(str(r[0]).rstrip() for r in cur.fetchall())
+            if not cur.nextset():
+                break
+        return lines
+    finally:
+        cur.execute("SET SHOWPLAN_TEXT OFF")
+
+def measure(cases: Dict[str, Case], points: List[Tuple[float, float]], cells: bool,
+            sqlite_backend: bool) -> Dict[str, Any]:
+    import db
+    out: Dict[str, Any] = {}
+    with db.get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            for name, case in cases.items():
+                plan = explain(cur, *case(*points[0], cells), sqlite_backend)
+                ms: List[float] = []
+                rows = 0
+                for lat, lon in points:
+                    sql, params = case(lat, lon, cells)
+                    t0 = time.perf_counter()
+                    cur.execute(sql, params)
+                    rows += len(cur.fetchall())
+                    ms.append((time.perf_counter() - t0) * 1000)
+                a = np.asarray(ms)
+                out[name] = {
+                    "p50_ms": round(float(np.percentile(a, 50)), 2),
+                    "p95_ms": round(float(np.percentile(a, 95)), 2),
+                    "rows_avg": round(rows / len(points), 1),
+                    "plan": plan,
+                }
+        finally:
+            cur.close()
+    return out
+
+def _print(phase: str, res: Dict[str, Any]) -> None:
+    print(f"── {phase} ──")
+    for name, r in res.items():
+        print(f"  {name:20s} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  filas {r['rows_avg']}")
+        for line in r["plan"]:
+            print(f"      {line}")
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Planes y latencia de consultas antes/después de las migraciones.")
+    ap.add_argument("--db", default=os.path.join(HERE, ".data", "incidentes.db"), help="base sembrada (SQLite)")
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--queries", type=int, default=200, help="consultas por caso (centros al azar)")
+    ap.add_argument("--upgrade", action="store_true", help="SQL Server: aplica las migraciones pendientes")
+    ap.add_argument("--out", default=None, help="JSON de resultados (por defecto results/plans-<fecha>.json)")
+    args = ap.parse_args()
+
+    sqlite_backend = os.getenv("DB_BACKEND", "sqlite").startswith("sqlite")
+    if sqlite_backend:
+        seed(args.db, args.rows)
+        work = os.path.join(os.path.dirname(os.path.abspath(args.db)), "plans.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(work + suffix):
+                os.remove(work + suffix)
+        src, dst = sqlite3.connect(args.db), sqlite3.connect(work)
+        src.backup(dst)
+        src.close()
+        dst.close()
+        os.environ["DB_BACKEND"] = f"sqlite:{work}"
+
+    import migrations
+    rnd = random.Random(7)
+    pts = centers()
+    points = [(lat, lon) for _, lat, lon in (rnd.choice(pts) for _ in range(args.queries))]
+    cases = _cases()
+
+    report: Dict[str, Any] = {
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "backend": "sqlite" if sqlite_backend else "mssql",
+        "rows": args.rows if sqlite_backend else None,
+        "queries": args.queries,
+    }
+    version = migrations.current_version()
+    if version < migrations.CELLS_VERSION:
+        report["before"] = measure(cases, points, False, sqlite_backend)
+        _print(f"antes (esquema v{version})", report["before"])
+        if not (sqlite_backend or args.upgrade):
+            print("Base sin migrar: usar --upgrade para medir el después.")
+        else:
+            t0 = time.perf_counter()
+            migrations.upgrade()
+            report["migration_s"] = round(time.perf_counter() - t0, 1)
+    if migrations.current_version() >= migrations.CELLS_VERSION:
+        report["after"] = measure(cases, points, True, sqlite_backend)
+        _print(f"después (esquema v{migrations.current_version()})", report["after"])
+    if "before" in report and "after" in report:
+        print("── p50 antes → después ──")
+        for name in cases:
+            b, a = report["before"][name]["p50_ms"], report["after"][name]["p50_ms"]
+            print(f"  {name:20s} {b:8.2f} → {a:8.2f} ms  (×{b / a:.1f})" if a else f"  {name:20s} {b} → {a}")
+
+    out = args.out or os.path.join(HERE, "results", f"plans-{dt.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[plans] resultados → {out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Pruebas de carga de app.py sin SQL Server, Nominatim ni Rasa reales.
+
+Levanta (como subprocesos):
+  - mocks.py nominatim / rasa con la latencia indicada,
+  - uvicorn app:app con DB_BACKEND=sqlite:<db> (ver db_sqlite.py), sembrada con seed.py,
+y lanza, escenario por escenario, `--concurrency` clientes en bucle cerrado
+durante `--duration` segundos. Guarda p50/p95/p99, RPS y errores en JSON.
+
+Escenarios: incidents, geocode, assistant, post_incident, mixed.
+
+Uso (desde services/backend):
+    python bench/loadtest/run.py --rows 2000000 --concurrency 32 --duration 20
+    python bench/loadtest/run.py --scenarios incidents,mixed --baseline bench/loadtest/results/anterior.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import datetime as dt
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(os.path.dirname(HERE))
+sys.path.insert(0, BACKEND)
+
+from seed import centers, seed  # noqa: E402
+
+Request = Tuple[str, str, Dict[str, Any], str]   # (método, ruta, kwargs httpx, etiqueta)
+
+# ── Generadores de peticiones ─────────────────────────────────────────────────
+PLACES = [name for name, _, _ in centers()]
+MESSAGES = [
+    "ir a León", "incidencia grave en Managua", "consejos de tránsito", "qué hago en un terremoto",
+    "artículos sobre volcanes", "alerta verde en Jinotega", "donde queda Somoto", "hola",
+]
+SEVERITIES = ["", "red", "yellow", "green"]
+
+def req_incidents(rnd: random.Random) -> Request:
+    params = {"place": rnd.choice(PLACES), "limit": 200}
+    sev = rnd.choice(SEVERITIES)
+    if sev:
+        params["severity"] = sev
+    return "GET", "/incidents", {"params": params}, "incidents"
+
+def req_geocode(rnd: random.Random) -> Request:
+    # mitad gazetteer local, mitad lugares desconocidos (Nominatim simulado + geocache)
+    place = rnd.choice(PLACES) if rnd.random() < 0.5 else f"Barrio {rnd.randint(1, 5000)}, {rnd.choice(PLACES)}"
+    return "GET", "/geocode", {"params": {"place": place}}, "geocode"
+
+def req_assistant(rnd: random.Random) -> Request:
+    return "POST", "/assistant", {"json": {"message": rnd.choice(MESSAGES)}}, "assistant"
+
+def req_post_incident(rnd: random.Random) -> Request:
+    _, lat, lon = rnd.choice(centers_cache)
+    body = {"title": "Prueba de carga", "description": "alta sintética", "severity": rnd.choice(["red", "green"]),
+            "type": "general", "lat": lat + rnd.gauss(0, 0.02), "lon": lon + rnd.gauss(0, 0.02)}
+    return "POST", "/incidents", {"json": body}, "post_incident"
+
+centers_cache = centers()
+
+MIX: List[Tuple[float, Callable[[random.Random], Request]]] = [
+    (0.55, req_incidents), (0.2, req_geocode), (0.15, req_assistant), (0.1, req_post_incident),
+]
+
+def req_mixed(rnd: random.Random) -> Request:
+    x, acc = rnd.random(), 0.0
+    for w, fn in MIX:
+        acc += w
+        if x < acc:
+            return fn(rnd)
+    return MIX[-1][1](rnd)
+
+SCENARIOS: Dict[str, Callable[[random.Random], Request]] = {
+    "incidents": req_incidents, "geocode": req_geocode, "assistant": req_assistant,
+    "post_incident": req_post_incident, "mixed": req_mixed,
+}
+
+# ── Procesos ──────────────────────────────────────────────────────────────────
+def spawn(args: List[str], env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=BACKEND, env={**os.environ, **(env or {})})
+
+def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout}s")
+
+def wait_index(base: str, timeout: float) -> None:
+    """Espera a que el índice espacial termine su carga inicial (si está habilitado)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        idx = httpx.get(base + "/health", timeout=10.0).json().get("spatial_index", {})
+        if not idx.get("enabled") or idx.get("fresh"):
+            return
+        time.sleep(1.0)
+    print("[loadtest] aviso: el índice espacial no terminó de cargar; /incidents irá a la BD")
+
+# ── Carga ─────────────────────────────────────────────────────────────────────
+async def run_scenario(base: str, gen: Callable[[random.Random], Request], concurrency: int,
+                       duration: float, seed_: int) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=30.0, limits=limits) as client:
+        stop = time.monotonic() + duration
+
+        async def worker(i: int) -> None:
+            rnd = random.Random(seed_ * 1000 + i)
+            while time.monotonic() < stop:
+                method, path, kw, label = gen(rnd)
+                t0 = time.perf_counter()
+                try:
+                    r = await client.request(method, path, **kw)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                samples.setdefault(label, []).append(time.perf_counter() - t0)
+                if not ok:
+                    errors[label] = errors.get(label, 0) + 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    def summary(lat: List[float], errs: int) -> Dict[str, Any]:
+        a = np.asarray(lat) * 1000
+        return {
+            "requests": len(lat), "errors": errs, "rps": round(len(lat) / elapsed, 1),
+            "mean_ms": round(float(a.mean()), 2) if len(a) else None,
+            "p50_ms": round(float(np.percentile(a, 50)), 2) if len(a) else None,
+            "p95_ms": round(float(np.percentile(a, 95)), 2) if len(a) else None,
+            "p99_ms": round(float(np.percentile(a, 99)), 2) if len(a) else None,
+            "max_ms": round(float(a.max()), 2) if len(a) else None,
+        }
+
+    everything = [x for v in samples.values() for x in v]
+    out = summary(everything, sum(errors.values()))
+    out["seconds"] = round(elapsed, 2)
+    if len(samples) > 1:
+        out["by_endpoint"] = {k: summary(v, errors.get(k, 0)) for k, v in sorted(samples.items())}
+    return out
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print("\nComparación con la línea base (p95 / RPS):")
+    for name, cur in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old or not old.get("p95_ms") or not cur.get("p95_ms"):
+            continue
+        dp95 = (cur["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+        drps = (cur["rps"] - old["rps"]) / old["rps"] * 100 if old["rps"] else 0.0
+        flag = "  ← REGRESIÓN" if dp95 > 10 or drps < -10 else ""
+        print(f"  {name:14s} p95 {old['p95_ms']:8.1f} → {cur['p95_ms']:8.1f} ms ({dp95:+.1f}%)   "
+              f"RPS {old['rps']:8.1f} → {cur['rps']:8.1f} ({drps:+.1f}%){flag}")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Pruebas de carga de la API con dependencias simuladas.")
+    ap.add_argument("--db", default=os.path.join(HERE, ".data", "incidentes.db"))
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=20.0, help="s por escenario")
+    ap.add_argument("--warmup", type=float, default=3.0, help="s de calentamiento por escenario (no se mide)")
+    ap.add_argument("--workers", type=int, default=1, help="workers de uvicorn")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--nominatim-latency", type=float, default=0.15)
+    ap.add_argument("--rasa-latency", type=float, default=0.4)
+    ap.add_argument("--jitter", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--no-index", action="store_true", help="desactiva el índice espacial (mide la ruta SQL)")
+    ap.add_argument("--index-timeout", type=float, default=300.0)
+    ap.add_argument("--out", default=None, help="JSON de resultados (por defecto results/loadtest-<fecha>.json)")
+    ap.add_argument("--baseline", default=None, help="JSON anterior para comparar")
+    args = ap.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        ap.error(f"escenarios desconocidos: {', '.join(unknown)}")
+
+    seed(args.db, args.rows)
+    tmp = tempfile.mkdtemp(prefix="riaar-loadtest-")
+    nom_port, rasa_port = args.port + 1, args.port + 2
+    mock_args = ["--jitter", str(args.jitter), "--error-rate", str(args.error_rate)]
+    procs = [
+        spawn([os.path.join(HERE, "mocks.py"), "nominatim", "--port", str(nom_port),
+               "--latency", str(args.nominatim_latency), *mock_args]),
+        spawn([os.path.join(HERE, "mocks.py"), "rasa", "--port", str(rasa_port),
+               "--latency", str(args.rasa_latency), *mock_args]),
+    ]
+    env = {
+        "DB_BACKEND": f"sqlite:{os.path.abspath(args.db)}",
+        "NOMINATIM_URL": f"http://127.0.0.1:{nom_port}/search",
+        "RASA_URL": f"http://127.0.0.1:{rasa_port}/webhooks/rest/webhook",
+        "SHARED_CACHE_URL": "sqlite:" + os.path.join(tmp, "shared.sqlite3"),
+        "SEARCH_SNAPSHOT_PATH": os.path.join(tmp, "search_index"),
+        "SPATIAL_INDEX_ENABLED": "0" if args.no_index else "1",
+    }
+    procs.append(spawn(["-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.port),
+                        "--workers", str(args.workers), "--log-level", "warning"], env))
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(f"http://127.0.0.1:{nom_port}/ping")
+        wait_ready(f"http://127.0.0.1:{rasa_port}/ping")
+        wait_ready(base + "/health", timeout=120.0)
+        wait_index(base, args.index_timeout)
+
+        results: Dict[str, Any] = {}
+        for i, name in enumerate(names):
+            if args.warmup > 0:
+                asyncio.run(run_scenario(base, SCENARIOS[name], args.concurrency, args.warmup, seed_=-i - 1))
+            print(f"[loadtest] {name}: {args.concurrency} clientes × {args.duration}s")
+            res = asyncio.run(run_scenario(base, SCENARIOS[name], args.concurrency, args.duration, seed_=i))
+            results[name] = res
+            print(f"  {res['rps']:9.1f} req/s  p50 {res['p50_ms']} ms  p95 {res['p95_ms']} ms  "
+                  f"p99 {res['p99_ms']} ms  errores {res['errors']}")
+        health = httpx.get(base + "/health", timeout=10.0).json()
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    report = {
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "scenarios": results,
+        "health": health,
+    }
+    out = args.out or os.path.join(HERE, "results", f"loadtest-{dt.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[loadtest] resultados → {out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Crea una base SQLite con la tabla Incidentes y N filas sintéticas repartidas
+por Nicaragua (alrededor de los municipios del gazetteer, último año).
+
+Uso (desde services/backend):  python bench/loadtest/seed.py bench/loadtest/.data/incidentes.db --rows 2000000
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import datetime as dt
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from db_sqlite import connect  # noqa: E402
+from gazetteer import GAZETTEER_PATH  # noqa: E402
+
+SEVERITIES = ["red"] * 2 + ["yellow"] * 4 + ["green"] * 5 + ["blue"] * 3 + ["purple"] + ["grave", "leve"]
+TYPES = ["flood", "fire", "traffic", "landslide", "earthquake", "storm", "general"]
+TITLES = {
+    "flood": "Inundación", "fire": "Incendio", "traffic": "Accidente de tránsito", "landslide": "Deslizamiento",
+    "earthquake": "Sismo", "storm": "Tormenta", "general": "Incidente",
+}
+INSERT = ("INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+def centers(path: str = GAZETTEER_PATH) -> List[Tuple[str, float, float]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(r["name"], float(r["lat"]), float(r["lon"])) for r in csv.DictReader(f)
+                if r["kind"] in ("municipality", "community")]
+
+def synthetic_rows(n: int, seed: int = 42) -> Iterator[Tuple]:
+    rnd = random.Random(seed)
+    pts = centers()
+    now = dt.datetime.now()
+    for i in range(n):
+        name, lat, lon = rnd.choice(pts)
+        tipo = rnd.choice(TYPES)
+        yield (
+            f"{TITLES[tipo]} en {name}",
+            f"Reporte ciudadano #{i}: {TITLES[tipo].lower()} cerca de {name}.",
+            rnd.choice(SEVERITIES), tipo,
+            round(lat + rnd.gauss(0, 0.05), 6), round(lon + rnd.gauss(0, 0.05), 6),
+            now - dt.timedelta(seconds=rnd.randint(0, 365 * 86400)),
+        )
+
+def count(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    cur = connect(path).cursor()
+    return cur.execute("SELECT COUNT(*) FROM Incidentes").fetchone()[0]
+
+def seed(path: str, rows: int, batch: int = 50000) -> int:
+    """Completa la tabla hasta `rows` filas. Devuelve cuántas insertó."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    have = count(path)
+    missing = max(0, rows - have)
+    if not missing:
+        return 0
+    cur = connect(path).cursor()
+    t0 = time.perf_counter()
+    buf: List[Tuple] = []
+    for r in synthetic_rows(missing, seed=have):
+        buf.append(r)
+        if len(buf) >= batch:
+            cur.execute("BEGIN")
+            cur.executemany(INSERT, buf)
+            cur.execute("COMMIT")
+            buf = []
+    if buf:
+        cur.execute("BEGIN")
+        cur.executemany(INSERT, buf)
+        cur.execute("COMMIT")
+    cur.execute("ANALYZE")
+    print(f"[seed] {missing:,} filas en {time.perf_counter() - t0:.1f}s → {path}")
+    return missing
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Siembra Incidentes sintéticos en SQLite.")
+    ap.add_argument("path")
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    args = ap.parse_args()
+    seed(args.path, args.rows)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+# Globales; cada dependencia puede sobreescribirlos con BREAKER_<NOMBRE>_<PARÁMETRO>
+BREAKER_ENABLED         = os.getenv("BREAKER_ENABLED", "1") != "0"
+BREAKER_WINDOW          = float(os.getenv("BREAKER_WINDOW", "30"))          # s de historia para la tasa de fallos
+BREAKER_MIN_CALLS       = int(os.getenv("BREAKER_MIN_CALLS", "5"))          # llamadas mínimas en la ventana
+BREAKER_FAILURE_RATE    = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))   # fracción que abre el circuito
+BREAKER_OPEN_SECS       = float(os.getenv("BREAKER_OPEN_SECS", "15"))       # abierto antes de admitir una prueba
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))    # pruebas simultáneas en semiabierto
+BREAKER_PROBE_INTERVAL  = float(os.getenv("BREAKER_PROBE_INTERVAL", "5"))   # s entre rondas del sondeo
+BREAKER_PROBE_TIMEOUT   = float(os.getenv("BREAKER_PROBE_TIMEOUT", "2"))    # s por sondeo
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+Probe = Callable[[], Awaitable[Any]]
+
+def _cfg(name: str, key: str, default: float) -> float:
+    return float(os.getenv(f"BREAKER_{name.upper()}_{key}", str(default)))
+
+class BreakerOpen(RuntimeError):
+    """El circuito de la dependencia está abierto: se falla al instante, sin esperar timeouts."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} no disponible (circuito abierto)")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Cerrado → abierto cuando, en los últimos `window` s y con al menos `min_calls`
+    llamadas, la fracción de fallos llega a `failure_rate`. Tras `open_secs` pasa a
+    semiabierto y admite hasta `half_open_calls` pruebas: un éxito lo cierra, un
+    fallo lo vuelve a abrir. Thread-safe: la BD registra resultados desde el executor.
+    """
+
+    def __init__(self, name: str, window: float = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, open_secs: float = BREAKER_OPEN_SECS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.window = window
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.open_secs = open_secs
+        self.half_open_calls = max(1, half_open_calls)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._events: Deque[Tuple[float, bool]] = deque()   # (monotonic, fallo)
+        self._failures = 0
+        self._lock = threading.Lock()
+        # estadísticas
+        self.opened = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self.last_change = time.time()
+
+    # ---- estado ----
+    def _trim(self, now: float) -> None:
+        limit = now - self.window
+        while self._events and self._events[0][0] < limit:
+            if self._events.popleft()[1]:
+                self._failures -= 1
+
+    def _set(self, state: str, now: float) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        self.last_change = time.time()
+        if state == OPEN:
+            self._opened_at = now
+            self.opened += 1
+        elif state == CLOSED:
+            self._events.clear()
+            self._failures = 0
+        self._trials = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_secs:
+                return HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_secs - (time.monotonic() - self._opened_at))
+
+    # ---- API de llamada ----
+    def acquire(self) -> None:
+        """Antes de llamar a la dependencia. Lanza BreakerOpen si no se admite la llamada."""
+        if not BREAKER_ENABLED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.open_secs:
+                self._set(HALF_OPEN, now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return
+            self.rejected += 1
+        raise BreakerOpen(self.name, self.retry_after())
+
+    def success(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                self._set(CLOSED, now)
+                return
+            self._events.append((now, False))
+            self._trim(now)
+
+    def failure(self, err: Optional[BaseException] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if err is not None:
+                self.last_error = type(err).__name__
+            if self._state == HALF_OPEN:
+                self._set(OPEN, now)
+                return
+            if self._state == OPEN:
+                return
+            self._events.append((now, True))
+            self._failures += 1
+            self._trim(now)
+            n = len(self._events)
+            if n >= self.min_calls and self._failures / n >= self.failure_rate:
+                self._set(OPEN, now)
+
+    def release(self) -> None:
+        """La llamada se canceló sin veredicto (p.ej. perdió la carrera del hedging)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def trip(self, err: Optional[BaseException] = None) -> None:
+        """Abre el circuito de inmediato (el sondeo detectó la caída)."""
+        with self._lock:
+            if err is not None:
+                self.last_error = type(err).__name__
+            self._set(OPEN, time.monotonic())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set(CLOSED, time.monotonic())
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            self._trim(time.monotonic())
+            n = len(self._events)
+            return {
+                "state": state,
+                "calls_in_window": n,
+                "failure_rate": round(self._failures / n, 3) if n else 0.0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "retry_after_s": round(self.retry_after(), 1) if state != CLOSED else 0.0,
+                "last_error": self.last_error,
+            }
+
+class _ProbeState:
+    __slots__ = ("fn", "always", "ok", "at", "latency_ms", "error")
+
+    def __init__(self, fn: Probe, always: bool):
+        self.fn = fn
+        self.always = always
+        self.ok: Optional[bool] = None
+        self.at: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+
+class Breakers:
+    """
+    Un breaker por dependencia (db, nominatim, rasa, wikipedia) y un sondeo en
+    segundo plano:
+    - dependencias `always` (la BD): se sondean en cada ronda; un fallo abre el
+      circuito sin esperar a que lo sufran las peticiones, un éxito lo cierra;
+    - el resto sólo se sondean mientras su circuito está abierto (no se gasta
+      cuota de APIs públicas como Nominatim cuando el tráfico ya las valida).
+    /health lee el último resultado guardado: responde al instante.
+    """
+
+    def __init__(self, interval: float = BREAKER_PROBE_INTERVAL, timeout: float = BREAKER_PROBE_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._probes: Dict[str, _ProbeState] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        br = self._breakers.get(name)
+        if br is None:
+            with self._lock:
+                br = self._breakers.get(name)
+                if br is None:
+                    br = self._breakers[name] = CircuitBreaker(
+                        name,
+                        window=_cfg(name, "WINDOW", BREAKER_WINDOW),
+                        min_calls=int(_cfg(name, "MIN_CALLS", BREAKER_MIN_CALLS)),
+                        failure_rate=_cfg(name, "FAILURE_RATE", BREAKER_FAILURE_RATE),
+                        open_secs=_cfg(name, "OPEN_SECS", BREAKER_OPEN_SECS),
+                        half_open_calls=int(_cfg(name, "HALF_OPEN_CALLS", BREAKER_HALF_OPEN_CALLS)),
+                    )
+        return br
+
+    def is_open(self, name: str) -> bool:
+        return BREAKER_ENABLED and self.get(name).state == OPEN
+
+    def set_probe(self, name: str, fn: Probe, always: bool = False) -> None:
+        self.get(name)
+        self._probes[name] = _ProbeState(fn, always)
+
+    # ---- sondeo ----
+    async def _probe(self, name: str, p: _ProbeState) -> None:
+        br = self.get(name)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(p.fn(), timeout=self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            p.ok, p.error = False, type(e).__name__
+            if br.state != OPEN or p.always:
+                br.trip(e)
+        else:
+            p.ok, p.error = True, None
+            if br.state != CLOSED:
+                br.reset()
+        finally:
+            p.at = time.time()
+            p.latency_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    async def probe_once(self) -> None:
+        due = [(n, p) for n, p in self._probes.items() if p.always or self.get(n).state != CLOSED]
+        if due:
+            await asyncio.gather(*(self._probe(n, p) for n, p in due))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.probe_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if BREAKER_ENABLED and self._probes and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # ---- estado ----
+    def healthy(self, name: str) -> bool:
+        """Último estado conocido: sondeo reciente si lo hay, si no, el circuito."""
+        p = self._probes.get(name)
+        if p is not None and p.always and p.ok is not None:
+            return p.ok and self.get(name).state != OPEN
+        return self.get(name).state != OPEN
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, br in sorted(self._breakers.items()):
+            d = br.stats()
+            d["healthy"] = self.healthy(name)
+            p = self._probes.get(name)
+            if p is not None and p.at is not None:
+                d["probe"] = {"ok": p.ok, "at": round(p.at, 1), "latency_ms": p.latency_ms, "error": p.error}
+            out[name] = d
+        return out
+
+    def states(self) -> Dict[str, int]:
+        """Para /metrics: 0 cerrado, 1 semiabierto, 2 abierto."""
+        code = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+        return {name: code[br.state] for name, br in self._breakers.items()}
+
+BREAKERS = Breakers()
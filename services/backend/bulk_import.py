@@ -0,0 +1,437 @@
+"""
+Importación masiva de incidentes históricos (CSV o NDJSON) en streaming.
+
+Se usa desde POST /incidents/bulk y desde la consola:
+
+    python bulk_import.py historico.csv --batch-size 2000
+    python bulk_import.py historico.ndjson --format ndjson --dry-run
+
+Las filas se validan con las reglas de IncidentCreate (+ normalize_severity),
+se insertan por lotes con executemany (fast_executemany) y nunca se carga el
+archivo completo en memoria.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import codecs
+import argparse
+import datetime as dt
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from serializers import normalize_severity
+
+BULK_BATCH_SIZE       = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_MAX_REJECTED     = int(os.getenv("BULK_MAX_REJECTED", "1000"))      # detalle de rechazos guardado
+BULK_MAX_RECORD_CHARS = int(os.getenv("BULK_MAX_RECORD_CHARS", "65536"))  # registro CSV con comillas abiertas
+
+INSERT_SQL = """
+    INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha)
+    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, GETDATE()))
+"""
+
+# con el esquema ≥ 5 (migrations.REGIONS_VERSION): + Departamento, Municipio (regions.REGIONS.tag_params)
+INSERT_REGION_SQL = """
+    INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha, Departamento, Municipio)
+    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, GETDATE()), ?, ?)
+"""
+
+# con el esquema ≥ 6 (migrations.REGION_SOURCE_VERSION): + RegionFuente (regions.REGIONS.tag_params_source)
+INSERT_SOURCE_SQL = """
+    INSERT INTO Incidentes (Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha, Departamento, Municipio, RegionFuente)
+    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, GETDATE()), ?, ?, ?)
+"""
+
+# INSERT según el ancho de las tuplas (lo que haya agregado `tag`)
+INSERT_BY_WIDTH = {7: INSERT_SQL, 9: INSERT_REGION_SQL, 10: INSERT_SOURCE_SQL}
+
+# columnas aceptadas (API o nombres de la tabla) → campo de IncidentCreate
+FIELD_ALIASES = {
+    "title": "title", "titulo": "title",
+    "description": "description", "descripcion": "description",
+    "severity": "severity", "severidad": "severity",
+    "type": "type", "tipo": "type",
+    "lat": "lat", "latitude": "lat", "latitud": "lat",
+    "lon": "lon", "lng": "lon", "longitude": "lon", "longitud": "lon",
+    "timestamp": "timestamp", "fecha": "timestamp",
+}
+
+Record = Tuple[int, Dict[str, Any]]   # (número de línea, campos)
+
+# ── Parseo incremental ────────────────────────────────────────────────────────
+class RecordParser:
+    """
+    Convierte líneas en registros, una a la vez. En CSV, un campo entre comillas
+    puede abarcar varias líneas: se acumulan hasta que las comillas cuadran, con
+    tope de BULK_MAX_RECORD_CHARS (una comilla suelta no arrastra el resto del
+    archivo a memoria: el registro se rechaza y se sigue en la línea siguiente).
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in ("csv", "ndjson"):
+            raise ValueError(f"Formato no soportado: {fmt}")
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+        self._pending: List[str] = []
+        self._size = 0
+        self._open = False   # paridad de comillas de lo acumulado
+        self._start = 0
+        self.lineno = 0
+
+    def feed(self, line: str) -> Optional[Record]:
+        """Devuelve (línea, dict) cuando la línea completa un registro; None si no."""
+        self.lineno += 1
+        if self.fmt == "ndjson":
+            line = line.strip()
+            if not line:
+                return None
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                return self.lineno, {"__error__": f"JSON inválido: {e}"}
+            if not isinstance(obj, dict):
+                return self.lineno, {"__error__": "se esperaba un objeto JSON"}
+            return self.lineno, obj
+
+        if not self._pending:
+            self._start = self.lineno
+        self._pending.append(line)
+        self._size += len(line)
+        if line.count('"') % 2:
+            self._open = not self._open
+        if self._open:
+            if self._size <= BULK_MAX_RECORD_CHARS:
+                return None                  # comillas abiertas: falta el resto del campo
+            self._drop()
+            return self._start, {"__error__": f"comillas sin cerrar en más de {BULK_MAX_RECORD_CHARS} caracteres"}
+        text = "".join(self._pending)
+        self._drop()
+        if not text.strip():
+            return None
+        values = next(csv.reader([text]))
+        if self.header is None:
+            self.header = [h.strip() for h in values]
+            return None
+        return self._start, dict(zip(self.header, values))
+
+    def _drop(self) -> None:
+        self._pending = []
+        self._size = 0
+        self._open = False
+
+    def finish(self) -> Optional[Record]:
+        """Fin de la entrada: lo que quedó con comillas abiertas se rechaza, no se pierde."""
+        if not self._pending:
+            return None
+        self._drop()
+        return self._start, {"__error__": "comillas sin cerrar al final del archivo"}
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Record]:
+    parser = RecordParser(fmt)
+    for line in lines:
+        rec = parser.feed(line)
+        if rec is not None:
+            yield rec
+    rec = parser.finish()
+    if rec is not None:
+        yield rec
+
+async def aiter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Bytes en trozos (request.stream()) → líneas de texto, sin acumular el cuerpo."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    async for chunk in chunks:
+        buf += decoder.decode(chunk)
+        *lines, buf = buf.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf
+
+async def aiter_records(lines: AsyncIterable[str], fmt: str) -> AsyncIterator[Record]:
+    parser = RecordParser(fmt)
+    async for line in lines:
+        rec = parser.feed(line)
+        if rec is not None:
+            yield rec
+    rec = parser.finish()
+    if rec is not None:
+        yield rec
+
+# ── Validación ────────────────────────────────────────────────────────────────
+def _parse_timestamp(value: Any) -> Optional[dt.datetime]:
+    if value in (None, ""):
+        return None
+    s = str(value).strip()
+    if s.endswith("Z"):
+        s = s[:-1]
+    ts = dt.datetime.fromisoformat(s)
+    return ts.replace(tzinfo=None) if ts.tzinfo is None else ts.astimezone().replace(tzinfo=None)
+
+class RowValidator:
+    """Aplica las reglas de `model` (IncidentCreate) y produce los parámetros del INSERT."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+
+    def __call__(self, raw: Dict[str, Any]) -> Tuple[Any, ...]:
+        if "__error__" in raw:
+            raise ValueError(raw["__error__"])
+        data: Dict[str, Any] = {}
+        for k, v in raw.items():
+            field = FIELD_ALIASES.get(str(k).strip().lower())
+            if field and v not in (None, ""):
+                data[field] = v.strip() if isinstance(v, str) else v
+        ts = _parse_timestamp(data.pop("timestamp", None))
+        try:
+            item = self.model(**data)
+        except ValidationError as e:
+            errs = "; ".join(f"{'.'.join(map(str, x['loc']))}: {x['msg']}" for x in e.errors())
+            raise ValueError(errs)
+        return (
+            item.title, item.description or "", normalize_severity(item.severity), item.type,
+            float(item.lat), float(item.lon), ts,
+        )
+
+# ── Informe ───────────────────────────────────────────────────────────────────
+class ImportReport:
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.accepted = 0
+        self.rejected = 0
+        self.rejected_rows: List[Dict[str, Any]] = []
+        self.batches: List[Dict[str, Any]] = []
+        self.min_ts: Optional[dt.datetime] = None
+        self.max_ts: Optional[dt.datetime] = None
+        self.aborted: Optional[str] = None   # la BD dejó de responder: el resto no se leyó
+        self._t0 = time.perf_counter()
+
+    def reject(self, line: int, error: str) -> None:
+        self.rejected += 1
+        if len(self.rejected_rows) < BULK_MAX_REJECTED:
+            self.rejected_rows.append({"line": line, "error": error})
+
+    def batch(self, rows: int, rejected: int, seconds: float, error: Optional[str] = None) -> Dict[str, Any]:
+        b = {
+            "batch": len(self.batches) + 1,
+            "rows": rows,
+            "rejected": rejected,
+            "seconds": round(seconds, 4),
+            "rows_per_s": round(rows / seconds, 1) if seconds > 0 else None,
+        }
+        if error:
+            b["error"] = error
+        self.batches.append(b)
+        self.accepted += rows
+        return b
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._t0
+        return {
+            "dry_run": self.dry_run,
+            "aborted": self.aborted,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "seconds": round(elapsed, 3),
+            "rows_per_s": round(self.accepted / elapsed, 1) if elapsed > 0 else None,
+            "min_timestamp": self.min_ts.isoformat() if self.min_ts else None,
+            "max_timestamp": self.max_ts.isoformat() if self.max_ts else None,
+            "batches": self.batches,
+            "rejected_rows": self.rejected_rows,
+        }
+
+class _Batcher:
+    """Acumula filas válidas y entrega lotes de batch_size."""
+
+    def __init__(self, validate: RowValidator, report: ImportReport, batch_size: int):
+        self.validate = validate
+        self.report = report
+        self.batch_size = max(1, batch_size)
+        self.rows: List[Tuple[Any, ...]] = []
+        self.lines: List[int] = []
+        self.rejected_in_batch = 0
+
+    def add(self, rec: Record) -> bool:
+        """True cuando el lote está lleno."""
+        line, raw = rec
+        try:
+            params = self.validate(raw)
+        except ValueError as e:
+            self.report.reject(line, str(e))
+            self.rejected_in_batch += 1
+            return False
+        ts = params[-1]
+        if ts is not None:
+            r = self.report
+            r.min_ts = ts if r.min_ts is None or ts < r.min_ts else r.min_ts
+            r.max_ts = ts if r.max_ts is None or ts > r.max_ts else r.max_ts
+        self.rows.append(params)
+        self.lines.append(line)
+        return len(self.rows) >= self.batch_size
+
+    def take(self) -> Tuple[List[Tuple[Any, ...]], List[int], int]:
+        rows, lines, rej = self.rows, self.lines, self.rejected_in_batch
+        self.rows, self.lines, self.rejected_in_batch = [], [], 0
+        return rows, lines, rej
+
+    def failed(self, lines: List[int], err: Exception) -> str:
+        """El INSERT del lote falló: sus filas quedan rechazadas con el error de la BD."""
+        error = f"error de BD: {err}"
+        for line in lines:
+            self.report.reject(line, error)
+        if _unavailable(err):
+            self.report.aborted = error   # los lotes siguientes fallarían igual
+        return error
+
+def _unavailable(err: Exception) -> bool:
+    from breakers import BreakerOpen
+    from db import is_unavailable
+    return isinstance(err, BreakerOpen) or is_unavailable(err)
+
+# ── Importadores ──────────────────────────────────────────────────────────────
+def import_records(records: Iterable[Record], model: Type[BaseModel], batch_size: int = BULK_BATCH_SIZE,
+                   insert: Optional[Callable[[str, List[Tuple[Any, ...]]], Any]] = None,
+                   dry_run: bool = False,
+                   on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   on_rows: Optional[Callable[[List[Tuple[Any, ...]]], Any]] = None,
+                   tag: Optional[Callable[[List[Tuple[Any, ...]]], List[Tuple[Any, ...]]]] = None) -> ImportReport:
+    """
+    Versión síncrona (CLI). `insert` por defecto: db.executemany; con
+    rollups.STATS.insert_params_sync el lote se suma a los resúmenes en la misma transacción.
+    `on_rows` recibe cada lote ya insertado.
+    `tag` agrega (departamento, municipio[, fuente]) a cada fila; el INSERT sale de INSERT_BY_WIDTH.
+    Si el INSERT de un lote falla, sus filas quedan rechazadas con el error de la BD
+    y se sigue con el siguiente; si la BD no está disponible se corta (`aborted`)
+    y se devuelve el informe parcial.
+    """
+    if insert is None and not dry_run:
+        from db import executemany as insert
+    report = ImportReport(dry_run)
+    batcher = _Batcher(RowValidator(model), report, batch_size)
+
+    def flush() -> None:
+        rows, lines, rej = batcher.take()
+        if not rows and not rej:
+            return
+        t0 = time.perf_counter()
+        error = None
+        if rows and not dry_run:
+            try:
+                if tag:
+                    rows = tag(rows)
+                insert(INSERT_BY_WIDTH[len(rows[0])], rows)
+            except Exception as e:
+                error = batcher.failed(lines, e)
+                rows, rej = [], rej + len(lines)
+            else:
+                if on_rows:
+                    try:
+                        on_rows(rows)
+                    except Exception as e:
+                        error = f"on_rows: {e}"   # las filas ya quedaron guardadas
+        b = report.batch(len(rows), rej, time.perf_counter() - t0, error)
+        if on_batch:
+            on_batch(b)
+
+    for rec in records:
+        if batcher.add(rec):
+            flush()
+            if report.aborted:
+                return report
+    flush()
+    return report
+
+async def aimport_records(records: AsyncIterable[Record], model: Type[BaseModel],
+                          batch_size: int = BULK_BATCH_SIZE, dry_run: bool = False,
+                          insert: Optional[Callable[[str, List[Tuple[Any, ...]]], Awaitable[Any]]] = None,
+                          on_rows: Optional[Callable[[List[Tuple[Any, ...]]], Awaitable[Any]]] = None,
+                          tag: Optional[Callable[[List[Tuple[Any, ...]]], List[Tuple[Any, ...]]]] = None) -> ImportReport:
+    """
+    Versión async (endpoint): cada lote se inserta en el executor de BD
+    (`insert` por defecto: aexecutemany; rollups.STATS.insert_params para los resúmenes).
+    `on_rows` se espera tras cada lote insertado. `tag`: como en import_records.
+    """
+    if insert is None:
+        from db_async import aexecutemany as insert
+    report = ImportReport(dry_run)
+    batcher = _Batcher(RowValidator(model), report, batch_size)
+
+    async def flush() -> None:
+        rows, lines, rej = batcher.take()
+        if not rows and not rej:
+            return
+        t0 = time.perf_counter()
+        error = None
+        if rows and not dry_run:
+            try:
+                if tag:
+                    rows = tag(rows)
+                await insert(INSERT_BY_WIDTH[len(rows[0])], rows)
+            except Exception as e:
+                error = batcher.failed(lines, e)
+                rows, rej = [], rej + len(lines)
+            else:
+                if on_rows:
+                    try:
+                        await on_rows(rows)
+                    except Exception as e:
+                        error = f"on_rows: {e}"   # las filas ya quedaron guardadas
+        report.batch(len(rows), rej, time.perf_counter() - t0, error)
+
+    async for rec in records:
+        if batcher.add(rec):
+            await flush()
+            if report.aborted:
+                return report
+    await flush()
+    return report
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Importa incidentes históricos (CSV/NDJSON) a Incidentes.")
+    ap.add_argument("path", help="archivo .csv / .ndjson, o - para stdin")
+    ap.add_argument("--format", choices=["csv", "ndjson"], default=None, help="por defecto, según la extensión")
+    ap.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    ap.add_argument("--dry-run", action="store_true", help="sólo valida; no inserta")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    from app import IncidentCreate
+    from rollups import STATS, STATS_ENABLED
+    from regions import REGIONS, REGIONS_ENABLED
+    from migrations import REGION_SOURCE_VERSION, REGIONS_VERSION, current_version
+
+    def on_batch(b: Dict[str, Any]) -> None:
+        print(f"[lote {b['batch']}] {b['rows']} filas, {b['rejected']} rechazadas, "
+              f"{b['seconds']}s ({b['rows_per_s'] or '-'} filas/s)" + (f" — {b['error']}" if "error" in b else ""))
+
+    # departamento/municipio al insertar, si la BD ya tiene las columnas
+    tag = None
+    version = current_version() if REGIONS_ENABLED and not args.dry_run else 0
+    if version >= REGIONS_VERSION:
+        tag = REGIONS.tag_params_source if version >= REGION_SOURCE_VERSION else REGIONS.tag_params
+
+    f = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    try:
+        report = import_records(iter_records(f, fmt), IncidentCreate, args.batch_size,
+                                insert=STATS.insert_params_sync if STATS_ENABLED else None,
+                                dry_run=args.dry_run, on_batch=on_batch, tag=tag)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    out = report.to_dict()
+    print(f"Total: {out['accepted']} insertadas, {out['rejected']} rechazadas en {out['seconds']}s "
+          f"({out['rows_per_s']} filas/s)")
+    if out["aborted"]:
+        print(f"Importación interrumpida: {out['aborted']}")
+    for r in out["rejected_rows"][:20]:
+        print(f"  línea {r['line']}: {r['error']}")
+    return 0 if out["rejected"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
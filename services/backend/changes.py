@@ -0,0 +1,172 @@
+import os
+import asyncio
+import hashlib
+import datetime as dt
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import db
+from migrations import SCHEMA
+from serializers import INCIDENT_SELECT
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+CHANGES_ENABLED  = os.getenv("CHANGES_ENABLED", "1") != "0"
+CHANGES_POLL     = float(os.getenv("CHANGES_POLL", "1"))   # s entre lecturas del token (altas de otros workers)
+CHANGES_FEED_MAX = int(os.getenv("CHANGES_FEED_MAX", "5000"))  # filas cambiadas por lectura; más = recarga completa
+
+# ── SQL por backend ───────────────────────────────────────────────────────────
+# SQL Server: Cambio es ROWVERSION (binary(8), orden big-endian = orden de BIGINT).
+# MIN_ACTIVE_ROWVERSION() - 1 es el mayor valor sin transacciones abiertas por
+# debajo: un cliente nunca se salta una fila que aún no se había confirmado.
+if db.DB_BACKEND.startswith("sqlite:"):
+    TOKEN_SQL   = "SELECT COALESCE(MAX(Cambio), 0) FROM Incidentes"
+    TOKEN_COL   = "Cambio"
+    TOKEN_PARAM = "?"
+else:
+    TOKEN_SQL   = "SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1"
+    TOKEN_COL   = "CAST(Cambio AS BIGINT)"
+    TOKEN_PARAM = "CAST(? AS BINARY(8))"
+
+def delta_where() -> str:
+    """Filas cambiadas en (desde, hasta]; parámetros: token del cliente y token actual."""
+    return f"Cambio > {TOKEN_PARAM} AND Cambio <= {TOKEN_PARAM}"
+
+# filas de la ventana reciente cambiadas en (desde, hasta], para poner al día las copias en memoria
+FEED_SQL = f"""
+  SELECT TOP (?) {INCIDENT_SELECT}
+  FROM Incidentes
+  WHERE {delta_where()} AND Fecha >= ?
+"""
+
+# oyente(filas, token): filas cambiadas hasta `token`, o None si no se pueden
+# entregar (primer token del worker o demasiados cambios): hay que recargar
+Listener = Callable[[Optional[List[Sequence[Any]]], int], None]
+
+# ── ETag ──────────────────────────────────────────────────────────────────────
+def etag(token: int, *parts: Any) -> str:
+    """ETag débil: token de cambio + huella de los parámetros de la consulta."""
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=8).hexdigest()
+    return f'W/"{token}-{digest}"'
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Comparación débil de If-None-Match (lista separada por comas o *)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        c = candidate.strip()
+        if (c[2:] if c.startswith("W/") else c) == bare:
+            return True
+    return False
+
+# ── Token de cambio actual ────────────────────────────────────────────────────
+class ChangeClock:
+    """
+    Último token de cambio confirmado en Incidentes, leído cada CHANGES_POLL s
+    (una consulta trivial por worker, no por petición). Con él se arman los
+    ETag: un viewport sin cambios responde 304 sin tocar la BD. Tras un alta
+    propia se relee al momento (el cliente que escribió ve su cambio).
+
+    Cuando el token avanza, las filas cambiadas (de cualquier worker) se
+    entregan a los oyentes (índice espacial, caché de teselas) para que sus
+    copias en memoria queden al día con ese token; `synced` es hasta dónde
+    se entregaron.
+    """
+
+    def __init__(self, interval: float = CHANGES_POLL, feed_max: int = CHANGES_FEED_MAX):
+        self.interval = interval
+        self.feed_max = feed_max
+        self.token: Optional[int] = None
+        self.synced: Optional[int] = None
+        self._listeners: List[Listener] = []
+        self._feed_days = 0
+        self._feed_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.polls = 0
+        self.errors = 0
+        self.delivered = 0
+        self.resets = 0
+        self.listener_errors = 0
+
+    @property
+    def available(self) -> bool:
+        return CHANGES_ENABLED and SCHEMA.changes and self.token is not None
+
+    async def poll(self) -> Optional[int]:
+        from db_async import ascalar
+        if not SCHEMA.changes:
+            return None
+        self.polls += 1
+        try:
+            value = await ascalar(TOKEN_SQL)
+        except Exception:
+            self.errors += 1
+            raise
+        token = int(value or 0)
+        # nunca retrocede (MIN_ACTIVE_ROWVERSION baja mientras hay transacciones abiertas)
+        if self.token is None or token > self.token:
+            self.token = token
+        if self._listeners:
+            await self._deliver()
+        return self.token
+
+    def listen(self, fn: Listener, window_days: int) -> None:
+        """Registra un oyente; sólo se le entregan filas con Fecha en los últimos `window_days` días."""
+        self._listeners.append(fn)
+        self._feed_days = max(self._feed_days, window_days)
+
+    async def _deliver(self) -> None:
+        from db_async import aquery_rows
+        async with self._feed_lock:   # el bucle y el poll tras un alta propia no entregan dos veces lo mismo
+            old, new = self.synced, self.token
+            if new is None or (old is not None and new <= old):
+                return
+            rows: Optional[List[Sequence[Any]]] = None
+            if old is not None:
+                since = dt.datetime.now() - dt.timedelta(days=self._feed_days)
+                rows = await aquery_rows(FEED_SQL, (self.feed_max + 1, old, new, since))
+                if len(rows) > self.feed_max:
+                    rows = None
+            if rows is None:
+                self.resets += 1
+            else:
+                self.delivered += len(rows)
+            for fn in self._listeners:
+                try:
+                    fn(rows, new)
+                except Exception:
+                    self.listener_errors += 1
+                    if rows is not None:
+                        fn(None, new)   # no pudo aplicar el delta: que recargue
+            self.synced = new
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if CHANGES_ENABLED and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": CHANGES_ENABLED, "available": self.available, "token": self.token,
+                "synced": self.synced, "polls": self.polls, "errors": self.errors,
+                "delivered": self.delivered, "resets": self.resets, "listener_errors": self.listener_errors}
+
+CHANGES = ChangeClock()
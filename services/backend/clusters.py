@@ -0,0 +1,475 @@
+import os
+import math
+import time
+import asyncio
+import datetime as dt
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+import db
+from db_async import aexecute, aexecutemany, aquery_rows, ascalar, astream
+from serializers import ID, TIPO, LAT, LON, FECHA
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+CLUSTER_ENABLED      = os.getenv("CLUSTER_ENABLED", "1") != "0"
+CLUSTER_RADIUS_M     = float(os.getenv("CLUSTER_RADIUS_M", "300"))     # reportes del mismo evento: a ≤ N metros…
+CLUSTER_WINDOW_MIN   = float(os.getenv("CLUSTER_WINDOW_MIN", "120"))   # …y ≤ N minutos entre sí
+CLUSTER_REF_LAT      = float(os.getenv("CLUSTER_REF_LAT", "15.5"))     # |lat| máxima esperada (dimensiona las celdas)
+CLUSTER_MEMBERS_DAYS = int(os.getenv("CLUSTER_MEMBERS_DAYS", os.getenv("SPATIAL_INDEX_WINDOW_DAYS", "30")))
+CLUSTER_BATCH_SIZE   = int(os.getenv("CLUSTER_BATCH_SIZE", "5000"))    # filas por lote al escribir/leer
+CLUSTER_PAIR_CHUNK   = int(os.getenv("CLUSTER_PAIR_CHUNK", "200000"))  # puntos por bloque al generar pares
+CLUSTER_REFRESH      = float(os.getenv("CLUSTER_REFRESH", "60"))       # s: relee pertenencias (reagrupamientos de otros workers)
+
+EARTH_RADIUS_M = 6371008.8
+M_PER_DEG = 111_320.0
+
+# Sólo se guardan los reportes que NO son raíz de su cluster: un incidente sin
+# fila aquí es su propio representante (ClusterId = Id). La tabla queda pequeña
+# y Incidentes no cambia.
+SCHEMA_MSSQL = """
+IF OBJECT_ID('dbo.IncidenteClusters', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.IncidenteClusters (
+        IncidenteId INT NOT NULL PRIMARY KEY,
+        ClusterId   INT NOT NULL
+    );
+    CREATE INDEX IX_IncidenteClusters_ClusterId ON dbo.IncidenteClusters (ClusterId);
+END
+"""
+
+# Filtros SQL para GET /incidents?collapse=1 (un representante por cluster)
+COLLAPSE_WHERE = " AND NOT EXISTS (SELECT 1 FROM IncidenteClusters m WHERE m.IncidenteId = Incidentes.Id) "
+REPORTS_SELECT = "(SELECT COUNT(*) FROM IncidenteClusters c WHERE c.ClusterId = Incidentes.Id) + 1 AS Reportes"
+
+def _ts(value: Any) -> float:
+    if isinstance(value, dt.datetime):
+        return value.timestamp()
+    if isinstance(value, dt.date):
+        return dt.datetime(value.year, value.month, value.day).timestamp()
+    return time.time()
+
+def _tipo(value: Any) -> str:
+    return str(value or "general").strip().lower()
+
+def cell_size_deg(radius_m: float, ref_lat: float = CLUSTER_REF_LAT) -> float:
+    """Lado de celda (grados) ≥ radio en lat y en lon hasta |lat| = ref_lat: basta mirar las 3×3 vecinas."""
+    return radius_m / (M_PER_DEG * math.cos(math.radians(min(abs(ref_lat), 85.0))))
+
+def haversine_m(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> Any:
+    """Distancia en metros; acepta escalares o arrays NumPy."""
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dlat, dlon = p2 - p1, np.radians(lon2) - np.radians(lon1)
+    a = np.sin(dlat / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+def _haversine_scalar(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+# ── Lote vectorizado sobre la historia ────────────────────────────────────────
+_OFF = 1 << 20   # desplazamiento de índices de celda (caben ±1M celdas)
+
+def cluster_roots(tipo: np.ndarray, lat: np.ndarray, lon: np.ndarray, ts: np.ndarray,
+                  radius_m: float = CLUSTER_RADIUS_M, window_s: float = CLUSTER_WINDOW_MIN * 60,
+                  cell_deg: Optional[float] = None, chunk: int = CLUSTER_PAIR_CHUNK) -> np.ndarray:
+    """
+    Para cada punto, la posición de la raíz de su cluster (su reporte más antiguo).
+    Dos reportes se enlazan si tienen el mismo tipo, están a ≤ radius_m y a ≤ window_s;
+    los clusters son las componentes conexas de esos enlaces.
+
+    Vecinos por rejilla: se ordena por (tipo, celda, tiempo); para cada una de las
+    9 celdas vecinas, dos searchsorted dan el rango de reportes anteriores dentro de
+    la ventana. Los pares candidatos se filtran por distancia y se unen por
+    propagación de etiquetas (mínimo + salto de punteros), todo en NumPy.
+    """
+    n = len(lat)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    cell_deg = cell_deg or cell_size_deg(radius_m)
+    tipo = np.asarray(tipo, dtype=np.int64)
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    ts = np.asarray(ts, dtype=np.float64)
+
+    # rango temporal (desempate por posición): la etiqueta mínima es el reporte más antiguo
+    by_time = np.lexsort((np.arange(n), ts))
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_time] = np.arange(n)
+
+    cx = np.floor(lat / cell_deg).astype(np.int64) + _OFF
+    cy = np.floor(lon / cell_deg).astype(np.int64) + _OFF
+    key = (tipo << 42) | (cx << 21) | cy
+    order = np.lexsort((rank, key))
+    K, R, T = key[order], rank[order], ts[order]
+    LA, LO = lat[order], lon[order]
+
+    groups = np.unique(K)
+    g = np.searchsorted(groups, K)
+    t0 = float(T.min())
+    span = float(T.max() - t0) + window_s + 1.0
+    V = g * span + (T - t0)      # creciente: grupo y, dentro del grupo, tiempo
+
+    ea: List[np.ndarray] = []
+    eb: List[np.ndarray] = []
+    for start in range(0, n, chunk):
+        sl = slice(start, min(n, start + chunk))
+        Ks, Ts = K[sl], T[sl]
+        pos = np.arange(sl.start, sl.stop)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                tk = Ks + (dx << 21) + dy
+                gi = np.minimum(np.searchsorted(groups, tk), len(groups) - 1)
+                ok = groups[gi] == tk
+                if not ok.any():
+                    continue
+                a_pos, gi, ta = pos[ok], gi[ok], Ts[ok]
+                base = gi * span + (ta - t0)
+                lo = np.searchsorted(V, base - window_s, "left")
+                hi = np.searchsorted(V, base, "right")
+                cnt = hi - lo
+                total = int(cnt.sum())
+                if total == 0:
+                    continue
+                a = np.repeat(a_pos, cnt)
+                b = np.repeat(lo, cnt) + (np.arange(total) - np.repeat(np.cumsum(cnt) - cnt, cnt))
+                # cada par una sola vez, desde el reporte más reciente
+                keep = R[b] < R[a]
+                a, b = a[keep], b[keep]
+                keep = haversine_m(LA[a], LO[a], LA[b], LO[b]) <= radius_m
+                if keep.any():
+                    ea.append(R[a[keep]])
+                    eb.append(R[b[keep]])
+
+    label = np.arange(n, dtype=np.int64)   # indexado por rango temporal
+    if ea:
+        a = np.concatenate(ea)
+        b = np.concatenate(eb)
+        while True:
+            m = np.minimum(label[a], label[b])
+            new = label.copy()
+            np.minimum.at(new, a, m)
+            np.minimum.at(new, b, m)
+            new = new[new]
+            if np.array_equal(new, label):
+                break
+            label = new
+    return by_time[label[rank]]
+
+# ── Motor incremental ─────────────────────────────────────────────────────────
+class _Recent:
+    __slots__ = ("id", "ts", "lat", "lon", "cluster")
+
+    def __init__(self, id_: Any, ts: float, lat: float, lon: float, cluster: Any):
+        self.id = id_
+        self.ts = ts
+        self.lat = lat
+        self.lon = lon
+        self.cluster = cluster
+
+class ClusterEngine:
+    """
+    Agrupación de reportes duplicados por distancia, ventana de tiempo y Tipo.
+    - Al insertar (attach): rejilla en memoria con los reportes de la última
+      ventana; el nuevo se une al cluster de su vecino más cercano o abre uno.
+    - En lote (rebuild): cluster_roots() sobre toda la historia; reescribe sólo
+      las asignaciones que cambiaron.
+    Mantiene además, para los últimos CLUSTER_MEMBERS_DAYS, qué incidentes no son
+    representantes (`members`) y cuántos reportes tiene cada cluster (`sizes`):
+    con eso /incidents?collapse=1 puede responder desde el índice espacial.
+    Las altas de otros workers llegan por CHANGES (on_changes, con su
+    pertenencia leída de IncidenteClusters) y cada CLUSTER_REFRESH s se relee
+    todo: un reagrupamiento hecho en otro worker no deja copias divergentes.
+    """
+
+    def __init__(self, radius_m: float = CLUSTER_RADIUS_M, window_min: float = CLUSTER_WINDOW_MIN,
+                 members_days: int = CLUSTER_MEMBERS_DAYS):
+        self.radius_m = radius_m
+        self.window_s = window_min * 60
+        self.members_days = members_days
+        self.cell_deg = cell_size_deg(radius_m)
+        self._reset()
+        self.loaded_at: Optional[float] = None
+        self._loading = False
+        self._rebuilding = False
+        self._pending: List[Tuple[_Recent, str]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.attached = 0
+        self.opened = 0
+        self.synced = 0
+        self.last_rebuild: Optional[Dict[str, Any]] = None
+
+    def _reset(self) -> None:
+        self._cells: Dict[Tuple[str, int, int], List[_Recent]] = {}
+        self._recent: Deque[Tuple[_Recent, Tuple[str, int, int]]] = deque()
+        self._ids: Set[Any] = set()           # Ids en la rejilla reciente
+        self.members: Dict[Any, Any] = {}     # Id no representante → ClusterId
+        self.sizes: Dict[Any, int] = {}       # ClusterId → reportes (sólo clusters con > 1)
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None and not self._loading
+
+    # ---- rejilla ----
+    def _key(self, tipo: str, lat: float, lon: float) -> Tuple[str, int, int]:
+        return (tipo, math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _add(self, e: _Recent, tipo: str) -> None:
+        k = self._key(tipo, e.lat, e.lon)
+        self._cells.setdefault(k, []).append(e)
+        self._recent.append((e, k))
+        self._ids.add(e.id)
+
+    def _prune(self, now_ts: float) -> None:
+        limit = now_ts - self.window_s
+        while self._recent and self._recent[0][0].ts < limit:
+            e, k = self._recent.popleft()
+            self._ids.discard(e.id)
+            bucket = self._cells.get(k)
+            if bucket:
+                try:
+                    bucket.remove(e)
+                except ValueError:
+                    pass
+                if not bucket:
+                    del self._cells[k]
+
+    def _nearest(self, tipo: str, lat: float, lon: float, ts: float) -> Optional[_Recent]:
+        _, ci, cj = self._key(tipo, lat, lon)
+        best, best_d = None, self.radius_m
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for e in self._cells.get((tipo, ci + di, cj + dj), ()):
+                    if abs(ts - e.ts) > self.window_s:
+                        continue
+                    d = _haversine_scalar(lat, lon, e.lat, e.lon)
+                    if d <= best_d:
+                        best, best_d = e, d
+        return best
+
+    def _join(self, id_: Any, cluster: Any) -> None:
+        self.members[id_] = cluster
+        self.sizes[cluster] = self.sizes.get(cluster, 1) + 1
+
+    def assign(self, row: Sequence[Any]) -> Any:
+        """ClusterId para la fila (su propio Id si abre un cluster nuevo). Sólo memoria."""
+        tipo = _tipo(row[TIPO])
+        lat, lon, ts = float(row[LAT]), float(row[LON]), _ts(row[FECHA])
+        self._prune(ts)
+        near = self._nearest(tipo, lat, lon, ts)
+        cluster = near.cluster if near is not None else row[ID]
+        e = _Recent(row[ID], ts, lat, lon, cluster)
+        self._add(e, tipo)
+        if near is not None:
+            self._join(row[ID], cluster)
+            self.attached += 1
+        else:
+            self.opened += 1
+        if self._loading:
+            self._pending.append((e, tipo))
+        return cluster
+
+    def size(self, cluster: Any) -> int:
+        return self.sizes.get(cluster, 1)
+
+    async def attach(self, row: Sequence[Any]) -> Dict[str, Any]:
+        """Asigna la fila recién insertada y persiste la pertenencia si se unió a uno existente."""
+        cluster = self.assign(row)
+        if cluster != row[ID]:
+            await aexecute("INSERT INTO IncidenteClusters (IncidenteId, ClusterId) VALUES (?, ?)", (row[ID], cluster))
+        return {"id": str(cluster), "reports": self.size(cluster)}
+
+    # ---- altas de otros workers ----
+    def on_changes(self, rows: Optional[List[Sequence[Any]]], token: int) -> None:
+        """Oyente de CHANGES: reportes recientes que esta copia aún no tiene."""
+        if not self.ready:
+            return   # la carga en curso ya los lee de la BD
+        if rows is None:
+            task = asyncio.get_running_loop().create_task(self.load())
+        else:
+            limit = time.time() - self.window_s
+            new = [r for r in rows if r[ID] not in self._ids and r[LAT] is not None and r[LON] is not None
+                   and _ts(r[FECHA]) >= limit]
+            if not new:
+                return
+            task = asyncio.get_running_loop().create_task(self._sync(new))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _sync(self, rows: List[Sequence[Any]]) -> None:
+        """Agrega los reportes a la rejilla con la pertenencia que les dio su worker."""
+        found: Dict[Any, Any] = {}
+        for i in range(0, len(rows), 1000):   # SQL Server: ≤ 2100 parámetros por consulta
+            ids = [r[ID] for r in rows[i:i + 1000]]
+            found.update(await aquery_rows(
+                f"SELECT IncidenteId, ClusterId FROM IncidenteClusters WHERE IncidenteId IN ({', '.join('?' * len(ids))})",
+                ids,
+            ))
+        if self._loading:
+            return
+        for r in rows:
+            if r[ID] in self._ids:
+                continue   # llegó por attach mientras se leía
+            cluster = found.get(r[ID], r[ID])
+            self._add(_Recent(r[ID], _ts(r[FECHA]), float(r[LAT]), float(r[LON]), cluster), _tipo(r[TIPO]))
+            if cluster != r[ID] and r[ID] not in self.members:
+                self._join(r[ID], cluster)
+            self.synced += 1
+
+    # ---- carga desde la BD ----
+    async def ensure_schema(self) -> None:
+        # en SQLite (DB_BACKEND=sqlite:…) la tabla la crea db_sqlite.SCHEMA
+        if not db.DB_BACKEND.startswith("sqlite:"):
+            await aexecute(SCHEMA_MSSQL)
+
+    async def load(self) -> Dict[str, Any]:
+        """Relee la ventana reciente y las pertenencias de los últimos members_days."""
+        if self._loading:
+            return self.stats()
+        self._loading = True
+        self._pending = []
+        try:
+            now = dt.datetime.now()
+            recent = await aquery_rows(
+                "SELECT i.Id, i.Tipo, i.Lat, i.Lon, i.Fecha, COALESCE(c.ClusterId, i.Id) AS ClusterId "
+                "FROM Incidentes i LEFT JOIN IncidenteClusters c ON c.IncidenteId = i.Id "
+                "WHERE i.Fecha >= ? AND i.Lat IS NOT NULL AND i.Lon IS NOT NULL ORDER BY i.Fecha, i.Id",
+                (now - dt.timedelta(seconds=self.window_s),),
+            )
+            members = await aquery_rows(
+                "SELECT c.IncidenteId, c.ClusterId FROM IncidenteClusters c "
+                "JOIN Incidentes i ON i.Id = c.IncidenteId WHERE i.Fecha >= ?",
+                (now - dt.timedelta(days=self.members_days),),
+            )
+            pending = self._pending
+            self._reset()
+            for r in recent:
+                self._add(_Recent(r[0], _ts(r[4]), float(r[2]), float(r[3]), r[5]), _tipo(r[1]))
+            for inc_id, cluster in members:
+                self._join(inc_id, cluster)
+            # altas ocurridas durante la lectura
+            for e, tipo in pending:
+                if e.id not in self.members and e.cluster != e.id:
+                    self._join(e.id, e.cluster)
+                self._add(e, tipo)
+            self.loaded_at = time.monotonic()
+        finally:
+            self._loading = False
+            self._pending = []
+        return self.stats()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(CLUSTER_REFRESH)
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    async def start(self) -> None:
+        await self.ensure_schema()
+        await self.load()
+
+    def schedule_start(self) -> None:
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self.start())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._task = loop.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # ---- lote ----
+    async def rebuild(self) -> Dict[str, Any]:
+        """Reagrupa toda la historia con cluster_roots() y sincroniza IncidenteClusters."""
+        if self._rebuilding:
+            return self.stats()
+        self._rebuilding = True
+        t_start = time.perf_counter()
+        try:
+            ids: List[Any] = []
+            tipos: List[int] = []
+            lat: List[float] = []
+            lon: List[float] = []
+            ts: List[float] = []
+            codes: Dict[str, int] = {}
+            # corte: las altas posteriores las agrupa attach() y sus filas no se tocan
+            cut = await ascalar("SELECT MAX(Id) FROM Incidentes")
+            if cut is None:
+                cut = 0
+            async for r in astream("SELECT Id, Tipo, Lat, Lon, Fecha FROM Incidentes "
+                                   "WHERE Id <= ? AND Lat IS NOT NULL AND Lon IS NOT NULL", (cut,), CLUSTER_BATCH_SIZE):
+                ids.append(r[0])
+                tipos.append(codes.setdefault(_tipo(r[1]), len(codes)))
+                lat.append(float(r[2]))
+                lon.append(float(r[3]))
+                ts.append(_ts(r[4]))
+            t_read = time.perf_counter()
+
+            roots = await asyncio.to_thread(
+                cluster_roots, np.array(tipos), np.array(lat), np.array(lon), np.array(ts),
+                self.radius_m, self.window_s, self.cell_deg,
+            )
+            t_cluster = time.perf_counter()
+            n = len(ids)
+            desired = {ids[i]: ids[r] for i, r in enumerate(roots.tolist()) if r != i}
+            del ids, tipos, lat, lon, ts, roots
+
+            current = dict(await aquery_rows("SELECT IncidenteId, ClusterId FROM IncidenteClusters WHERE IncidenteId <= ?",
+                                             (cut,)))
+            stale = [(k,) for k, v in current.items() if desired.get(k) != v]
+            fresh = [(k, v) for k, v in desired.items() if current.get(k) != v]
+            for i in range(0, len(stale), CLUSTER_BATCH_SIZE):
+                await aexecutemany("DELETE FROM IncidenteClusters WHERE IncidenteId = ?", stale[i:i + CLUSTER_BATCH_SIZE])
+            for i in range(0, len(fresh), CLUSTER_BATCH_SIZE):
+                await aexecutemany("INSERT INTO IncidenteClusters (IncidenteId, ClusterId) VALUES (?, ?)",
+                                   fresh[i:i + CLUSTER_BATCH_SIZE])
+            t_write = time.perf_counter()
+            self.last_rebuild = {
+                "rows": n,
+                "cut": cut,
+                "members": len(desired),
+                "clusters": len(set(desired.values())),
+                "deleted": len(stale),
+                "inserted": len(fresh),
+                "read_s": round(t_read - t_start, 2),
+                "cluster_s": round(t_cluster - t_read, 2),
+                "write_s": round(t_write - t_cluster, 2),
+            }
+        finally:
+            self._rebuilding = False
+        await self.load()
+        return self.stats()
+
+    def schedule_rebuild(self) -> None:
+        if self._rebuilding:
+            return
+        task = asyncio.get_running_loop().create_task(self.rebuild())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": CLUSTER_ENABLED,
+            "ready": self.ready,
+            "radius_m": self.radius_m,
+            "window_min": self.window_s / 60,
+            "recent": len(self._recent),
+            "members": len(self.members),
+            "clusters": len(self.sizes),
+            "attached": self.attached,
+            "opened": self.opened,
+            "synced": self.synced,
+            "rebuilding": self._rebuilding,
+            "last_rebuild": self.last_rebuild,
+        }
+
+CLUSTERS = ClusterEngine()
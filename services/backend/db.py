@@ -1,7 +1,13 @@
 import os
 import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
 import pyodbc
-from typing import Iterable, List, Dict, Any, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple, Callable, Deque
+
+from metrics import METRICS, timed
 
 # Carga .env si existe (opcional)
 try:
@@ -19,6 +25,8 @@ ENCRYPT   = os.getenv("MSSQL_ENCRYPT", "yes")
 TRUST_CERT= os.getenv("MSSQL_TRUST_CERT", "yes")
 USERNAME  = os.getenv("MSSQL_USERNAME", "")                 # solo si TRUSTED=no
 PASSWORD  = os.getenv("MSSQL_PASSWORD", "")                 # solo si TRUSTED=no
+# mssql (por defecto) o sqlite:ruta.db (desarrollo / pruebas de carga, ver db_sqlite.py)
+DB_BACKEND = os.getenv("DB_BACKEND", "mssql")
 
 def _build_conn_str() -> str:
     """
@@ -42,10 +50,208 @@ def _build_conn_str() -> str:
 
 CONN_STR = _build_conn_str()
 
+# ── Pool de conexiones ────────────────────────────────────────────────────────
+POOL_MIN          = int(os.getenv("MSSQL_POOL_MIN", "1"))
+POOL_MAX          = int(os.getenv("MSSQL_POOL_MAX", "10"))
+POOL_TIMEOUT      = float(os.getenv("MSSQL_POOL_TIMEOUT", "10"))       # espera máx. por una conexión libre (s)
+POOL_IDLE_TIMEOUT = float(os.getenv("MSSQL_POOL_IDLE_TIMEOUT", "300")) # cierra conexiones ociosas (s)
+POOL_VALIDATE_AFTER = float(os.getenv("MSSQL_POOL_VALIDATE_AFTER", "30"))  # ping si estuvo ociosa más de N s
+
+class PoolTimeout(RuntimeError):
+    """No hubo conexión libre dentro de POOL_TIMEOUT."""
+
+class ConnectionPool:
+    """
+    Pool acotado y thread-safe de conexiones pyodbc.
+    - Mantiene entre min_size y max_size conexiones.
+    - Valida (SELECT 1) las conexiones que llevan tiempo ociosas antes de entregarlas.
+    - Expulsa conexiones ociosas por encima de min_size tras idle_timeout.
+    - Expone estadísticas (en uso, ociosas, tiempo de espera) para dimensionar por worker.
+    """
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 1, max_size: int = 10,
+                 timeout: float = 10.0, idle_timeout: float = 300.0, validate_after: float = 30.0):
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self._idle: Deque[Tuple[Any, float]] = deque()   # (conexión, último uso); LIFO
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        # estadísticas
+        self._checkouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # ---- ciclo de vida ----
+    def _size(self) -> int:
+        return len(self._idle) + self._in_use
+
+    def _open(self) -> Any:
+        conn = self._connect()
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _discard(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._discarded += 1
+
+    @staticmethod
+    def _is_alive(conn: Any) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self, now: float) -> List[Any]:
+        """Saca (con el lock tomado) las ociosas vencidas por encima de min_size."""
+        expired: List[Any] = []
+        # las más antiguas están a la izquierda
+        while self._idle and self._size() > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def acquire(self) -> Any:
+        """Entrega una conexión válida; bloquea hasta `timeout` si el pool está lleno."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            stamp = 0.0
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("El pool de conexiones está cerrado.")
+                expired = self._evict_idle(time.monotonic())
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"Sin conexiones libres tras {self.timeout:.1f}s (max={self.max_size}).")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, stamp = self._idle.pop()
+                else:
+                    create = True
+                self._in_use += 1
+            for old in expired:
+                self._discard(old)
+
+            if create:
+                try:
+                    conn = self._open()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif time.monotonic() - stamp > self.validate_after and not self._is_alive(conn):
+                # conexión rota: se descarta y se intenta con otra
+                self._discard(conn)
+                self._release_slot()
+                continue
+
+            elapsed = time.monotonic() - start
+            METRICS.stage("db.pool_wait", elapsed)
+            with self._cond:
+                self._checkouts += 1
+                if waited:
+                    self._waits += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+            return conn
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        """Devuelve la conexión al pool (o la descarta si quedó inservible)."""
+        if broken or self._closed:
+            self._discard(conn)
+            self._release_slot()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except pyodbc.Error as e:
+            # errores de comunicación invalidan la conexión; los de SQL no
+            broken = isinstance(e, (pyodbc.OperationalError, pyodbc.InterfaceError))
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def warmup(self) -> None:
+        """Abre conexiones hasta min_size (p.ej. al arrancar el worker)."""
+        while True:
+            with self._cond:
+                if self._closed or self._size() >= self.min_size:
+                    return
+                self._in_use += 1
+            try:
+                conn = self._open()
+            except Exception:
+                self._release_slot()
+                raise
+            self.release(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for c in idle:
+            self._discard(c)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "min": self.min_size,
+                "max": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(1000 * self._wait_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "wait_max_ms": round(1000 * self._wait_max, 3),
+            }
+
 # ── Core de conexión/reintentos ────────────────────────────────────────────────
-def get_connection(retries: int = 3, delay: float = 2.0, timeout: int = 5) -> pyodbc.Connection:
+@timed("db.connect")
+def get_connection(retries: int = 3, delay: float = 0.25, timeout: int = 5,
+                   max_delay: float = 4.0) -> pyodbc.Connection:
     """
-    Abre una conexión con reintentos. Autocommit=True para soportar
+    Abre una conexión con reintentos y backoff exponencial con jitter
+    (delay, 2·delay, 4·delay… hasta max_delay). Autocommit=True para soportar
     INSERT ... OUTPUT (lo usas en /incidents).
     """
     last_err: Optional[Exception] = None
@@ -56,63 +262,162 @@ def get_connection(retries: int = 3, delay: float = 2.0, timeout: int = 5) -> py
             print(f"[Intento {attempt}] Error conexión: {e}")
             last_err = e
             if attempt < retries:
-                time.sleep(delay)
+                backoff = min(max_delay, delay * (2 ** (attempt - 1)))
+                time.sleep(backoff * random.uniform(0.5, 1.0))
     raise last_err or RuntimeError("No se pudo conectar a SQL Server.")
 
+def _connect_factory() -> Callable[[], Any]:
+    if DB_BACKEND.startswith("sqlite:"):
+        from db_sqlite import connect as sqlite_connect
+        path = DB_BACKEND[len("sqlite:"):]
+        return lambda: sqlite_connect(path)
+    return get_connection
+
+def is_unavailable(err: BaseException) -> bool:
+    """Errores que hablan de la disponibilidad de la BD (no de la consulta): abren el circuito."""
+    return isinstance(err, (pyodbc.OperationalError, pyodbc.InterfaceError, PoolTimeout))
+
+def ping(timeout: int = 2) -> None:
+    """
+    Sondeo de salud: conexión nueva (fuera del pool), un solo intento y SELECT 1.
+    Lanza si la BD no responde; no pasa por los reintentos de get_connection.
+    """
+    if DB_BACKEND.startswith("sqlite:"):
+        conn = _connect_factory()()
+    else:
+        conn = pyodbc.connect(CONN_STR, timeout=timeout, autocommit=True)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+
+_POOL: Optional[ConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Pool del proceso (uno por worker de uvicorn), creado en el primer uso."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ConnectionPool(
+                    _connect_factory(),
+                    min_size=POOL_MIN,
+                    max_size=POOL_MAX,
+                    timeout=POOL_TIMEOUT,
+                    idle_timeout=POOL_IDLE_TIMEOUT,
+                    validate_after=POOL_VALIDATE_AFTER,
+                )
+    return _POOL
+
+def warmup_pool() -> None:
+    """Abre MSSQL_POOL_MIN conexiones; se llama en un hilo al arrancar el worker."""
+    get_pool().warmup()
+
+def pool_stats() -> Dict[str, Any]:
+    return get_pool().stats()
+
+def close_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+
 # ── Helpers de consulta ───────────────────────────────────────────────────────
+@timed("db.rows_to_dicts")
 def _rows_to_dicts(cursor: pyodbc.Cursor, rows: Iterable[Tuple]) -> List[Dict[str, Any]]:
     cols = [d[0] for d in cursor.description]
     return [dict(zip(cols, r)) for r in rows]
 
+@timed("db.query_one")
 def query_one(sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
     """
     Ejecuta una consulta y devuelve la primera fila como dict o None.
     """
-    conn = get_connection()
-    try:
+    with get_pool().connection() as conn:
         cur = conn.cursor()
-        cur.execute(sql, list(params))
-        row = cur.fetchone()
-        return _rows_to_dicts(cur, [row])[0] if row else None
-    finally:
-        conn.close()
+        try:
+            cur.execute(sql, list(params))
+            row = cur.fetchone()
+            return _rows_to_dicts(cur, [row])[0] if row else None
+        finally:
+            cur.close()
 
+@timed("db.query_all")
 def query_all(sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
     """
     Ejecuta una consulta y devuelve todas las filas como lista de dicts.
     """
-    conn = get_connection()
-    try:
+    with get_pool().connection() as conn:
         cur = conn.cursor()
-        cur.execute(sql, list(params))
-        return _rows_to_dicts(cur, cur.fetchall())
-    finally:
-        conn.close()
+        try:
+            cur.execute(sql, list(params))
+            return _rows_to_dicts(cur, cur.fetchall())
+        finally:
+            cur.close()
+
+@timed("db.query_rows")
+def query_rows(sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+    """
+    Como query_all pero devuelve las filas tal cual (tuplas pyodbc.Row), sin
+    construir un dict por fila. Para rutas calientes con columnas conocidas.
+    """
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, list(params))
+            return cur.fetchall()
+        finally:
+            cur.close()
 
+@timed("db.execute")
 def execute(sql: str, params: Iterable[Any] = ()) -> int:
     """
     Ejecuta un comando DML (INSERT/UPDATE/DELETE). Devuelve rowcount.
     """
-    conn = get_connection()
-    try:
+    with get_pool().connection() as conn:
         cur = conn.cursor()
-        cur.execute(sql, list(params))
-        return cur.rowcount
-    finally:
-        conn.close()
+        try:
+            cur.execute(sql, list(params))
+            return cur.rowcount
+        finally:
+            cur.close()
 
+@timed("db.executemany")
 def executemany(sql: str, seq_params: Iterable[Iterable[Any]]) -> int:
     """
     Ejecuta un mismo comando para muchos juegos de parámetros (bulk).
     """
-    conn = get_connection()
-    try:
+    with get_pool().connection() as conn:
         cur = conn.cursor()
-        cur.fast_executemany = True
-        cur.executemany(sql, [list(p) for p in seq_params])
-        return cur.rowcount
-    finally:
-        conn.close()
+        try:
+            cur.fast_executemany = True
+            cur.executemany(sql, [list(p) for p in seq_params])
+            return cur.rowcount
+        finally:
+            cur.close()
+
+def iter_batches(sql: str, params: Iterable[Any] = (), batch_size: int = 500) -> Iterator[Tuple[List[str], List[Tuple]]]:
+    """
+    Recorre el resultado por lotes con fetchmany (sin materializar fetchall).
+    La conexión queda tomada del pool hasta agotar o cerrar el generador.
+    """
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, list(params))
+            cols = [d[0] for d in cur.description]
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield cols, rows
+        finally:
+            cur.close()
 
 def scalar(sql: str, params: Iterable[Any] = ()) -> Any:
     """
@@ -131,5 +436,6 @@ if __name__ == "__main__":
         print("Conectado. @@VERSION:", (v.splitlines()[0] if isinstance(v, str) else v))
         db = scalar("SELECT DB_NAME() AS db")
         print("Base de datos:", db)
+        print("Pool:", pool_stats())
     except Exception as e:
         print("Fallo conexión:", e)
\ No newline at end of file
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import db
+from metrics import METRICS
+from breakers import BREAKERS
+
+T = TypeVar("T")
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+# Hilos dedicados a pyodbc (por defecto, tantos como conexiones tiene el pool)
+DB_ASYNC_WORKERS     = int(os.getenv("DB_ASYNC_WORKERS", str(db.POOL_MAX)))
+# Llamadas simultáneas admitidas; el resto espera en cola sin bloquear el loop
+DB_ASYNC_CONCURRENCY = int(os.getenv("DB_ASYNC_CONCURRENCY", str(DB_ASYNC_WORKERS)))
+
+class AsyncDB:
+    """
+    Capa async sobre los helpers síncronos de db.py.
+    Cada llamada corre en un executor acotado y dedicado (no el threadpool
+    por defecto de AnyIO/asyncio), así una BD lenta no le roba hilos a otras
+    tareas y el event loop nunca queda bloqueado por pyodbc ni por los
+    reintentos de get_connection.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int):
+        self.max_workers = max(1, max_workers)
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        # métricas
+        self._calls = 0
+        self._errors = 0
+        self._waiting = 0
+        self._running = 0
+        self._queue_total = 0.0
+        self._queue_max = 0.0
+        self._exec_total = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    async def run(self, fn: Callable[..., T], *args: Any, guarded: bool = True) -> T:
+        """
+        Ejecuta fn(*args) en el executor y mide el tiempo en cola y de ejecución.
+        Con el circuito "db" abierto lanza BreakerOpen sin encolar nada
+        (guarded=False para liberar recursos: cerrar cursores siempre debe correr).
+        """
+        breaker = BREAKERS.get("db")
+        if guarded:
+            breaker.acquire()
+        loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        started: List[float] = []
+
+        def _job() -> T:
+            started.append(time.monotonic())
+            return fn(*args)
+
+        self._waiting += 1
+        try:
+            async with self._get_semaphore():
+                self._running += 1
+                try:
+                    out = await loop.run_in_executor(self._get_executor(), _job)
+                except Exception as e:
+                    self._errors += 1
+                    # sólo los errores de conexión cuentan; un error de SQL no dice nada de la BD
+                    if guarded and db.is_unavailable(e):
+                        breaker.failure(e)
+                    elif guarded:
+                        breaker.success()
+                    raise
+                finally:
+                    self._running -= 1
+            if guarded:
+                breaker.success()
+            return out
+        except asyncio.CancelledError:
+            if guarded:
+                breaker.release()
+            raise
+        finally:
+            self._waiting -= 1
+            done = time.monotonic()
+            begin = started[0] if started else done
+            queued = begin - queued_at
+            self._calls += 1
+            self._queue_total += queued
+            self._queue_max = max(self._queue_max, queued)
+            self._exec_total += done - begin
+            METRICS.stage("db.queue", queued)
+
+    def stats(self) -> Dict[str, Any]:
+        n = self._calls
+        return {
+            "workers": self.max_workers,
+            "concurrency": self.max_concurrency,
+            "running": self._running,
+            "queued": max(0, self._waiting - self._running),
+            "calls": n,
+            "errors": self._errors,
+            "queue_avg_ms": round(1000 * self._queue_total / n, 3) if n else 0.0,
+            "queue_max_ms": round(1000 * self._queue_max, 3),
+            "exec_avg_ms": round(1000 * self._exec_total / n, 3) if n else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        self._sem = None
+
+_DB = AsyncDB(DB_ASYNC_WORKERS, DB_ASYNC_CONCURRENCY)
+
+# ── Helpers async (mismo contrato que db.py) ──────────────────────────────────
+async def aquery_one(sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
+    return await _DB.run(db.query_one, sql, tuple(params))
+
+async def aquery_all(sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+    return await _DB.run(db.query_all, sql, tuple(params))
+
+async def aquery_rows(sql: str, params: Iterable[Any] = ()) -> List[Tuple]:
+    return await _DB.run(db.query_rows, sql, tuple(params))
+
+async def aexecute(sql: str, params: Iterable[Any] = ()) -> int:
+    return await _DB.run(db.execute, sql, tuple(params))
+
+async def aexecutemany(sql: str, seq_params: Iterable[Iterable[Any]]) -> int:
+    return await _DB.run(db.executemany, sql, [list(p) for p in seq_params])
+
+async def ascalar(sql: str, params: Iterable[Any] = ()) -> Any:
+    return await _DB.run(db.scalar, sql, tuple(params))
+
+async def astream(sql: str, params: Iterable[Any] = (), batch_size: int = 500) -> AsyncIterator[Tuple]:
+    """
+    Itera filas (tuplas) a medida que llegan del cursor: cada lote se lee en el
+    executor, así la memoria queda acotada por batch_size.
+    """
+    gen = db.iter_batches(sql, tuple(params), batch_size)
+    fetch: Optional[asyncio.Future] = None
+    try:
+        while True:
+            fetch = asyncio.ensure_future(_DB.run(next, gen, None))
+            batch = await asyncio.shield(fetch)
+            fetch = None
+            if batch is None:
+                return
+            for r in batch[1]:
+                yield r
+    finally:
+        if fetch is not None:
+            # cancelado con un lote en vuelo: el hilo sigue dentro del generador y
+            # cerrarlo antes de que termine da "generator already executing"
+            try:
+                await asyncio.shield(fetch)
+            except (Exception, asyncio.CancelledError):
+                pass
+        await _DB.run(gen.close, guarded=False)
+
+async def arun(fn: Callable[..., T], *args: Any) -> T:
+    """Para trabajo de BD propio (cursores, transacciones) que no encaja en los helpers."""
+    return await _DB.run(fn, *args)
+
+def executor_stats() -> Dict[str, Any]:
+    return _DB.stats()
+
+def shutdown() -> None:
+    _DB.shutdown()
+    db.close_pool()
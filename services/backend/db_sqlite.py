@@ -0,0 +1,167 @@
+"""
+Backend SQLite compatible con db.py, para desarrollo y pruebas de carga sin SQL Server.
+
+Se activa con DB_BACKEND=sqlite:ruta/al/archivo.db. Las conexiones imitan la
+interfaz de pyodbc que usa db.py (cursor, execute, fetchmany, description,
+fast_executemany) y traducen el T-SQL que emite la aplicación:
+
+    SELECT TOP (?) ... / TOP n   →  ... LIMIT ?   (el parámetro se mueve al final)
+    INSERT ... OUTPUT INSERTED.c VALUES (...)  →  INSERT ... VALUES (...) RETURNING c
+    GETDATE()                    →  datetime('now', 'localtime')
+"""
+import re
+import sqlite3
+import datetime as dt
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Incidentes (
+    Id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    Titulo      TEXT,
+    Descripcion TEXT,
+    Severidad   TEXT,
+    Tipo        TEXT,
+    Lat         REAL,
+    Lon         REAL,
+    Fecha       TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS IX_Incidentes_Fecha_Id ON Incidentes (Fecha, Id);
+CREATE INDEX IF NOT EXISTS IX_Incidentes_Lat_Lon ON Incidentes (Lat, Lon);
+CREATE TABLE IF NOT EXISTS IncidenteClusters (
+    IncidenteId INTEGER PRIMARY KEY,
+    ClusterId   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_IncidenteClusters_ClusterId ON IncidenteClusters (ClusterId);
+CREATE TABLE IF NOT EXISTS ResumenHora (
+    Periodo      TIMESTAMP NOT NULL,
+    Severidad    TEXT      NOT NULL,
+    Tipo         TEXT      NOT NULL,
+    Departamento TEXT      NOT NULL,
+    Total        INTEGER   NOT NULL,
+    PRIMARY KEY (Periodo, Severidad, Tipo, Departamento)
+);
+CREATE TABLE IF NOT EXISTS ResumenDia (
+    Periodo      TIMESTAMP NOT NULL,
+    Severidad    TEXT      NOT NULL,
+    Tipo         TEXT      NOT NULL,
+    Departamento TEXT      NOT NULL,
+    Total        INTEGER   NOT NULL,
+    PRIMARY KEY (Periodo, Severidad, Tipo, Departamento)
+);
+CREATE TABLE IF NOT EXISTS ResumenHoraNueva (
+    Periodo      TIMESTAMP NOT NULL,
+    Severidad    TEXT      NOT NULL,
+    Tipo         TEXT      NOT NULL,
+    Departamento TEXT      NOT NULL,
+    Total        INTEGER   NOT NULL,
+    PRIMARY KEY (Periodo, Severidad, Tipo, Departamento)
+);
+CREATE TABLE IF NOT EXISTS ResumenDiaNueva (
+    Periodo      TIMESTAMP NOT NULL,
+    Severidad    TEXT      NOT NULL,
+    Tipo         TEXT      NOT NULL,
+    Departamento TEXT      NOT NULL,
+    Total        INTEGER   NOT NULL,
+    PRIMARY KEY (Periodo, Severidad, Tipo, Departamento)
+);
+CREATE TABLE IF NOT EXISTS ResumenEstado (
+    Id           INTEGER   PRIMARY KEY,
+    Version      INTEGER   NOT NULL,
+    MaxId        INTEGER,
+    Reconstruido TIMESTAMP,
+    Bloqueo      TIMESTAMP
+);
+INSERT OR IGNORE INTO ResumenEstado (Id, Version) VALUES (1, 0);
+"""
+
+sqlite3.register_adapter(dt.datetime, lambda v: v.isoformat(" "))
+sqlite3.register_adapter(dt.date, lambda v: v.isoformat())
+
+_TOP_PARAM = re.compile(r"\bTOP\s*\(\s*\?\s*\)\s*", re.I)
+_TOP_LIT   = re.compile(r"\bTOP\s*\(?\s*(\d+)\s*\)?\s*", re.I)
+_OUTPUT    = re.compile(r"\bOUTPUT\s+(.+?)\s+(VALUES\b.*?)\s*;?\s*$", re.I | re.S)
+
+@lru_cache(maxsize=512)
+def _translate(sql: str) -> Tuple[str, Optional[int]]:
+    """(sql SQLite, posición del parámetro TOP a mover al final o None)."""
+    s = sql.replace("GETDATE()", "datetime('now', 'localtime')")
+    top_pos: Optional[int] = None
+    m = _TOP_PARAM.search(s)
+    if m:
+        top_pos = s[:m.start()].count("?")
+        s = s[:m.start()] + s[m.end():]
+        s = s.rstrip().rstrip(";") + " LIMIT ?"
+    else:
+        m = _TOP_LIT.search(s)
+        if m:
+            s = s[:m.start()] + s[m.end():]
+            s = s.rstrip().rstrip(";") + f" LIMIT {m.group(1)}"
+    m = _OUTPUT.search(s)
+    if m:
+        cols = re.sub(r"\bINSERTED\.", "", m.group(1))
+        s = s[:m.start()] + m.group(2) + " RETURNING " + cols
+    return s, top_pos
+
+def translate(sql: str, params: Sequence[Any] = ()) -> Tuple[str, List[Any]]:
+    s, top_pos = _translate(sql)
+    p = list(params)
+    if top_pos is not None:
+        p.append(p.pop(top_pos))
+    return s, p
+
+class Cursor:
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+        self.fast_executemany = False
+
+    @property
+    def description(self) -> Any:
+        return self._cur.description
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> "Cursor":
+        self._cur.execute(*translate(sql, params))
+        return self
+
+    def executemany(self, sql: str, seq_params: Sequence[Sequence[Any]]) -> "Cursor":
+        s, top_pos = _translate(sql)
+        self._cur.executemany(s, (translate(sql, p)[1] for p in seq_params) if top_pos is not None else seq_params)
+        return self
+
+    def fetchone(self) -> Any:
+        return self._cur.fetchone()
+
+    def fetchall(self) -> List[Any]:
+        return self._cur.fetchall()
+
+    def fetchmany(self, size: int) -> List[Any]:
+        return self._cur.fetchmany(size)
+
+    def close(self) -> None:
+        self._cur.close()
+
+class Connection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def cursor(self) -> Cursor:
+        return Cursor(self._conn.cursor())
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+def connect(path: str, timeout: float = 5.0) -> Connection:
+    """Conexión en autocommit, WAL, usable desde los hilos del executor de BD."""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False,
+                           detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return Connection(conn)
@@ -0,0 +1,222 @@
+import os
+import re
+import csv
+import bisect
+import unicodedata
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from rapidfuzz import process as rf_process, fuzz as rf_fuzz
+except Exception:  # rapidfuzz es opcional: cae a difflib
+    rf_process = None
+    rf_fuzz = None
+    import difflib
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "1") != "0"
+# CSV propio (data/gazetteer_ni.csv) o volcado GeoNames de Nicaragua (NI.txt)
+GAZETTEER_PATH    = os.getenv("GAZETTEER_PATH", os.path.join(_HERE, "data", "gazetteer_ni.csv"))
+GAZETTEER_FUZZY_CUTOFF = float(os.getenv("GAZETTEER_FUZZY_CUTOFF", "86"))
+GAZETTEER_MIN_PREFIX   = int(os.getenv("GAZETTEER_MIN_PREFIX", "4"))
+
+# a igual nombre se prefiere la ciudad (municipio) antes que el departamento
+KIND_RANK = {"municipality": 0, "department": 1, "community": 2, "country": 3}
+
+_PREFIX_RE = re.compile(
+    r"^(ir a|llevar a|llevame a|vamos a|ubicame en|donde queda|ubicacion de|"
+    r"departamento de|municipio de|ciudad de|region autonoma de la|region autonoma)\s+"
+)
+_PUNCT_RE = re.compile(r"[^a-z0-9 ,]")
+
+def norm_key(text: str) -> str:
+    """Clave normalizada: sin acentos, minúsculas, sin signos ni prefijos de navegación."""
+    s = unicodedata.normalize("NFD", text or "").encode("ascii", "ignore").decode("ascii")
+    s = _PUNCT_RE.sub(" ", s.lower())
+    s = re.sub(r"\s+", " ", s).strip(" ,")
+    s = _PREFIX_RE.sub("", s)
+    s = re.sub(r"\s*,\s*", ", ", s)
+    return s.strip(" ,")
+
+class Place:
+    __slots__ = ("name", "kind", "department", "lat", "lon", "south", "north", "west", "east")
+
+    def __init__(self, name: str, kind: str, department: str, lat: float, lon: float,
+                 south: float, north: float, west: float, east: float):
+        self.name, self.kind, self.department = name, kind, department
+        self.lat, self.lon = lat, lon
+        self.south, self.north, self.west, self.east = south, north, west, east
+
+    def to_geocode(self) -> Dict[str, Any]:
+        """Mismo contrato que nominatim_geocode: {center, bbox}."""
+        return {
+            "center": {"lat": self.lat, "lon": self.lon},
+            "bbox": {"west": self.west, "south": self.south, "east": self.east, "north": self.north},
+        }
+
+# ── Carga de datos ────────────────────────────────────────────────────────────
+def _read_csv(path: str) -> Iterator[Tuple[Place, List[str]]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            aliases = [a for a in (r.get("aliases") or "").split("|") if a]
+            yield Place(
+                r["name"], r["kind"], r["department"], float(r["lat"]), float(r["lon"]),
+                float(r["south"]), float(r["north"]), float(r["west"]), float(r["east"]),
+            ), aliases
+
+_GEONAMES_KINDS = {"ADM1": "department", "ADM2": "municipality"}
+_GEONAMES_PAD = {"department": 0.3, "municipality": 0.08, "community": 0.02}
+
+def _read_geonames(path: str) -> Iterator[Tuple[Place, List[str]]]:
+    """Volcado GeoNames (TSV de 19 columnas). Sólo divisiones administrativas y poblados."""
+    rows = []
+    admin1: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            c = line.rstrip("\n").split("\t")
+            if len(c) < 11 or c[8] != "NI":
+                continue
+            if c[7] == "ADM1":
+                admin1[c[10]] = c[1]
+            if c[7] in _GEONAMES_KINDS or c[6] == "P":
+                rows.append(c)
+    for c in rows:
+        kind = _GEONAMES_KINDS.get(c[7], "community")
+        lat, lon = float(c[4]), float(c[5])
+        pad = _GEONAMES_PAD[kind]
+        aliases = [a for a in c[3].split(",") if a][:10] if c[3] else []
+        yield Place(
+            c[1], kind, admin1.get(c[10], ""), lat, lon,
+            lat - pad, lat + pad, lon - pad, lon + pad,
+        ), aliases
+
+# ── Motor ─────────────────────────────────────────────────────────────────────
+class Gazetteer:
+    """
+    Geocodificador local:
+    - índice exacto por clave normalizada (nombres y alias),
+    - búsqueda por prefijo sobre las claves ordenadas (bisect),
+    - coincidencia difusa (rapidfuzz) para errores de tipeo.
+    """
+
+    def __init__(self, entries: List[Tuple[Place, List[str]]]):
+        self.places: List[Place] = []
+        self._by_key: Dict[str, List[Place]] = {}
+        for place, aliases in entries:
+            self.places.append(place)
+            for name in [place.name, *aliases]:
+                k = norm_key(name)
+                if k:
+                    self._by_key.setdefault(k, []).append(place)
+            # "Santa Teresa, Carazo" también como clave
+            if place.kind != "department" and place.department:
+                self._by_key.setdefault(norm_key(f"{place.name}, {place.department}"), []).append(place)
+        for k in self._by_key:
+            self._by_key[k].sort(key=lambda p: KIND_RANK.get(p.kind, 9))
+        self._keys: List[str] = sorted(self._by_key)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Gazetteer":
+        reader = _read_geonames if path.lower().endswith(".txt") else _read_csv
+        return cls(list(reader(path)))
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    @property
+    def keys(self) -> List[str]:
+        """Claves normalizadas ordenadas (para índices auxiliares, p.ej. por bloques)."""
+        return self._keys
+
+    def _best(self, key: str, department: str = "") -> Optional[Place]:
+        cands = self._by_key.get(key)
+        if not cands:
+            return None
+        if department:
+            dep = norm_key(department)
+            for p in cands:
+                if norm_key(p.department) == dep:
+                    return p
+        return cands[0]
+
+    def exact(self, text: str) -> Optional[Place]:
+        key = norm_key(text)
+        hit = self._best(key)
+        if hit or "," not in key:
+            return hit
+        # "lugar, departamento" cuando la combinación no está indexada
+        head, _, tail = key.partition(",")
+        return self._best(head.strip(), tail.strip())
+
+    def prefix(self, text: str, limit: int = 10) -> List[Place]:
+        """Lugares cuyo nombre empieza por `text` (type-ahead)."""
+        key = norm_key(text)
+        if not key:
+            return []
+        out: List[Place] = []
+        seen = set()
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key) and len(out) < limit:
+            for p in self._by_key[self._keys[i]]:
+                if id(p) not in seen:
+                    seen.add(id(p))
+                    out.append(p)
+            i += 1
+        return out[:limit]
+
+    def fuzzy(self, text: str, cutoff: float = GAZETTEER_FUZZY_CUTOFF,
+              choices: Optional[Sequence[str]] = None) -> Optional[Place]:
+        """`choices`: claves candidatas ya acotadas (por defecto, todas)."""
+        key = norm_key(text)
+        if not key:
+            return None
+        keys = self._keys if choices is None else choices
+        if not keys:
+            return None
+        if rf_process is not None:
+            hit = rf_process.extractOne(key, keys, scorer=rf_fuzz.ratio, score_cutoff=cutoff)
+            return self._best(hit[0]) if hit else None
+        close = difflib.get_close_matches(key, keys, n=1, cutoff=cutoff / 100.0)
+        return self._best(close[0]) if close else None
+
+    def lookup(self, text: str, cutoff: float = GAZETTEER_FUZZY_CUTOFF,
+               candidates: Optional[Callable[[str], Sequence[str]]] = None) -> Optional[Place]:
+        """
+        Exacto → prefijo único → difuso. None si no hay coincidencia fiable.
+        `candidates(clave)` acota las claves de la comparación difusa (ver rasa/actions/places.py).
+        """
+        hit = self.exact(text)
+        if hit:
+            return hit
+        key = norm_key(text)
+        if len(key) >= GAZETTEER_MIN_PREFIX:
+            # prefijo sin ambigüedad: una sola clave lo completa ("matagal" → "matagalpa")
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i].startswith(key) and \
+                    not (i + 1 < len(self._keys) and self._keys[i + 1].startswith(key)):
+                return self._best(self._keys[i])
+        return self.fuzzy(text, cutoff, candidates(key) if candidates else None)
+
+    def geocode(self, text: str) -> Optional[Dict[str, Any]]:
+        hit = self.lookup(text)
+        return hit.to_geocode() if hit else None
+
+_GAZ: Optional[Gazetteer] = None
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Gazetteer del proceso (carga perezosa). None si está deshabilitado o falta el archivo."""
+    global _GAZ
+    if not GAZETTEER_ENABLED:
+        return None
+    if _GAZ is None:
+        try:
+            _GAZ = Gazetteer.from_file(GAZETTEER_PATH)
+        except OSError as e:
+            print(f"[gazetteer] No se pudo cargar {GAZETTEER_PATH}: {e}")
+            return None
+    return _GAZ
+
+def local_geocode(place: str) -> Optional[Dict[str, Any]]:
+    """{center, bbox} desde el gazetteer local, o None si no hay coincidencia."""
+    gaz = get_gazetteer()
+    return gaz.geocode(place) if gaz else None
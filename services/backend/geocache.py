@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from breakers import BreakerOpen
+from sharedcache import SHARED, Namespace
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+GEOCACHE_MAXSIZE      = int(os.getenv("GEOCACHE_MAXSIZE", "1024"))       # entradas en memoria
+GEOCACHE_TTL          = float(os.getenv("GEOCACHE_TTL", "1800"))         # fresco (s)
+GEOCACHE_STALE_TTL    = float(os.getenv("GEOCACHE_STALE_TTL", "86400"))  # servible mientras se revalida (s)
+GEOCACHE_NEGATIVE_TTL = float(os.getenv("GEOCACHE_NEGATIVE_TTL", "60"))  # "no encontrado"/errores (s)
+GEOCACHE_SHARED       = os.getenv("GEOCACHE_SHARED", "1") != "0"         # segundo nivel en sharedcache
+
+Fetch = Callable[[], Awaitable[Dict[str, Any]]]
+Entry = Tuple[Optional[Dict[str, Any]], float]   # (valor o None si es negativo, guardado en epoch)
+
+class GeocodeNegative(RuntimeError):
+    """Hay una entrada negativa vigente: la búsqueda falló hace poco y no se reintenta."""
+
+class GeoCache:
+    """
+    Caché de geocodificación en dos niveles (memoria LRU del worker + espacio
+    "geocode" de la caché compartida entre workers) con:
+    - single-flight: búsquedas idénticas en vuelo comparten una sola llamada,
+    - entradas negativas de TTL corto (no se martilla Nominatim con lo que falla),
+    - stale-while-revalidate: se sirve lo vencido y se refresca en segundo plano,
+    - estadísticas de aciertos, fallos y expulsiones.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 1800.0, stale_ttl: float = 86400.0,
+                 negative_ttl: float = 60.0, shared: Optional[Namespace] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self._mem: "OrderedDict[str, Entry]" = OrderedDict()
+        self._shared = shared
+        self._inflight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self._refreshing: set = set()
+        self._stats = {
+            "hits": 0, "stale_hits": 0, "negative_hits": 0, "shared_hits": 0, "misses": 0,
+            "coalesced": 0, "refreshes": 0, "fetch_errors": 0, "evictions": 0,
+        }
+
+    # ---- niveles ----
+    def _mem_put(self, key: str, entry: Entry) -> None:
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    async def _lookup(self, key: str) -> Optional[Entry]:
+        entry = self._mem.get(key)
+        if entry is not None:
+            self._mem.move_to_end(key)
+            return entry
+        if self._shared is None:
+            return None
+        hit = await self._shared.aget(key)   # en un hilo: el archivo no frena el event loop
+        if not isinstance(hit, dict):
+            return None
+        entry = (hit.get("v"), float(hit.get("t", 0)))
+        self._stats["shared_hits"] += 1
+        self._mem_put(key, entry)
+        return entry
+
+    def _store(self, key: str, value: Optional[Dict[str, Any]]) -> None:
+        now = time.time()
+        self._mem_put(key, (value, now))
+        if self._shared is not None:
+            ttl = self.negative_ttl if value is None else self.ttl + self.stale_ttl
+            self._shared.set(key, {"v": value, "t": now}, ttl)
+
+    # ---- API ----
+    async def get(self, key: str, fetch: Fetch) -> Dict[str, Any]:
+        entry = await self._lookup(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if value is None:
+                if age <= self.negative_ttl:
+                    self._stats["negative_hits"] += 1
+                    raise GeocodeNegative(key)
+            elif age <= self.ttl:
+                self._stats["hits"] += 1
+                return value
+            elif age <= self.ttl + self.stale_ttl:
+                self._stats["stale_hits"] += 1
+                self._revalidate(key, fetch)
+                return value
+        self._stats["misses"] += 1
+        return await self._load(key, fetch)
+
+    async def _load(self, key: str, fetch: Fetch) -> Dict[str, Any]:
+        """
+        Single-flight: la búsqueda corre en su propia tarea y todos (el primero
+        incluido) la esperan con shield; si uno se va (cliente desconectado,
+        motor perdedor del asistente) los demás siguen esperando el mismo resultado.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["coalesced"] += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._fetch(key, fetch))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, fetch: Fetch) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            value = await fetch()
+        except BreakerOpen:
+            # Nominatim caído: no se guarda como negativo, se reintenta al cerrar el circuito
+            raise
+        except Exception:
+            self._stats["fetch_errors"] += 1
+            self._store(key, None)
+            raise
+        else:
+            if self._shared is not None:
+                self._shared.note_load(time.perf_counter() - t0)
+            self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _revalidate(self, key: str, fetch: Fetch) -> None:
+        if key in self._refreshing or key in self._inflight:
+            return
+        self._refreshing.add(key)
+        self._stats["refreshes"] += 1
+
+        async def _run() -> None:
+            try:
+                value = await fetch()
+            except Exception:
+                # un fallo al revalidar no borra el valor vencido que seguimos sirviendo
+                self._stats["fetch_errors"] += 1
+                return
+            finally:
+                self._refreshing.discard(key)
+            self._store(key, value)
+
+        asyncio.get_running_loop().create_task(_run())
+
+    def stats(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out["size"] = len(self._mem)
+        out["inflight"] = len(self._inflight)
+        out["shared"] = self._shared is not None
+        return out
+
+def make_geocache() -> GeoCache:
+    return GeoCache(
+        maxsize=GEOCACHE_MAXSIZE,
+        ttl=GEOCACHE_TTL,
+        stale_ttl=GEOCACHE_STALE_TTL,
+        negative_ttl=GEOCACHE_NEGATIVE_TTL,
+        shared=SHARED.namespace("geocode", GEOCACHE_TTL + GEOCACHE_STALE_TTL)
+        if GEOCACHE_SHARED and SHARED.enabled else None,
+    )
@@ -0,0 +1,142 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+
+import httpx
+
+from breakers import BREAKERS
+
+# ── Parámetros por upstream ───────────────────────────────────────────────────
+# HTTP_<UPSTREAM>_TIMEOUT / HTTP_<UPSTREAM>_MAX_CONNECTIONS / HTTP_<UPSTREAM>_KEEPALIVE
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0") != "0"
+
+def _upstream(name: str, timeout: float, max_connections: int, keepalive: int) -> Dict[str, Any]:
+    env = name.upper()
+    return {
+        "timeout": float(os.getenv(f"HTTP_{env}_TIMEOUT", str(timeout))),
+        "max_connections": int(os.getenv(f"HTTP_{env}_MAX_CONNECTIONS", str(max_connections))),
+        "keepalive": int(os.getenv(f"HTTP_{env}_KEEPALIVE", str(keepalive))),
+    }
+
+UPSTREAMS: Dict[str, Dict[str, Any]] = {
+    # Nominatim público admite ~1 req/s: pocas conexiones, reutilizadas
+    "nominatim": _upstream("nominatim", 8.0, 4, 2),
+    "rasa":      _upstream("rasa", float(os.getenv("RASA_TIMEOUT", "10")), 50, 20),
+    "wikipedia": _upstream("wikipedia", 8.0, 8, 4),
+}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+        return True
+    except Exception:
+        return False
+
+class UpstreamStats:
+    __slots__ = ("requests", "errors", "http_errors", "latency_total", "latency_max", "last_error")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0          # timeouts / fallos de red
+        self.http_errors = 0     # respuestas 4xx/5xx
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        n = self.requests
+        return {
+            "requests": n,
+            "errors": self.errors,
+            "http_errors": self.http_errors,
+            "latency_avg_ms": round(1000 * self.latency_total / n, 3) if n else 0.0,
+            "latency_max_ms": round(1000 * self.latency_max, 3),
+            "last_error": self.last_error,
+        }
+
+class HttpClients:
+    """
+    Registro de clientes httpx.AsyncClient de larga vida, uno por upstream,
+    con su propio pool keep-alive, límites y timeout. Se crean perezosamente
+    (o en el lifespan de FastAPI) y se cierran al apagar la app.
+    """
+
+    def __init__(self, upstreams: Dict[str, Dict[str, Any]]):
+        self.upstreams = upstreams
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, UpstreamStats] = {name: UpstreamStats() for name in upstreams}
+        self.http2 = HTTP2_ENABLED and _http2_available()
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        c = self._clients.get(name)
+        if c is None or c.is_closed:
+            cfg = self.upstreams[name]
+            c = httpx.AsyncClient(
+                timeout=cfg["timeout"],
+                limits=httpx.Limits(
+                    max_connections=cfg["max_connections"],
+                    max_keepalive_connections=cfg["keepalive"],
+                ),
+                http2=self.http2,
+            )
+            self._clients[name] = c
+        return c
+
+    def start(self) -> None:
+        for name in self.upstreams:
+            self.client(name)
+
+    async def request(self, name: str, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Petición al upstream `name`; registra latencia y errores. Lanza en 4xx/5xx.
+        Con el circuito abierto lanza BreakerOpen sin tocar la red.
+        """
+        breaker = BREAKERS.get(name)
+        breaker.acquire()
+        st = self._stats[name]
+        t0 = time.perf_counter()
+        try:
+            resp = await self.client(name).request(method, url, **kwargs)
+            resp.raise_for_status()
+            breaker.success()
+            return resp
+        except httpx.HTTPStatusError as e:
+            st.http_errors += 1
+            st.last_error = f"HTTP {e.response.status_code}"
+            # 5xx y 429 hablan de la salud del upstream; el resto de 4xx es culpa de la petición
+            code = e.response.status_code
+            if code >= 500 or code == 429:
+                breaker.failure(e)
+            else:
+                breaker.success()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            st.errors += 1
+            st.last_error = type(e).__name__
+            breaker.failure(e)
+            raise
+        finally:
+            dt_ = time.perf_counter() - t0
+            st.requests += 1
+            st.latency_total += dt_
+            st.latency_max = max(st.latency_max, dt_)
+
+    async def get(self, name: str, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request(name, "GET", url, **kwargs)
+
+    async def post(self, name: str, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request(name, "POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: st.to_dict() for name, st in self._stats.items()}
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for c in clients.values():
+            await c.aclose()
+
+HTTP = HttpClients(UPSTREAMS)
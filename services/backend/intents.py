@@ -0,0 +1,177 @@
+"""
+Clasificador de intenciones del asistente local (fallback cuando Rasa no responde).
+
+Las reglas por palabra clave de _detect_intent / _map_severity se compilan una
+sola vez en una alternancia única: un solo barrido del texto devuelve la máscara
+de todas las reglas que coinciden y se elige la de mayor prioridad (el orden de
+las listas de abajo, igual que el de los antiguos `if re.search(...)`).
+"""
+import re
+import bisect
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+def norm_text(s: str) -> str:
+    s = unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("ascii")
+    return s.lower().strip()
+
+# ── Reglas (en orden de prioridad; el texto ya viene normalizado, sin tildes) ─
+SEVERITY_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("purple", ("muy grande", "morado", "morada")),
+    ("red",    ("grave", "severa", "alto")),
+    ("yellow", ("medio", "media", "amarill")),
+    ("green",  ("leve", "verde")),
+    ("blue",   ("transito", "azul")),
+]
+
+ARTICLE_KEYWORDS  = ("articul", "noticia", "informacion", "que es", "definicion")
+INCIDENT_KEYWORDS = ("incidencia", "insidencia", "accidente", "evento", "alerta")
+
+TIP_RULES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("transito",      ("transito", "trafico", "conducir", "accidente")),
+    ("terremoto",     ("terremoto", "sismo")),
+    ("inundacion",    ("inundacion", "lluvia", "crecida")),
+    ("huracan",       ("huracan", "tormenta")),
+    ("incendio",      ("incendio", "fuego")),
+    ("deslizamiento", ("deslizamiento", "derrumbe")),
+    ("volcan",        ("volcan", "erupcion", "ceniza")),
+    ("general",       ("seguridad", "desastres", "emergencia", "prevencion")),
+]
+
+# extracción de argumentos (sólo se evalúan cuando la regla ya ganó)
+_RE_TOPIC    = re.compile(r"(?:sobre|de)\s+(.*)$")
+_RE_IN_PLACE = re.compile(r"(?:en)\s+(.+)$")
+_RE_NAVIGATE = re.compile(r"(?:(?:ir|ve|vamos)\s+a|buscar|donde queda|ubicaci[oó]n de)\s+(.+)$")
+
+_SEP = "\x00"   # separador de mensajes en el barrido por lotes (no aparece en ninguna regla)
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Alternancia factorizada por prefijos (a(?:lerta|lto|zul)|...): el motor de re
+    descarta cada posición con un solo carácter en vez de probar palabra por palabra.
+    Los sufijos opcionales son codiciosos: en cada posición coincide la palabra más larga.
+    """
+    trie: Dict[str, Any] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return emit(trie)
+
+class IntentClassifier:
+    """
+    Bits de la máscara: 0 artículos, 1 incidencias, 2.. consejos (TIP_RULES),
+    y a continuación las severidades (SEVERITY_RULES).
+    """
+
+    def __init__(self):
+        groups: List[Tuple[str, ...]] = [ARTICLE_KEYWORDS, INCIDENT_KEYWORDS]
+        groups += [kws for _, kws in TIP_RULES]
+        self._tip_base = 2
+        self._sev_base = len(groups)
+        groups += [kws for _, kws in SEVERITY_RULES]
+        self._tips = [topic for topic, _ in TIP_RULES]
+        self._sevs = [color for color, _ in SEVERITY_RULES]
+        self._intent_mask = (1 << self._sev_base) - 1
+
+        masks: Dict[str, int] = {}
+        for bit, kws in enumerate(groups):
+            for kw in kws:
+                masks[kw] = masks.get(kw, 0) | (1 << bit)
+        # En cada posición el patrón devuelve la palabra más larga; las
+        # palabras que son prefijo suyo también coinciden ahí: se heredan sus bits.
+        self._masks = {kw: m for kw, m in masks.items()}
+        for kw in masks:
+            for other, m in masks.items():
+                if other != kw and kw.startswith(other):
+                    self._masks[kw] |= m
+        self._scan = re.compile(_trie_pattern(masks))
+
+    # ---- barrido ----
+    def scan(self, t: str, pos: int = 0, end: Optional[int] = None) -> int:
+        """Máscara de reglas que coinciden en t[pos:end] (coincidencias solapadas incluidas)."""
+        search, masks, mask = self._scan.search, self._masks, 0
+        if end is None:
+            end = len(t)
+        while True:
+            m = search(t, pos, end)
+            if m is None:
+                return mask
+            mask |= masks[m.group()]
+            pos = m.start() + 1
+
+    def _severity(self, mask: int) -> Optional[str]:
+        sev = mask >> self._sev_base
+        if not sev:
+            return None
+        return self._sevs[(sev & -sev).bit_length() - 1]
+
+    def _decide(self, q: str, t: str, mask: int) -> Dict[str, Any]:
+        intent = mask & self._intent_mask
+        if intent & 1:
+            m = _RE_TOPIC.search(t)
+            return {"type": "articles", "query": m.group(1) if m else q}
+        if intent & 2:
+            m = _RE_IN_PLACE.search(t)
+            return {"type": "incidents", "place": m.group(1) if m else "", "severity": self._severity(mask)}
+        m = _RE_NAVIGATE.search(t)
+        if m:
+            return {"type": "navigate", "place": m.group(1)}
+        tips = intent >> self._tip_base
+        if tips:
+            return {"type": "tips", "topic": self._tips[(tips & -tips).bit_length() - 1]}
+        m = _RE_IN_PLACE.search(t)
+        if m:
+            return {"type": "navigate", "place": m.group(1)}
+        return {"type": "unknown"}
+
+    # ---- API ----
+    def classify(self, q: str) -> Dict[str, Any]:
+        t = norm_text(q)
+        return self._decide(q, t, self.scan(t))
+
+    def severity(self, text: str) -> Optional[str]:
+        """Severidad mencionada en un texto ya normalizado (antes _map_severity)."""
+        return self._severity(self.scan(text))
+
+    def classify_batch(self, messages: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Clasifica un lote: una sola normalización y un solo barrido sobre los
+        mensajes unidos por _SEP; cada coincidencia se asigna a su mensaje.
+        """
+        if not messages:
+            return []
+        joined = norm_text(_SEP.join(m.replace(_SEP, " ") for m in messages))
+        parts = joined.split(_SEP)
+        starts, off = [], 0
+        for p in parts:
+            starts.append(off)
+            off += len(p) + 1
+        masks = [0] * len(parts)
+        search, kwmask, pos = self._scan.search, self._masks, 0
+        while True:
+            m = search(joined, pos)
+            if m is None:
+                break
+            i = m.start()
+            masks[bisect.bisect_right(starts, i) - 1] |= kwmask[m.group()]
+            pos = i + 1
+        # norm_text hace strip del total; cada parte se recorta igual que en classify
+        return [self._decide(q, p.strip(), mk) for q, p, mk in zip(messages, parts, masks)]
+
+CLASSIFIER = IntentClassifier()
+
+def classify(q: str) -> Dict[str, Any]:
+    return CLASSIFIER.classify(q)
+
+def classify_batch(messages: Iterable[str]) -> List[Dict[str, Any]]:
+    return CLASSIFIER.classify_batch(list(messages))
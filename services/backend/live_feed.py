@@ -0,0 +1,180 @@
+import os
+import asyncio
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+import orjson
+
+from serializers import normalize_severity
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+FEED_ENABLED    = os.getenv("FEED_ENABLED", "1") != "0"
+# "local" (un solo proceso) o redis://host:6379/0 para compartir eventos entre workers
+FEED_BROKER_URL = os.getenv("FEED_BROKER_URL", "local")
+FEED_CHANNEL    = os.getenv("FEED_CHANNEL", "riaar:incidents")
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "256"))   # eventos pendientes por suscriptor
+FEED_HEARTBEAT  = float(os.getenv("FEED_HEARTBEAT", "15"))   # s entre pings SSE/WebSocket
+
+BBox = Tuple[float, float, float, float]   # (west, south, east, north)
+Deliver = Callable[[bytes], None]
+
+# ── Brokers ───────────────────────────────────────────────────────────────────
+class Broker:
+    """Transporte de eventos entre procesos. `deliver` se llama en el event loop."""
+
+    async def start(self, deliver: Deliver) -> None:
+        raise NotImplementedError
+
+    async def publish(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        pass
+
+class LocalBroker(Broker):
+    """En memoria, mismo proceso. Para un solo worker y para pruebas."""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, data: bytes) -> None:
+        if self._deliver is not None:
+            self._deliver(data)
+
+class RedisBroker(Broker):
+    """Pub/sub de Redis (o compatible): todos los workers reciben todos los eventos."""
+
+    def __init__(self, url: str, channel: str):
+        import redis.asyncio as aioredis  # opcional: pip install redis
+        self._redis = aioredis.from_url(url)
+        self._channel = channel
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel)
+
+        async def _listen() -> None:
+            async for msg in pubsub.listen():
+                if msg.get("type") == "message":
+                    deliver(msg["data"])
+
+        self._task = asyncio.get_running_loop().create_task(_listen())
+
+    async def publish(self, data: bytes) -> None:
+        await self._redis.publish(self._channel, data)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self._redis.aclose()
+
+def make_broker(url: str = FEED_BROKER_URL) -> Broker:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url, FEED_CHANNEL)
+    return LocalBroker()
+
+# ── Suscripciones ─────────────────────────────────────────────────────────────
+class Subscription:
+    """
+    Cola acotada por suscriptor. Si el cliente no consume a tiempo se descarta
+    el evento más antiguo (backpressure): un cliente lento nunca frena al resto.
+    """
+
+    def __init__(self, bbox: Optional[BBox], severities: Optional[Set[str]], maxsize: int):
+        self.bbox = bbox
+        self.severities = severities
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize)
+        self.delivered = 0
+        self.dropped = 0
+
+    def matches(self, ev: Dict[str, Any]) -> bool:
+        if self.severities and ev.get("severity") not in self.severities:
+            return False
+        if self.bbox:
+            w, s, e, n = self.bbox
+            try:
+                lat, lon = float(ev["lat"]), float(ev["lon"])
+            except (KeyError, TypeError, ValueError):
+                return False
+            return s <= lat <= n and w <= lon <= e
+        return True
+
+    def offer(self, data: bytes) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(data)
+        self.delivered += 1
+
+class FeedHub:
+    """Hub pub/sub en proceso: recibe del broker y reparte a los suscriptores que filtran."""
+
+    def __init__(self, broker: Broker, queue_size: int = 256):
+        self.broker = broker
+        self.queue_size = queue_size
+        self._subs: Set[Subscription] = set()
+        self._started = False
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self) -> None:
+        if not self._started:
+            await self.broker.start(self._dispatch)
+            self._started = True
+
+    async def stop(self) -> None:
+        if self._started:
+            await self.broker.stop()
+            self._started = False
+
+    def subscribe(self, bbox: Optional[BBox] = None, severities: Optional[Set[str]] = None) -> Subscription:
+        sub = Subscription(bbox, severities, self.queue_size)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subs.discard(sub)
+
+    async def publish(self, incident: Dict[str, Any]) -> None:
+        """Publica un incidente nuevo (serializado una sola vez). Nunca hace fallar al llamador."""
+        try:
+            await self.broker.publish(orjson.dumps(incident))
+            self.published += 1
+        except Exception:
+            self.errors += 1
+
+    def _dispatch(self, data: bytes) -> None:
+        self.received += 1
+        if not self._subs:
+            return
+        ev = orjson.loads(data)
+        for sub in tuple(self._subs):
+            if sub.matches(ev):
+                sub.offer(data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "broker": type(self.broker).__name__,
+            "subscribers": len(self._subs),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            "dropped": sum(s.dropped for s in self._subs),
+        }
+
+def parse_filters(bbox: Optional[str], severity: Optional[str]) -> Tuple[Optional[BBox], Optional[Set[str]]]:
+    """bbox="west,south,east,north"; severity="red,purple"."""
+    box: Optional[BBox] = None
+    if bbox:
+        parts = [float(x) for x in bbox.split(",")]
+        if len(parts) != 4:
+            raise ValueError("bbox debe ser west,south,east,north")
+        box = (parts[0], parts[1], parts[2], parts[3])
+    sevs = {normalize_severity(s) for s in severity.split(",") if s.strip()} if severity else None
+    return box, sevs
+
+FEED = FeedHub(make_broker(), FEED_QUEUE_SIZE)
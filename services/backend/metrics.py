@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import functools
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+METRICS_ENABLED    = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_PREFIX     = os.getenv("METRICS_PREFIX", "riaar")
+# límites superiores (s) de los buckets de los histogramas
+METRICS_BUCKETS    = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(","))
+# perfilador por muestreo (POST /debug/profile); apagado por defecto
+PROFILER_ENABLED   = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_HZ        = float(os.getenv("PROFILER_HZ", "100"))
+PROFILER_MAX_SECS  = float(os.getenv("PROFILER_MAX_SECS", "60"))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# ── Primitivas ────────────────────────────────────────────────────────────────
+class Histogram:
+    """Histograma acumulativo estilo Prometheus. Thread-safe (los spans de BD corren en el executor)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        acc, cum = 0, []
+        for c in counts:
+            acc += c
+            cum.append(acc)
+        return cum, total, n
+
+class Metrics:
+    """
+    Registro en proceso (uno por worker de uvicorn) de:
+    - histogramas de latencia por endpoint (middleware) y por etapa (spans),
+    - contadores con etiquetas,
+    - colectores: funciones que devuelven valores al momento del scrape
+      (stats() de geocache, pool, executor…), sin coste en la ruta caliente.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._hist: Dict[Tuple[str, Labels], Histogram] = {}
+        self._stages: Dict[str, Histogram] = {}           # atajo de stage(): sin armar etiquetas
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, Tuple[str, str]] = {}       # nombre → (tipo, ayuda)
+        self._collectors: List[Tuple[str, str, str, str, Callable[[], Dict[str, Any]]]] = []
+        self._lock = threading.Lock()
+
+    def _histogram(self, name: str, labels: Labels) -> Histogram:
+        key = (name, labels)
+        h = self._hist.get(key)
+        if h is None:
+            with self._lock:
+                h = self._hist.setdefault(key, Histogram(self.buckets))
+        return h
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self._histogram(name, tuple(sorted(labels.items()))).observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def register_collector(self, name: str, help_text: str, fn: Callable[[], Dict[str, Any]],
+                           kind: str = "gauge", label: str = "key") -> None:
+        """fn() → {clave: número}; se exporta como `<prefix>_<name>{<label>="clave"}` (gauge o counter)."""
+        self._collectors.append((name, help_text, kind, label, fn))
+
+    # ---- spans ----
+    def stage(self, stage: str, seconds: float) -> None:
+        if not METRICS_ENABLED:
+            return
+        h = self._stages.get(stage)
+        if h is None:
+            h = self._stages[stage] = self._histogram("stage_seconds", (("stage", stage),))
+        h.observe(seconds)
+
+    @contextmanager
+    def _span(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(stage, time.perf_counter() - t0)
+
+    def span(self, stage: str):
+        """`with METRICS.span("db.query_rows"): ...` — no-op si METRICS_ENABLED=0."""
+        return self._span(stage) if METRICS_ENABLED else nullcontext()
+
+    def timed(self, stage: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """Decorador para funciones síncronas o corrutinas."""
+        def deco(fn: Callable[..., T]) -> Callable[..., T]:
+            if not METRICS_ENABLED:
+                return fn
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def awrapper(*args: Any, **kwargs: Any) -> Any:
+                    t0 = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.stage(stage, time.perf_counter() - t0)
+                return awrapper  # type: ignore[return-value]
+
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.stage(stage, time.perf_counter() - t0)
+            return wrapper  # type: ignore[return-value]
+        return deco
+
+    # ---- exposición ----
+    @staticmethod
+    def _fmt_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ""
+        esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+    @staticmethod
+    def _fmt_num(v: float) -> str:
+        return repr(float(v)) if v != int(v) else str(int(v))
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus (version 0.0.4)."""
+        out: List[str] = []
+        p = self.prefix
+        with self._lock:
+            hists = sorted(self._hist.items())
+            counters = sorted(self._counters.items())
+        bounds = [self._fmt_num(b) for b in self.buckets] + ["+Inf"]
+
+        seen = set()
+        for (name, labels), h in hists:
+            full = f"{p}_{name}"
+            if name not in seen:
+                seen.add(name)
+                kind, help_text = self._help.get(name, ("histogram", name))
+                out.append(f"# HELP {full} {help_text}")
+                out.append(f"# TYPE {full} histogram")
+            cum, total, n = h.snapshot()
+            for le, c in zip(bounds, cum):
+                out.append(f"{full}_bucket{self._fmt_labels(labels, (('le', le),))} {c}")
+            out.append(f"{full}_sum{self._fmt_labels(labels)} {total!r}")
+            out.append(f"{full}_count{self._fmt_labels(labels)} {n}")
+
+        for (name, labels), v in counters:
+            full = f"{p}_{name}_total"
+            if name not in seen:
+                seen.add(name)
+                _, help_text = self._help.get(name, ("counter", name))
+                out.append(f"# HELP {full} {help_text}")
+                out.append(f"# TYPE {full} counter")
+            out.append(f"{full}{self._fmt_labels(labels)} {self._fmt_num(v)}")
+
+        for name, help_text, kind, label, fn in self._collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            full = f"{p}_{name}_total" if kind == "counter" else f"{p}_{name}"
+            out.append(f"# HELP {full} {help_text}")
+            out.append(f"# TYPE {full} {kind}")
+            for k, v in values.items():
+                if isinstance(v, bool) or not isinstance(v, (int, float)):
+                    continue
+                out.append(f"{full}{self._fmt_labels(((label, k),))} {self._fmt_num(v)}")
+        return "\n".join(out) + "\n"
+
+METRICS = Metrics()
+METRICS.describe("request_seconds", "histogram", "Latencia de las peticiones HTTP por endpoint (hasta el último byte)")
+METRICS.describe("stage_seconds", "histogram", "Latencia por etapa interna (upstreams, BD, serialización)")
+METRICS.describe("requests", "counter", "Peticiones HTTP por endpoint y código")
+
+span = METRICS.span
+timed = METRICS.timed
+
+# ── Middleware ASGI ───────────────────────────────────────────────────────────
+class MetricsMiddleware:
+    """
+    Mide cada petición HTTP hasta el último byte del cuerpo (incluye NDJSON/SSE).
+    La etiqueta es la plantilla de la ruta (/incidents/tiles/{z}/{x}/{y}), no la
+    URL concreta, para que la cardinalidad quede acotada.
+    """
+
+    def __init__(self, app: Any, metrics: Metrics = METRICS, skip: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.metrics = metrics
+        self.skip = skip
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not METRICS_ENABLED or scope.get("path") in self.skip:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "GET")
+            self.metrics.observe("request_seconds", time.perf_counter() - t0, method=method, route=path)
+            self.metrics.inc("requests", method=method, route=path, status=str(status[0]))
+
+# ── Perfilador por muestreo ───────────────────────────────────────────────────
+class SamplingProfiler:
+    """
+    Muestrea las pilas de todos los hilos con sys._current_frames() a `hz`
+    durante `seconds` y devuelve pilas colapsadas ("a;b;c N"), el formato que
+    consumen flamegraph.pl / speedscope. Sólo para investigaciones puntuales:
+    una sesión a la vez y nunca en la ruta de las peticiones.
+    """
+
+    def __init__(self, hz: float = PROFILER_HZ, max_seconds: float = PROFILER_MAX_SECS):
+        self.hz = hz
+        self.max_seconds = max_seconds
+        self._busy = threading.Lock()
+
+    @staticmethod
+    def _stack(frame: Any) -> str:
+        parts: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def sample(self, seconds: float) -> Dict[str, Any]:
+        if not self._busy.acquire(blocking=False):
+            raise RuntimeError("ya hay un perfilado en curso")
+        try:
+            seconds = min(max(seconds, 0.1), self.max_seconds)
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            tally: "_Tally[str]" = _Tally()
+            interval = 1.0 / self.hz
+            n = 0
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        tally[f"{names.get(ident, ident)};{self._stack(frame)}"] += 1
+                n += 1
+                time.sleep(interval)
+            return {
+                "seconds": seconds, "hz": self.hz, "samples": n,
+                "collapsed": "\n".join(f"{k} {v}" for k, v in tally.most_common()),
+            }
+        finally:
+            self._busy.release()
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,383 @@
+"""
+Migraciones versionadas del esquema de Incidentes.
+
+    python migrations.py status
+    python migrations.py upgrade [--to N]
+
+Cada migración se aplica una sola vez y queda registrada en SchemaVersion.
+Funciona contra SQL Server y contra SQLite (DB_BACKEND=sqlite:…, ver db_sqlite.py).
+
+Columnas derivadas (calculadas por la propia BD, así ningún INSERT cambia y
+las filas existentes quedan rellenadas al aplicar la migración):
+- SevCode: código TINYINT del color de Severidad (SEVERITY_CODE), misma regla
+  que normalize_severity; la migración verifica cada valor distinto en Python.
+- Celda:   celda de una rejilla fija de CELL_DEG grados. Un bbox se traduce a
+  la lista de sus celdas, que el índice (Celda, Fecha) resuelve con un seek
+  por celda en vez de recorrer una banda de Lat de todo el país.
+- Cambio:  token de cambio creciente (ROWVERSION en SQL Server, secuencia por
+  triggers en SQLite) para la sincronización incremental (changes.py).
+
+Columnas escritas por la app:
+- Departamento / Municipio: región administrativa por point-in-polygon
+  (regions.py), fijada en cada alta; la migración rellena las existentes.
+- RegionFuente: firma de los límites con que se etiquetó la fila; las de
+  otra firma (o NULL) las re-etiqueta regions.py en segundo plano.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import db
+from serializers import COLOR_SET, LOGICAL_TO_COLOR, SEVERITY_CODE, normalize_severity, severity_code
+
+# ── Rejilla de Celda ──────────────────────────────────────────────────────────
+# Forman parte del esquema (la columna se calcula con ellos): cambiarlos exige
+# una migración nueva.
+CELL_DEG  = 0.05                       # ~5.5 km
+CELL_COLS = int(round(360 / CELL_DEG))
+
+# Celdas admitidas en un filtro por Celda; bbox mayores usan Lat/Lon
+CELL_MAX_CELLS     = int(os.getenv("CELL_MAX_CELLS", "400"))
+MIGRATIONS_REFRESH = float(os.getenv("MIGRATIONS_REFRESH", "60"))   # s: relectura de la versión aplicada
+
+# margen para los bordes: la BD puede redondear distinto que Python (DECIMAL vs float)
+_EDGE = 1e-6
+
+def cell_of(lat: float, lon: float) -> int:
+    return int((lat + 90) / CELL_DEG) * CELL_COLS + int((lon + 180) / CELL_DEG)
+
+def bbox_cells(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+               max_cells: int = CELL_MAX_CELLS) -> Optional[List[int]]:
+    """Celdas que cubren el bbox, o None si son más de max_cells."""
+    r0 = max(0, int((lat_min + 90) / CELL_DEG - _EDGE))
+    r1 = int((lat_max + 90) / CELL_DEG + _EDGE)
+    c0 = max(0, int((lon_min + 180) / CELL_DEG - _EDGE))
+    c1 = min(CELL_COLS - 1, int((lon_max + 180) / CELL_DEG + _EDGE))
+    if (r1 - r0 + 1) * (c1 - c0 + 1) > max_cells:
+        return None
+    return [r * CELL_COLS + c for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+
+# ── Filtros SQL (versión según el esquema) ────────────────────────────────────
+def bbox_where(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+               cells: bool) -> Tuple[str, List[Any]]:
+    """
+    Predicado de bbox. Con cells=True: Celda IN (…) resuelto con el índice
+    (Celda, Fecha) y el filtro exacto por Lat/Lon como residuo; el + unario
+    impide que el planificador prefiera el índice de Lat (una banda de todo
+    el país) sobre el de Celda.
+    """
+    ids = bbox_cells(lat_min, lat_max, lon_min, lon_max) if cells else None
+    if not ids:
+        return "Lat BETWEEN ? AND ? AND Lon BETWEEN ? AND ?", [lat_min, lat_max, lon_min, lon_max]
+    return (f"Celda IN ({', '.join('?' * len(ids))}) AND +Lat BETWEEN ? AND ? AND +Lon BETWEEN ? AND ?",
+            [*ids, lat_min, lat_max, lon_min, lon_max])
+
+def severity_where(colors: Iterable[str]) -> Tuple[str, List[Any]]:
+    """Predicado sargable por SevCode para colores ya normalizados."""
+    codes = sorted({SEVERITY_CODE[c] for c in colors})
+    return f"SevCode IN ({', '.join('?' * len(codes))})", codes
+
+# ── Expresiones de las columnas calculadas ────────────────────────────────────
+def _sevcode_case(expr: str) -> str:
+    labels = {**{c: c for c in COLOR_SET}, **LOGICAL_TO_COLOR}
+    whens = " ".join(f"WHEN '{k}' THEN {SEVERITY_CODE[v]}" for k, v in sorted(labels.items()))
+    return f"CASE {expr} {whens} ELSE {SEVERITY_CODE[normalize_severity('')]} END"
+
+def _cell_expr(cast: str) -> str:
+    return (f"CAST((Lat + 90) / {CELL_DEG} AS {cast}) * {CELL_COLS} + "
+            f"CAST((Lon + 180) / {CELL_DEG} AS {cast})")
+
+# ── Migraciones ───────────────────────────────────────────────────────────────
+Step = Union[str, Callable[[Any], None]]
+
+class MigrationError(RuntimeError):
+    pass
+
+class Migration:
+    __slots__ = ("version", "name", "mssql", "sqlite", "verify")
+
+    def __init__(self, version: int, name: str, mssql: Sequence[Step], sqlite: Sequence[Step],
+                 verify: Optional[Callable[[Any], Optional[str]]] = None):
+        self.version, self.name = version, name
+        self.mssql, self.sqlite = list(mssql), list(sqlite)
+        self.verify = verify
+
+def _sqlite_add_column(column: str, ddl: str) -> Callable[[Any], None]:
+    # SQLite no tiene ADD COLUMN IF NOT EXISTS
+    def step(cur: Any) -> None:
+        cur.execute("PRAGMA table_info(Incidentes)")
+        if column not in {r[1] for r in cur.fetchall()}:
+            cur.execute(f"ALTER TABLE Incidentes ADD COLUMN {column} {ddl}")
+    return step
+
+def _mssql_index(name: str, body: str) -> str:
+    return (f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' "
+            f"AND object_id = OBJECT_ID('dbo.Incidentes'))\n    CREATE INDEX {name} ON dbo.Incidentes {body}")
+
+def _verify_sevcode(cur: Any) -> Optional[str]:
+    cur.execute("SELECT Severidad, SevCode, COUNT(*) FROM Incidentes GROUP BY Severidad, SevCode")
+    bad = [(sev, code, n) for sev, code, n in cur.fetchall() if severity_code(sev) != code]
+    if bad:
+        return "SevCode no coincide con normalize_severity: " + ", ".join(f"{s!r}→{c} ({n} filas)" for s, c, n in bad[:10])
+    return None
+
+def _verify_cell(cur: Any) -> Optional[str]:
+    cur.execute("SELECT TOP 1000 Lat, Lon, Celda FROM Incidentes WHERE Lat IS NOT NULL AND Lon IS NOT NULL")
+    for lat, lon, cell in cur.fetchall():
+        lat, lon = float(lat), float(lon)
+        if cell not in bbox_cells(lat, lat, lon, lon):
+            return f"Celda {cell} para ({lat}, {lon}); se esperaba {cell_of(lat, lon)}"
+    return None
+
+def _fill_regions(cur: Any) -> None:
+    from regions import REGIONS   # regions importa SCHEMA de este módulo
+    REGIONS.fill_pending(cur)
+
+def _verify_regions(cur: Any) -> Optional[str]:
+    from regions import REGIONS
+    cur.execute("SELECT TOP 1000 Lat, Lon, Departamento, Municipio FROM Incidentes "
+                "WHERE Lat IS NOT NULL AND Lon IS NOT NULL AND Departamento IS NOT NULL")
+    for lat, lon, dep, mun in cur.fetchall():
+        expected = REGIONS.tag_one(float(lat), float(lon))
+        if (dep, mun) != expected:
+            return f"({dep!r}, {mun!r}) para ({lat}, {lon}); se esperaba {expected}"
+    return None
+
+_COVERED = "Titulo, Descripcion, Severidad, SevCode, Tipo, Lat, Lon"
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1, "incidentes_sevcode",
+        mssql=[f"IF COL_LENGTH('dbo.Incidentes', 'SevCode') IS NULL\n"
+               f"    ALTER TABLE dbo.Incidentes ADD SevCode AS "
+               f"CAST({_sevcode_case('LOWER(LTRIM(RTRIM(Severidad)))')} AS TINYINT) PERSISTED"],
+        sqlite=[_sqlite_add_column("SevCode", f"INTEGER GENERATED ALWAYS AS ({_sevcode_case('LOWER(TRIM(Severidad))')}) VIRTUAL")],
+        verify=_verify_sevcode,
+    ),
+    Migration(
+        2, "incidentes_celda",
+        mssql=[f"IF COL_LENGTH('dbo.Incidentes', 'Celda') IS NULL\n"
+               f"    ALTER TABLE dbo.Incidentes ADD Celda AS {_cell_expr('INT')} PERSISTED"],
+        sqlite=[_sqlite_add_column("Celda", f"INTEGER GENERATED ALWAYS AS ({_cell_expr('INTEGER')}) VIRTUAL")],
+        verify=_verify_cell,
+    ),
+    Migration(
+        3, "incidentes_indices_celda_fecha",
+        mssql=[_mssql_index("IX_Incidentes_Celda_Fecha", f"(Celda, Fecha DESC, Id DESC) INCLUDE ({_COVERED})"),
+               _mssql_index("IX_Incidentes_SevCode_Celda_Fecha",
+                            f"(SevCode, Celda, Fecha DESC, Id DESC) INCLUDE ({_COVERED})")],
+        # SQLite no tiene INCLUDE: el índice cubre el filtro y el orden, no las columnas
+        sqlite=["CREATE INDEX IF NOT EXISTS IX_Incidentes_Celda_Fecha ON Incidentes (Celda, Fecha, Id)",
+                "CREATE INDEX IF NOT EXISTS IX_Incidentes_SevCode_Celda_Fecha ON Incidentes (SevCode, Celda, Fecha, Id)",
+                "ANALYZE"],
+    ),
+    Migration(
+        4, "incidentes_cambio",
+        # ROWVERSION: SQL Server la incrementa en cada INSERT/UPDATE (también de filas existentes)
+        mssql=["IF COL_LENGTH('dbo.Incidentes', 'Cambio') IS NULL\n"
+               "    ALTER TABLE dbo.Incidentes ADD Cambio ROWVERSION",
+               _mssql_index("IX_Incidentes_Cambio", f"(Cambio) INCLUDE (Fecha, {_COVERED}, Celda)")],
+        # SQLite: secuencia mantenida por triggers (las escrituras ya están serializadas)
+        sqlite=[_sqlite_add_column("Cambio", "INTEGER"),
+                "UPDATE Incidentes SET Cambio = Id WHERE Cambio IS NULL",
+                "CREATE INDEX IF NOT EXISTS IX_Incidentes_Cambio ON Incidentes (Cambio)",
+                "CREATE TRIGGER IF NOT EXISTS TR_Incidentes_Cambio_Ins AFTER INSERT ON Incidentes BEGIN "
+                "UPDATE Incidentes SET Cambio = (SELECT COALESCE(MAX(Cambio), 0) + 1 FROM Incidentes) "
+                "WHERE Id = NEW.Id; END",
+                "CREATE TRIGGER IF NOT EXISTS TR_Incidentes_Cambio_Upd "
+                "AFTER UPDATE OF Titulo, Descripcion, Severidad, Tipo, Lat, Lon, Fecha ON Incidentes BEGIN "
+                "UPDATE Incidentes SET Cambio = (SELECT COALESCE(MAX(Cambio), 0) + 1 FROM Incidentes) "
+                "WHERE Id = NEW.Id; END"],
+    ),
+    Migration(
+        5, "incidentes_region",
+        # relleno antes de los índices; en SQL Server cada UPDATE cambia la ROWVERSION:
+        # los clientes con since= reciben una vez las filas rellenadas (has_more)
+        mssql=["IF COL_LENGTH('dbo.Incidentes', 'Departamento') IS NULL\n"
+               "    ALTER TABLE dbo.Incidentes ADD Departamento NVARCHAR(64) NULL, Municipio NVARCHAR(64) NULL",
+               _fill_regions,
+               _mssql_index("IX_Incidentes_Departamento_Fecha",
+                            f"(Departamento, Fecha DESC, Id DESC) INCLUDE ({_COVERED})"),
+               _mssql_index("IX_Incidentes_Municipio_Fecha",
+                            f"(Municipio, Fecha DESC, Id DESC) INCLUDE ({_COVERED})")],
+        sqlite=[_sqlite_add_column("Departamento", "TEXT"),
+                _sqlite_add_column("Municipio", "TEXT"),
+                _fill_regions,
+                "CREATE INDEX IF NOT EXISTS IX_Incidentes_Departamento_Fecha ON Incidentes (Departamento, Fecha, Id)",
+                "CREATE INDEX IF NOT EXISTS IX_Incidentes_Municipio_Fecha ON Incidentes (Municipio, Fecha, Id)",
+                "ANALYZE"],
+        verify=_verify_regions,
+    ),
+    Migration(
+        6, "incidentes_region_fuente",
+        # sin relleno: regions.py re-etiqueta en segundo plano las filas con RegionFuente NULL
+        # o de otro juego de límites (p.ej. la partición Voronoi aproximada)
+        mssql=["IF COL_LENGTH('dbo.Incidentes', 'RegionFuente') IS NULL\n"
+               "    ALTER TABLE dbo.Incidentes ADD RegionFuente NVARCHAR(32) NULL",
+               _mssql_index("IX_Incidentes_RegionFuente", "(RegionFuente) INCLUDE (Lat, Lon)")],
+        sqlite=[_sqlite_add_column("RegionFuente", "TEXT"),
+                "CREATE INDEX IF NOT EXISTS IX_Incidentes_RegionFuente ON Incidentes (RegionFuente)"],
+    ),
+]
+LATEST = MIGRATIONS[-1].version
+CELLS_VERSION = 3     # desde aquí las consultas usan SevCode/Celda
+CHANGES_VERSION = 4   # columna Cambio: sincronización incremental (changes.py)
+REGIONS_VERSION = 5   # Departamento/Municipio: filtros por igualdad en /incidents (regions.py)
+REGION_SOURCE_VERSION = 6   # RegionFuente: límites con que se etiquetó cada fila (re-etiquetado)
+
+_VERSION_TABLE = {
+    "mssql": ("IF OBJECT_ID('dbo.SchemaVersion', 'U') IS NULL\n"
+              "    CREATE TABLE dbo.SchemaVersion (Version INT NOT NULL PRIMARY KEY, Nombre NVARCHAR(128) NOT NULL, "
+              "Aplicada DATETIME2(0) NOT NULL DEFAULT GETDATE())"),
+    "sqlite": ("CREATE TABLE IF NOT EXISTS SchemaVersion (Version INTEGER PRIMARY KEY, Nombre TEXT NOT NULL, "
+               "Aplicada TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')))"),
+}
+
+def _backend() -> str:
+    return "sqlite" if db.DB_BACKEND.startswith("sqlite:") else "mssql"
+
+def applied(cur: Any) -> Dict[int, Tuple[str, Any]]:
+    cur.execute(_VERSION_TABLE[_backend()])
+    cur.execute("SELECT Version, Nombre, Aplicada FROM SchemaVersion ORDER BY Version")
+    return {int(v): (name, at) for v, name, at in cur.fetchall()}
+
+def current_version() -> int:
+    with db.get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            done = applied(cur)
+        finally:
+            cur.close()
+    return max(done, default=0)
+
+def upgrade(target: Optional[int] = None, log: Callable[[str], Any] = print) -> List[int]:
+    """Aplica en orden las migraciones pendientes hasta `target` (la última por defecto)."""
+    target = LATEST if target is None else target
+    backend = _backend()
+    ran: List[int] = []
+    with db.get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            done = applied(cur)
+            for m in MIGRATIONS:
+                if m.version > target or m.version in done:
+                    continue
+                t0 = time.perf_counter()
+                for step in (m.sqlite if backend == "sqlite" else m.mssql):
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                error = m.verify(cur) if m.verify else None
+                if error:
+                    raise MigrationError(f"{m.version} {m.name}: {error}")
+                cur.execute("INSERT INTO SchemaVersion (Version, Nombre) VALUES (?, ?)", [m.version, m.name])
+                ran.append(m.version)
+                log(f"[{m.version}] {m.name} aplicada en {time.perf_counter() - t0:.1f}s")
+        finally:
+            cur.close()
+    return ran
+
+# ── Versión vista por la app ──────────────────────────────────────────────────
+class SchemaState:
+    """
+    Versión del esquema aplicada, leída al arrancar y cada MIGRATIONS_REFRESH s.
+    Mientras no se conoce (BD caída al arrancar) las consultas usan la forma
+    previa, que es correcta con cualquier versión.
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def cells(self) -> bool:
+        return (self.version or 0) >= CELLS_VERSION
+
+    @property
+    def changes(self) -> bool:
+        return (self.version or 0) >= CHANGES_VERSION
+
+    @property
+    def regions(self) -> bool:
+        return (self.version or 0) >= REGIONS_VERSION
+
+    @property
+    def region_source(self) -> bool:
+        return (self.version or 0) >= REGION_SOURCE_VERSION
+
+    async def refresh(self) -> Optional[int]:
+        from db_async import ascalar
+        try:
+            v = await ascalar("SELECT MAX(Version) FROM SchemaVersion")
+        except Exception as e:
+            if db.is_unavailable(e):
+                return self.version
+            v = 0   # SchemaVersion no existe: ninguna migración aplicada
+        self.version = int(v or 0)
+        return self.version
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            await asyncio.sleep(MIGRATIONS_REFRESH)
+
+    def schedule_refresh(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "latest": LATEST, "cells": self.cells, "changes": self.changes,
+                "regions": self.regions, "region_source": self.region_source}
+
+SCHEMA = SchemaState()
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Migraciones versionadas del esquema de Incidentes.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="versiones aplicadas y pendientes")
+    up = sub.add_parser("upgrade", help="aplica las migraciones pendientes")
+    up.add_argument("--to", type=int, default=None, help="versión destino (por defecto, la última)")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "status":
+        with db.get_pool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                done = applied(cur)
+            finally:
+                cur.close()
+        for m in MIGRATIONS:
+            mark = f"aplicada {done[m.version][1]}" if m.version in done else "pendiente"
+            print(f"[{m.version}] {m.name}: {mark}")
+        return 0
+
+    try:
+        ran = upgrade(args.to)
+    except MigrationError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if not ran:
+        print("Sin migraciones pendientes.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
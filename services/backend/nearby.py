@@ -0,0 +1,105 @@
+import os
+import math
+import datetime as dt
+from typing import Any, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from clusters import haversine_m
+from db_async import aquery_rows
+from migrations import SCHEMA, bbox_where, severity_where
+from serializers import INCIDENT_SELECT, ID, LOGICAL_TO_COLOR, normalize_severity
+from spatial_index import INDEX, SPATIAL_INDEX_ENABLED, SPATIAL_INDEX_WINDOW_DAYS, IncidentIndex
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "50"))
+NEARBY_MAX_K         = int(os.getenv("NEARBY_MAX_K", "500"))
+NEARBY_DAYS          = int(os.getenv("NEARBY_DAYS", str(SPATIAL_INDEX_WINDOW_DAYS)))   # antigüedad por defecto
+
+KM_PER_DEG_LAT = 111.32
+
+Ranked = List[Tuple[Sequence[Any], float]]   # (fila INCIDENT_COLUMNS, distancia en km)
+
+def radius_bbox(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(lat_min, lat_max, lon_min, lon_max) que contiene el círculo; los grados de longitud se estrechan con cos(lat)."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(min(abs(lat) + dlat, 89.0))), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def rank(lat0: float, lon0: float, lat: np.ndarray, lon: np.ndarray, ts: np.ndarray,
+         radius_km: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Índices (sobre los arrays candidatos) de los k más cercanos dentro del
+    radio y sus distancias en km. Empates de distancia: el más reciente primero.
+    """
+    km = haversine_m(lat0, lon0, lat, lon) / 1000.0
+    inside = np.flatnonzero(km <= radius_km)
+    if len(inside) > k:
+        inside = inside[np.argpartition(km[inside], k - 1)[:k]]
+    order = inside[np.lexsort((-ts[inside], km[inside]))]
+    return order, km[order]
+
+def _as_ts(value: Any) -> float:
+    return value.timestamp() if isinstance(value, dt.datetime) else 0.0
+
+# ── Fuentes ───────────────────────────────────────────────────────────────────
+def nearest_from_index(lat: float, lon: float, radius_km: float, k: int, days: int,
+                       severities: Optional[Set[str]] = None, index: IncidentIndex = INDEX) -> Optional[Ranked]:
+    """
+    Desde el índice espacial en memoria. None si no puede responder: índice
+    viejo o antigüedad pedida mayor que la ventana que guarda.
+    """
+    if not index.is_fresh() or days > index.window_days:
+        return None
+    since = dt.datetime.now() - dt.timedelta(days=days)
+    pos, la, lo, ts = index.candidates(*radius_bbox(lat, lon, radius_km))
+    keep = ts >= since.timestamp()
+    if severities:
+        keep &= np.fromiter((normalize_severity(index.severity_at(p)) in severities for p in pos),
+                            dtype=bool, count=len(pos))
+    pos, la, lo, ts = pos[keep], la[keep], lo[keep], ts[keep]
+    order, km = rank(lat, lon, la, lo, ts, radius_km, k)
+    return [(index.row(int(p)), float(d)) for p, d in zip(pos[order], km)]
+
+async def nearest_from_db(lat: float, lon: float, radius_km: float, k: int, since: dt.datetime,
+                          severities: Optional[Set[str]] = None) -> Ranked:
+    """
+    Candidatos del bbox (sólo Id, Lat, Lon, Fecha: filas livianas), distancia
+    en NumPy y después las filas completas de los k elegidos.
+    """
+    where, params = bbox_where(*radius_bbox(lat, lon, radius_km), cells=SCHEMA.cells)
+    params.append(since)
+    sev_sql = ""
+    if severities:
+        if SCHEMA.cells:
+            sev_where, sev_params = severity_where(severities)
+        else:
+            labels = sorted(severities | {label for label, c in LOGICAL_TO_COLOR.items() if c in severities})
+            sev_where, sev_params = f"LOWER(Severidad) IN ({', '.join('?' * len(labels))})", labels
+        sev_sql = f" AND {sev_where}"
+        params.extend(sev_params)
+    cand = await aquery_rows(f"SELECT Id, Lat, Lon, Fecha FROM Incidentes WHERE {where} AND Fecha >= ?{sev_sql}",
+                             params)
+    if not cand:
+        return []
+    n = len(cand)
+    la = np.fromiter((float(r[1]) for r in cand), dtype=np.float64, count=n)
+    lo = np.fromiter((float(r[2]) for r in cand), dtype=np.float64, count=n)
+    ts = np.fromiter((_as_ts(r[3]) for r in cand), dtype=np.float64, count=n)
+    order, km = rank(lat, lon, la, lo, ts, radius_km, k)
+    if not len(order):
+        return []
+    ids = [cand[i][0] for i in order]
+    full = await aquery_rows(f"SELECT {INCIDENT_SELECT} FROM Incidentes WHERE Id IN ({', '.join('?' * len(ids))})",
+                             ids)
+    by_id = {r[ID]: r for r in full}
+    return [(by_id[i], float(d)) for i, d in zip(ids, km) if i in by_id]
+
+async def nearest(lat: float, lon: float, radius_km: float, k: int, days: int = NEARBY_DAYS,
+                  severities: Optional[Set[str]] = None) -> Tuple[Ranked, str]:
+    """k incidentes más cercanos a (lat, lon) dentro de radius_km y de los últimos `days` días."""
+    ranked = nearest_from_index(lat, lon, radius_km, k, days, severities) if SPATIAL_INDEX_ENABLED else None
+    if ranked is not None:
+        return ranked, "index"
+    since = dt.datetime.now() - dt.timedelta(days=days)
+    return await nearest_from_db(lat, lon, radius_km, k, since, severities), "db"
@@ -0,0 +1,504 @@
+"""
+Departamento y municipio por coordenadas: point-in-polygon local, sin red.
+
+Límites desde REGIONS_PATH (GeoJSON con Polygon/MultiPolygon por municipio;
+properties con el municipio y su departamento, ver DEPARTMENT_KEYS /
+MUNICIPALITY_KEYS). Si el archivo no está, se usa una partición aproximada:
+celdas de Voronoi de las cabeceras municipales del gazetteer recortadas al
+bbox del país. Sirve para etiquetar y filtrar, pero no son límites oficiales.
+
+Motor (PolygonIndex):
+- prefiltro por el bbox del conjunto de polígonos;
+- rejilla precalculada de REGIONS_CELL_DEG: cada celda está completamente
+  dentro de un polígono (respuesta directa, sin test), en un borde
+  (polígonos candidatos) o fuera de todos;
+- sólo en las celdas de borde se cuenta el cruce de un rayo, y únicamente
+  contra las aristas del candidato que atraviesan la franja de esa fila.
+
+Las filas de Incidentes guardan el resultado en Departamento / Municipio
+(migración 5): '' = fuera de toda región, NULL = aún sin etiquetar. Desde la
+migración 6, RegionFuente guarda la firma de los límites usados ("voronoi:…"
+o "geojson:…", hash de los polígonos): al cambiar de límites (p.ej. al
+agregar el GeoJSON oficial) el lazo re-etiqueta las filas de otra firma.
+"""
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from gazetteer import get_gazetteer, norm_key
+from migrations import SCHEMA
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+REGIONS_ENABLED      = os.getenv("REGIONS_ENABLED", "1") != "0"
+REGIONS_PATH         = os.getenv("REGIONS_PATH", os.path.join(_HERE, "data", "limites_ni.geojson"))
+REGIONS_CELL_DEG     = float(os.getenv("REGIONS_CELL_DEG", "0.02"))      # ~2.2 km
+REGIONS_TAG_INTERVAL = float(os.getenv("REGIONS_TAG_INTERVAL", "60"))    # s: etiqueta filas con Departamento NULL
+REGIONS_TAG_BATCH    = int(os.getenv("REGIONS_TAG_BATCH", "5000"))
+REGIONS_TAG_PAUSE    = float(os.getenv("REGIONS_TAG_PAUSE", "1"))        # s entre lotes (cada UPDATE es un cambio en changes.py)
+
+# nombres de propiedades habituales (propias, HDX/OCHA, GADM)
+DEPARTMENT_KEYS   = ("departamento", "department", "ADM1_ES", "NAME_1", "dpto")
+MUNICIPALITY_KEYS = ("municipio", "municipality", "ADM2_ES", "NAME_2", "name")
+
+NONE = ""   # fuera de toda región (la columna NULL queda para "sin etiquetar")
+
+SELECT_PENDING = "SELECT TOP (?) Id, Lat, Lon FROM Incidentes WHERE Departamento IS NULL"
+UPDATE_TAGS    = "UPDATE Incidentes SET Departamento = ?, Municipio = ? WHERE Id = ?"
+# esquema ≥ 6: también las etiquetadas con otros límites (o antes de existir la columna)
+SELECT_STALE   = "SELECT TOP (?) Id, Lat, Lon FROM Incidentes WHERE RegionFuente IS NULL OR RegionFuente <> ?"
+UPDATE_SOURCE  = "UPDATE Incidentes SET Departamento = ?, Municipio = ?, RegionFuente = ? WHERE Id = ?"
+
+# ── Polígonos ─────────────────────────────────────────────────────────────────
+class Region:
+    """Un municipio: anillos (exteriores y huecos) con regla par-impar, y su bbox."""
+    __slots__ = ("department", "municipality", "rings", "west", "south", "east", "north")
+
+    def __init__(self, department: str, municipality: str, rings: List[np.ndarray]):
+        self.department, self.municipality = department, municipality
+        self.rings = [r for r in rings if len(r) >= 3]
+        pts = np.concatenate(self.rings) if self.rings else np.zeros((1, 2))
+        self.west, self.south = pts.min(axis=0)
+        self.east, self.north = pts.max(axis=0)
+
+    def segments(self) -> np.ndarray:
+        """Aristas (x1, y1, x2, y2) de todos los anillos, cerrados."""
+        return np.concatenate([np.hstack([r, np.roll(r, -1, axis=0)]) for r in self.rings])
+
+def _prop(props: Dict[str, Any], keys: Sequence[str]) -> str:
+    lower = {str(k).lower(): v for k, v in props.items()}
+    for k in keys:
+        v = lower.get(k.lower())
+        if v:
+            return str(v).strip()
+    return ""
+
+def _rings(geometry: Dict[str, Any]) -> List[np.ndarray]:
+    if geometry["type"] == "Polygon":
+        polys = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polys = geometry["coordinates"]
+    else:
+        return []
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for poly in polys for ring in poly]
+
+def read_geojson(path: str) -> List[Region]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    out: List[Region] = []
+    for feat in data.get("features", []):
+        geom = feat.get("geometry")
+        if not geom:
+            continue
+        props = feat.get("properties") or {}
+        region = Region(_prop(props, DEPARTMENT_KEYS), _prop(props, MUNICIPALITY_KEYS), _rings(geom))
+        if region.rings:
+            out.append(region)
+    return out
+
+def signature(source: str, regions: List[Region]) -> str:
+    """Firma corta de un juego de límites: cambia si cambia cualquier nombre o vértice."""
+    h = hashlib.blake2b(digest_size=6)
+    for r in regions:
+        h.update(f"{r.department}|{r.municipality}|".encode())
+        for ring in r.rings:
+            h.update(np.ascontiguousarray(ring).tobytes())
+    return f"{source}:{h.hexdigest()}"
+
+def _clip(poly: np.ndarray, normal: np.ndarray, offset: float) -> np.ndarray:
+    """Sutherland–Hodgman: parte de `poly` (convexo) con normal·p <= offset."""
+    if not len(poly):
+        return poly
+    side = poly @ normal - offset
+    out: List[np.ndarray] = []
+    for i in range(len(poly)):
+        a, b = poly[i], poly[(i + 1) % len(poly)]
+        sa, sb = side[i], side[(i + 1) % len(poly)]
+        if sa <= 0:
+            out.append(a)
+        if (sa < 0 < sb) or (sb < 0 < sa):
+            out.append(a + (b - a) * (sa / (sa - sb)))
+    return np.asarray(out) if out else np.zeros((0, 2))
+
+def voronoi_regions() -> List[Region]:
+    """
+    Partición aproximada (sin archivo de límites): celda de Voronoi de cada
+    cabecera municipal del gazetteer, en coordenadas equirectangulares para
+    que coincida con "la cabecera más cercana", recortada al bbox del país.
+    """
+    gaz = get_gazetteer()
+    places = gaz.places if gaz else []
+    seats = [p for p in places if p.kind == "municipality" and p.department]
+    if not seats:
+        return []
+    country = next((p for p in places if p.kind == "country"), None)
+    if country:
+        west, south, east, north = country.west, country.south, country.east, country.north
+    else:
+        west, south = min(p.lon for p in seats) - 0.5, min(p.lat for p in seats) - 0.5
+        east, north = max(p.lon for p in seats) + 0.5, max(p.lat for p in seats) + 0.5
+    k = math.cos(math.radians((south + north) / 2))
+    pts = np.array([(p.lon * k, p.lat) for p in seats])
+    box = np.array([(west * k, south), (east * k, south), (east * k, north), (west * k, north)])
+    out: List[Region] = []
+    for i, p in enumerate(seats):
+        poly = box
+        d = np.hypot(*(pts - pts[i]).T)
+        for j in np.argsort(d)[1:]:
+            # un vecino más lejos que el doble del radio actual de la celda ya no la recorta
+            if not len(poly) or d[j] > 2 * np.hypot(*(poly - pts[i]).T).max():
+                break
+            normal = pts[j] - pts[i]
+            poly = _clip(poly, normal, normal @ (pts[i] + pts[j]) / 2)
+        if len(poly) >= 3:
+            out.append(Region(p.department, p.name, [poly / [k, 1.0]]))
+    return out
+
+# ── Índice de rejilla ─────────────────────────────────────────────────────────
+class PolygonIndex:
+    """
+    Rejilla sobre el bbox de todas las regiones:
+    - inside[fila, col]: región que cubre la celda completa, o -1;
+    - edge[celda]: regiones candidatas de una celda que cruza algún límite;
+    - bands[(región, fila)]: aristas de la región que atraviesan esa franja.
+    """
+
+    def __init__(self, regions: List[Region], cell_deg: float = REGIONS_CELL_DEG):
+        self.regions = regions
+        self.cell = cell_deg
+        self.west = min(r.west for r in regions)
+        self.south = min(r.south for r in regions)
+        self.ncols = int((max(r.east for r in regions) - self.west) / cell_deg) + 1
+        self.nrows = int((max(r.north for r in regions) - self.south) / cell_deg) + 1
+        self.inside = np.full((self.nrows, self.ncols), -1, dtype=np.int32)
+        self.bands: Dict[Tuple[int, int], Tuple[np.ndarray, ...]] = {}
+        edge: Dict[int, Set[int]] = {}
+        for ri, region in enumerate(regions):
+            self._mark_edges(ri, region.segments(), edge)
+        for ri, region in enumerate(regions):
+            self._fill(ri, region, edge)
+        self.edge: Dict[int, Tuple[int, ...]] = {c: tuple(sorted(s)) for c, s in edge.items()}
+        self.is_edge = np.zeros(self.nrows * self.ncols, dtype=bool)
+        self.is_edge[list(self.edge)] = True
+        self.is_edge = self.is_edge.reshape(self.nrows, self.ncols)
+        self.lookups = 0
+        self.polygon_tests = 0
+
+    def _row(self, lat: float) -> int:
+        return int(math.floor((lat - self.south) / self.cell))
+
+    def _col(self, lon: float) -> int:
+        return int(math.floor((lon - self.west) / self.cell))
+
+    def _mark_edges(self, ri: int, seg: np.ndarray, edge: Dict[int, Set[int]]) -> None:
+        """Celdas que atraviesa cada arista (recorte exacto por franja de fila) y aristas por franja."""
+        ymin, ymax = np.minimum(seg[:, 1], seg[:, 3]), np.maximum(seg[:, 1], seg[:, 3])
+        for row in range(self._row(ymin.min()), self._row(ymax.max()) + 1):
+            y0 = self.south + row * self.cell
+            y1 = y0 + self.cell
+            band = seg[(ymin <= y1) & (ymax >= y0)]
+            if not len(band):
+                continue
+            self.bands[(ri, row)] = tuple(np.ascontiguousarray(band[:, i]) for i in range(4))
+            ax, ay, bx, by = band.T
+            dy = by - ay
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t0 = np.where(dy != 0, (y0 - ay) / dy, 0.0)
+                t1 = np.where(dy != 0, (y1 - ay) / dy, 1.0)
+            lo = np.clip(np.minimum(t0, t1), 0.0, 1.0)
+            hi = np.clip(np.maximum(t0, t1), 0.0, 1.0)
+            xa, xb = ax + (bx - ax) * lo, ax + (bx - ax) * hi
+            c0 = np.floor((np.minimum(xa, xb) - self.west) / self.cell).astype(np.int64)
+            c1 = np.floor((np.maximum(xa, xb) - self.west) / self.cell).astype(np.int64)
+            base = row * self.ncols
+            for a, b in zip(c0.tolist(), c1.tolist()):
+                for col in range(max(a, 0), min(b, self.ncols - 1) + 1):
+                    edge.setdefault(base + col, set()).add(ri)
+
+    def _fill(self, ri: int, region: Region, edge: Dict[int, Set[int]]) -> None:
+        """Barrido por filas: la paridad de cruces a la izquierda del centro de cada celda."""
+        c0, c1 = max(self._col(region.west), 0), min(self._col(region.east), self.ncols - 1)
+        centers = self.west + (np.arange(c0, c1 + 1) + 0.5) * self.cell
+        for row in range(max(self._row(region.south), 0), min(self._row(region.north), self.nrows - 1) + 1):
+            band = self.bands.get((ri, row))
+            if band is None:
+                continue
+            xs = _crossings(band, self.south + (row + 0.5) * self.cell)
+            if not len(xs):
+                continue
+            xs.sort()
+            hit = np.flatnonzero(np.searchsorted(xs, centers) % 2 == 1)
+            base = row * self.ncols
+            for col in (hit + c0).tolist():
+                cands = edge.get(base + col)
+                if cands is None:
+                    self.inside[row, col] = ri
+                else:
+                    cands.add(ri)   # el centro está dentro, pero el borde de otra región cruza la celda
+
+    def _contains(self, ri: int, row: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Test de rayo de varios puntos de una misma fila contra las aristas de su franja."""
+        self.polygon_tests += len(x)
+        band = self.bands.get((ri, row))
+        if band is None:
+            return np.zeros(len(x), dtype=bool)
+        x1, y1, x2, y2 = band
+        yc = y[:, None]
+        m = (y1 > yc) != (y2 > yc)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xs = x1 + (yc - y1) * (x2 - x1) / (y2 - y1)
+        return (m & (xs > x[:, None])).sum(axis=1) % 2 == 1
+
+    def locate(self, lat: Sequence[float], lon: Sequence[float]) -> np.ndarray:
+        """Índice de región por punto (-1: fuera de todas o coordenada inválida)."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        out = np.full(len(lat), -1, dtype=np.int32)
+        self.lookups += len(lat)
+        with np.errstate(invalid="ignore"):
+            rows = np.floor((lat - self.south) / self.cell)
+            cols = np.floor((lon - self.west) / self.cell)
+            ok = np.flatnonzero((rows >= 0) & (rows < self.nrows) & (cols >= 0) & (cols < self.ncols))
+        r, c = rows[ok].astype(np.int64), cols[ok].astype(np.int64)
+        out[ok] = self.inside[r, c]
+        # sólo los puntos en celdas de borde llegan al test de polígono, agrupados por celda
+        pend = np.flatnonzero(self.is_edge[r, c])
+        if not len(pend):
+            return out
+        keys = r[pend] * self.ncols + c[pend]
+        order = np.argsort(keys, kind="stable")
+        for group in np.split(order, np.flatnonzero(np.diff(keys[order])) + 1):
+            key = int(keys[group[0]])
+            left = ok[pend[group]]
+            for ri in self.edge[key]:
+                hit = self._contains(ri, key // self.ncols, lon[left], lat[left])
+                out[left[hit]] = ri
+                left = left[~hit]
+                if not len(left):
+                    break
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        inside = int((self.inside >= 0).sum())
+        return {"regions": len(self.regions), "cell_deg": self.cell, "grid": [self.nrows, self.ncols],
+                "cells_inside": inside, "cells_edge": len(self.edge),
+                "lookups": self.lookups, "polygon_tests": self.polygon_tests}
+
+def _crossings(band: Tuple[np.ndarray, ...], y: float) -> np.ndarray:
+    """x donde la recta horizontal y corta las aristas (semiabierto: un vértice cuenta una vez)."""
+    x1, y1, x2, y2 = band
+    m = (y1 > y) != (y2 > y)
+    return x1[m] + (y - y1[m]) * (x2[m] - x1[m]) / (y2[m] - y1[m])
+
+# ── Etiquetado ────────────────────────────────────────────────────────────────
+class RegionTagger:
+    """
+    Departamento/municipio para las altas (create_incident, importación
+    masiva), nombres canónicos para los filtros de /incidents, y un lazo que
+    etiqueta las filas que quedaron con Departamento NULL (altas de workers
+    anteriores a la migración o escritas fuera de la API).
+    """
+
+    def __init__(self, path: str = REGIONS_PATH, cell_deg: float = REGIONS_CELL_DEG):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._index: Optional[PolygonIndex] = None
+        self.source: Optional[str] = None
+        self.signature: Optional[str] = None
+        self.load_error: Optional[str] = None
+        self.build_s: Optional[float] = None
+        self._departments: Dict[str, str] = {}
+        self._municipalities: Dict[str, str] = {}
+        self._centers: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.tagged = 0
+        self.errors = 0
+
+    # ---- carga ----
+    def load(self) -> PolygonIndex:
+        t0 = time.perf_counter()
+        if os.path.exists(self.path):
+            regions, source = read_geojson(self.path), "geojson"
+        else:
+            regions, source = voronoi_regions(), "voronoi"
+        if not regions:
+            raise RuntimeError(f"Sin regiones: falta {self.path} y el gazetteer no tiene municipios")
+        self._canonicalize(regions)
+        index = PolygonIndex(regions, self.cell_deg)
+        self._index, self.source, self.signature = index, source, signature(source, regions)
+        self.build_s = round(time.perf_counter() - t0, 3)
+        return index
+
+    def _canonicalize(self, regions: List[Region]) -> None:
+        """Nombres del GeoJSON → nombres del gazetteer (mismas claves que /stats y el geocoder)."""
+        gaz = get_gazetteer()
+        known: Dict[str, str] = {}
+        centers: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for p in (gaz.places if gaz else []):
+            if p.kind in ("department", "municipality"):
+                known.setdefault(norm_key(p.name), p.name)
+                centers[(p.kind, norm_key(p.name))] = {"lat": p.lat, "lon": p.lon}
+        self._departments, self._municipalities, self._centers = {}, {}, {}
+        for r in regions:
+            r.department = known.get(norm_key(r.department), r.department)
+            r.municipality = known.get(norm_key(r.municipality), r.municipality)
+            if r.department:
+                dkey = norm_key(r.department)
+                self._departments[dkey] = r.department
+                self._centers.setdefault(("department", r.department), centers.get(("department", dkey)) or
+                                         {"lat": (r.south + r.north) / 2, "lon": (r.west + r.east) / 2})
+            if r.municipality:
+                self._municipalities[norm_key(r.municipality)] = r.municipality
+                self._centers.setdefault(("municipality", r.municipality),
+                                         centers.get(("municipality", norm_key(r.municipality))) or
+                                         {"lat": (r.south + r.north) / 2, "lon": (r.west + r.east) / 2})
+
+    def _loaded(self) -> PolygonIndex:
+        # la app carga en el lifespan (start); cargar aquí sólo lo hacen la CLI y las migraciones
+        if self._index is not None:
+            return self._index
+        if self.load_error:
+            raise RuntimeError(self.load_error)
+        return self.load()
+
+    @property
+    def index(self) -> PolygonIndex:
+        return self._loaded()
+
+    # ---- consulta ----
+    def tag(self, lat: Sequence[float], lon: Sequence[float]) -> Tuple[List[str], List[str]]:
+        """(departamentos, municipios) por punto; NONE fuera de toda región."""
+        index = self.index
+        regions = index.regions
+        found = index.locate(lat, lon)
+        deps = [regions[i].department if i >= 0 else NONE for i in found.tolist()]
+        muns = [regions[i].municipality if i >= 0 else NONE for i in found.tolist()]
+        return deps, muns
+
+    def tag_one(self, lat: float, lon: float) -> Tuple[str, str]:
+        deps, muns = self.tag([lat], [lon])
+        return deps[0], muns[0]
+
+    def tag_params(self, rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        """Lote de la importación masiva (…, lat, lon, fecha) → mismas tuplas + (departamento, municipio)."""
+        deps, muns = self.tag([r[4] for r in rows], [r[5] for r in rows])
+        return [(*r, d, m) for r, d, m in zip(rows, deps, muns)]
+
+    def tag_params_source(self, rows: List[Tuple[Any, ...]]) -> List[Tuple[Any, ...]]:
+        """Como tag_params, + la firma de los límites (esquema ≥ 6)."""
+        return [(*r, self.signature) for r in self.tag_params(rows)]
+
+    def department(self, name: str) -> Optional[str]:
+        """Nombre canónico de un departamento (sin acentos ni mayúsculas), o None si no existe."""
+        self._loaded()
+        return self._departments.get(norm_key(name))
+
+    def municipality(self, name: str) -> Optional[str]:
+        self._loaded()
+        return self._municipalities.get(norm_key(name))
+
+    def center(self, department: Optional[str] = None, municipality: Optional[str] = None) -> Optional[Dict[str, float]]:
+        if municipality:
+            return self._centers.get(("municipality", municipality))
+        return self._centers.get(("department", department)) if department else None
+
+    # ---- filas sin etiqueta ----
+    def fill_pending(self, cur: Any, batch: int = REGIONS_TAG_BATCH) -> int:
+        """
+        Etiqueta en lotes por Id todas las filas con Departamento NULL usando
+        un cursor ya abierto (migración 5: corre antes de crear los índices).
+        """
+        cur.fast_executemany = True
+        last, total = None, 0
+        while True:
+            if last is None:
+                cur.execute(SELECT_PENDING + " ORDER BY Id", [batch])
+            else:
+                cur.execute(SELECT_PENDING + " AND Id > ? ORDER BY Id", [batch, last])
+            rows = cur.fetchall()
+            if not rows:
+                return total
+            cur.executemany(UPDATE_TAGS, self._updates(rows))
+            total += len(rows)
+            last = rows[-1][0]
+
+    def _updates(self, rows: Sequence[Sequence[Any]], source: bool = False) -> List[Tuple[Any, ...]]:
+        lat = [float(r[1]) if r[1] is not None else math.nan for r in rows]
+        lon = [float(r[2]) if r[2] is not None else math.nan for r in rows]
+        deps, muns = self.tag(lat, lon)
+        if source:
+            return [(d, m, self.signature, r[0]) for r, d, m in zip(rows, deps, muns)]
+        return [(d, m, r[0]) for r, d, m in zip(rows, deps, muns)]
+
+    async def tag_pending(self, batch: int = REGIONS_TAG_BATCH) -> int:
+        """
+        Un lote de filas sin etiquetar o, con el esquema ≥ 6, etiquetadas con
+        otros límites (índice por Departamento / RegionFuente).
+        """
+        from db_async import aexecutemany, aquery_rows
+        if not SCHEMA.regions:
+            return 0
+        if SCHEMA.region_source:
+            rows = await aquery_rows(SELECT_STALE, (batch, self.signature))
+            if rows:
+                await aexecutemany(UPDATE_SOURCE, self._updates(rows, source=True))
+        else:
+            rows = await aquery_rows(SELECT_PENDING, (batch,))
+            if rows:
+                await aexecutemany(UPDATE_TAGS, self._updates(rows))
+        self.tagged += len(rows)
+        return len(rows)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                while await self.tag_pending() == REGIONS_TAG_BATCH:
+                    await asyncio.sleep(REGIONS_TAG_PAUSE)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+            await asyncio.sleep(REGIONS_TAG_INTERVAL)
+
+    async def start(self) -> None:
+        """
+        Arma la rejilla fuera del event loop (decenas a cientos de ms) y lanza
+        el lazo de etiquetado. El lifespan la espera: tag_one/department nunca
+        cargan los límites dentro de una petición.
+        """
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            self.errors += 1
+            self.load_error = str(e)
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def schedule_start(self) -> None:
+        task = asyncio.get_running_loop().create_task(self.start())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"enabled": REGIONS_ENABLED, "source": self.source, "signature": self.signature,
+                               "build_s": self.build_s, "tagged": self.tagged, "errors": self.errors,
+                               "load_error": self.load_error}
+        if self._index is not None:
+            out.update(self._index.stats())
+        return out
+
+REGIONS = RegionTagger()
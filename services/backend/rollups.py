@@ -0,0 +1,632 @@
+import os
+import sys
+import time
+import bisect
+import asyncio
+import argparse
+import datetime as dt
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import db
+from db_async import aexecute, aexecutemany, aquery_rows, arun, ascalar, astream
+from regions import REGIONS
+from serializers import ID, SEVERIDAD, TIPO, LAT, LON, FECHA, normalize_severity
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+STATS_ENABLED       = os.getenv("STATS_ENABLED", "1") != "0"
+STATS_HOURLY_DAYS   = int(os.getenv("STATS_HOURLY_DAYS", "14"))      # retención del grano horario
+STATS_REFRESH       = float(os.getenv("STATS_REFRESH", "30"))        # s: relee los últimos días (altas de otros workers)
+STATS_FULL_REFRESH  = float(os.getenv("STATS_FULL_REFRESH", "600"))  # s: relectura completa de los resúmenes
+STATS_BATCH_SIZE    = int(os.getenv("STATS_BATCH_SIZE", "5000"))
+STATS_MAX_BUCKETS   = int(os.getenv("STATS_MAX_BUCKETS", "2000"))    # puntos máximos de una serie
+STATS_AUTO_REBUILD  = os.getenv("STATS_AUTO_REBUILD", "1") != "0"    # al arrancar, si faltan o están detrás de la marca
+STATS_REBUILD_LEASE = float(os.getenv("STATS_REBUILD_LEASE", "3600"))  # s que un worker retiene el turno de reconstruir
+
+# versión del cálculo de los resúmenes: subirla fuerza una reconstrucción al arrancar
+STATS_VERSION = 1
+
+UNKNOWN_DEPARTMENT = "Sin asignar"
+BUCKETS = ("hour", "day", "week")
+DEFAULT_SPAN = {"hour": dt.timedelta(hours=48), "day": dt.timedelta(days=30), "week": dt.timedelta(weeks=26)}
+
+# Un resumen por grano: (Periodo, Severidad, Tipo, Departamento) → Total.
+# Las semanas se suman desde el grano diario. rebuild() escribe en las *Nueva
+# y las intercambia con las vigentes en una sola transacción.
+TABLES = {"hour": "ResumenHora", "day": "ResumenDia"}
+STAGING = {"hour": "ResumenHoraNueva", "day": "ResumenDiaNueva"}
+COLUMNS = "Periodo, Severidad, Tipo, Departamento, Total"
+
+SCHEMA_MSSQL = """
+IF OBJECT_ID('dbo.{table}', 'U') IS NULL
+    CREATE TABLE dbo.{table} (
+        Periodo      DATETIME2(0)  NOT NULL,
+        Severidad    NVARCHAR(16)  NOT NULL,
+        Tipo         NVARCHAR(64)  NOT NULL,
+        Departamento NVARCHAR(64)  NOT NULL,
+        Total        INT           NOT NULL,
+        CONSTRAINT PK_{table} PRIMARY KEY (Periodo, Severidad, Tipo, Departamento)
+    );
+"""
+
+# Una fila: versión del cálculo, marca de agua (MaxId: mayor Id de Incidentes
+# contado por la última reconstrucción) y turno de reconstrucción entre workers.
+STATE_MSSQL = """
+IF OBJECT_ID('dbo.ResumenEstado', 'U') IS NULL
+    CREATE TABLE dbo.ResumenEstado (
+        Id           INT           NOT NULL PRIMARY KEY,
+        Version      INT           NOT NULL,
+        MaxId        BIGINT        NULL,
+        Reconstruido DATETIME2(0)  NULL,
+        Bloqueo      DATETIME2(0)  NULL
+    );
+IF NOT EXISTS (SELECT 1 FROM dbo.ResumenEstado WHERE Id = 1)
+    INSERT INTO dbo.ResumenEstado (Id, Version) VALUES (1, 0);
+"""
+
+# Transacción que bloquea la fila de estado: serializa los upserts de record()
+# con el intercambio de rebuild() (SQLite bloquea toda la BD con IMMEDIATE).
+if db.DB_BACKEND.startswith("sqlite:"):
+    BEGIN_LOCKED = "BEGIN IMMEDIATE"
+    STATE_LOCK   = "SELECT MaxId FROM ResumenEstado WHERE Id = 1"
+else:
+    BEGIN_LOCKED = "BEGIN TRANSACTION"
+    STATE_LOCK   = "SELECT MaxId FROM ResumenEstado WITH (UPDLOCK, HOLDLOCK) WHERE Id = 1"
+
+Key = Tuple[str, str, str]                 # (severidad, tipo, departamento)
+Delta = Tuple[str, dt.datetime, Key]       # (grano, periodo, clave)
+
+def floor_hour(ts: dt.datetime) -> dt.datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def floor_day(ts: dt.datetime) -> dt.datetime:
+    return dt.datetime(ts.year, ts.month, ts.day)
+
+def floor_week(ts: dt.datetime) -> dt.datetime:
+    d = floor_day(ts)
+    return d - dt.timedelta(days=d.weekday())   # lunes
+
+FLOOR = {"hour": floor_hour, "day": floor_day, "week": floor_week}
+STEP = {"hour": dt.timedelta(hours=1), "day": dt.timedelta(days=1), "week": dt.timedelta(weeks=1)}
+
+def _as_datetime(value: Any) -> dt.datetime:
+    if isinstance(value, dt.datetime):
+        return value
+    if isinstance(value, dt.date):
+        return dt.datetime(value.year, value.month, value.day)
+    return dt.datetime.now()
+
+def _tipo(value: Any) -> str:
+    return str(value or "general").strip().lower()
+
+# ── SQL (corren en el executor de BD, con un cursor ya abierto) ───────────────
+def _lock_state(cur: Any) -> Optional[int]:
+    """Abre la transacción bloqueando ResumenEstado; devuelve la marca de agua (MaxId)."""
+    cur.execute(BEGIN_LOCKED)
+    cur.execute(STATE_LOCK)
+    row = cur.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+def _rollback(cur: Any) -> None:
+    try:
+        cur.execute("ROLLBACK")
+    except Exception:
+        pass   # la BD ya deshizo la transacción (p.ej. víctima de un interbloqueo)
+
+def _upsert(cur: Any, deltas: Counter, tables: Dict[str, str]) -> None:
+    for (grain, period, (sev, tipo, dep)), n in deltas.items():
+        table = tables[grain]
+        upd = (f"UPDATE {table} SET Total = Total + ? "
+               f"WHERE Periodo = ? AND Severidad = ? AND Tipo = ? AND Departamento = ?")
+        cur.execute(upd, [n, period, sev, tipo, dep])
+        if cur.rowcount:
+            continue
+        try:
+            cur.execute(f"INSERT INTO {table} ({COLUMNS}) VALUES (?, ?, ?, ?, ?)", [period, sev, tipo, dep, n])
+        except Exception:
+            # otro worker insertó la misma clave entre el UPDATE y el INSERT
+            cur.execute(upd, [n, period, sev, tipo, dep])
+
+# ── Resumen en memoria ────────────────────────────────────────────────────────
+class _Grain:
+    """Periodo → {clave: total}, con los periodos ordenados para recorrer rangos con bisect."""
+
+    def __init__(self):
+        self.cells: Dict[dt.datetime, Dict[Key, int]] = {}
+        self.periods: List[dt.datetime] = []
+
+    def add(self, period: dt.datetime, key: Key, n: int) -> None:
+        bucket = self.cells.get(period)
+        if bucket is None:
+            bucket = self.cells[period] = {}
+            bisect.insort(self.periods, period)
+        bucket[key] = bucket.get(key, 0) + n
+
+    def replace_since(self, since: Optional[dt.datetime], rows: Iterable[Sequence[Any]]) -> None:
+        """Sustituye los periodos ≥ since (todos si since es None) por las filas leídas de la BD."""
+        if since is None:
+            self.cells, self.periods = {}, []
+        else:
+            cut = bisect.bisect_left(self.periods, since)
+            for p in self.periods[cut:]:
+                del self.cells[p]
+            del self.periods[cut:]
+        for periodo, sev, tipo, dep, total in rows:
+            self.add(_as_datetime(periodo), (sev, tipo, dep), int(total))
+
+    def drop_before(self, limit: dt.datetime) -> None:
+        cut = bisect.bisect_left(self.periods, limit)
+        for p in self.periods[:cut]:
+            del self.cells[p]
+        del self.periods[:cut]
+
+    def range(self, start: dt.datetime, end: dt.datetime) -> Iterable[Tuple[dt.datetime, Dict[Key, int]]]:
+        lo = bisect.bisect_left(self.periods, start)
+        hi = bisect.bisect_left(self.periods, end)
+        for p in self.periods[lo:hi]:
+            yield p, self.cells[p]
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self.cells.values())
+
+class StatsRollups:
+    """
+    Estadísticas de incidentes pre-agregadas (Reportes → Estadísticas).
+    - Tablas ResumenHora / ResumenDia en la BD (compartidas por los workers),
+      actualizadas al insertar (create_incident, importación masiva) con upserts.
+    - Copia en memoria que responde /stats recorriendo sólo los periodos del
+      rango pedido: el coste no depende del tamaño de Incidentes.
+    - rebuild(): recalcula todo desde Incidentes (lote, en streaming). Corre
+      sola al arrancar si los resúmenes nunca se construyeron, si la versión
+      del cálculo cambió o si la marca de agua no corresponde a la tabla; a
+      mano con POST /stats/rebuild o `python rollups.py rebuild`.
+    """
+
+    def __init__(self, hourly_days: int = STATS_HOURLY_DAYS):
+        self.hourly_days = hourly_days
+        self.grains = {"hour": _Grain(), "day": _Grain()}
+        self.loaded_at: Optional[float] = None
+        self._full_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._rebuilding = False
+        self.recorded = 0
+        self.skipped = 0
+        self.watermark: Optional[int] = None
+        self._rebuilt_at: Optional[dt.datetime] = None
+        self.last_rebuild: Optional[Dict[str, Any]] = None
+
+    def _hour_cutoff(self) -> dt.datetime:
+        return floor_day(dt.datetime.now()) - dt.timedelta(days=self.hourly_days)
+
+    # ---- deltas ----
+    def _deltas(self, items: Iterable[Tuple[Any, ...]]) -> Counter:
+        """
+        (severidad, tipo, lat, lon, fecha[, departamento]) → Counter[(grano, periodo, clave)].
+        Sin departamento (filas ya guardadas) se calcula con regions.REGIONS, el
+        mismo point-in-polygon que etiqueta las altas.
+        """
+        items = list(items)
+        if not items:
+            return Counter()
+        if len(items[0]) > 5:
+            deps = [it[5] for it in items]
+        else:
+            deps = REGIONS.tag([it[2] for it in items], [it[3] for it in items])[0]
+        cutoff = self._hour_cutoff()
+        out: Counter = Counter()
+        dims: Dict[Tuple[Any, Any], Tuple[str, str]] = {}   # (severidad, tipo) crudos → normalizados
+        for (sev, tipo, _, _, fecha, *_), dep in zip(items, deps):
+            dep = dep or UNKNOWN_DEPARTMENT
+            ts = _as_datetime(fecha)
+            d = dims.get((sev, tipo))
+            if d is None:
+                d = dims[(sev, tipo)] = (normalize_severity(str(sev or "")), _tipo(tipo))
+            key = (d[0], d[1], dep)
+            out[("day", floor_day(ts), key)] += 1
+            if ts >= cutoff:
+                out[("hour", floor_hour(ts), key)] += 1
+        return out
+
+    @staticmethod
+    def _persist(deltas: Counter, row_id: Optional[int] = None) -> bool:
+        """
+        Upsert de los incrementos en una transacción que bloquea ResumenEstado
+        (corre en el executor de BD). Una fila con Id ≤ MaxId ya la contó una
+        reconstrucción terminada mientras se insertaba: no se suma otra vez.
+        Los lotes de la importación masiva van por _insert_persist().
+        """
+        with db.get_pool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                watermark = _lock_state(cur)
+                try:
+                    apply = row_id is None or watermark is None or int(row_id) > watermark
+                    if apply:
+                        _upsert(cur, deltas, TABLES)
+                    cur.execute("COMMIT")
+                except Exception:
+                    _rollback(cur)
+                    raise
+                return apply
+            finally:
+                cur.close()
+
+    def _apply(self, deltas: Counter) -> None:
+        for (grain, period, key), n in deltas.items():
+            self.grains[grain].add(period, key, n)
+
+    async def record(self, row: Sequence[Any]) -> None:
+        """Fila recién insertada (orden INCIDENT_COLUMNS)."""
+        await self.record_many([(row[SEVERIDAD], row[TIPO], float(row[LAT]), float(row[LON]), row[FECHA])],
+                               row_id=row[ID])
+
+    async def record_many(self, items: List[Tuple[Any, ...]], row_id: Optional[int] = None) -> None:
+        deltas = self._deltas(items)
+        if not deltas:
+            return
+        if not await arun(self._persist, deltas, row_id):
+            self.skipped += len(items)
+            return
+        self._apply(deltas)
+        self.recorded += len(items)
+
+    def _param_deltas(self, rows: List[Tuple[Any, ...]]) -> Counter:
+        """
+        Filas de la importación masiva: (título, descripción, severidad, tipo, lat, lon, fecha|None
+        [, departamento, municipio[, fuente]]) — con el esquema ≥ 5 ya traen su departamento.
+        """
+        now = dt.datetime.now()
+        return self._deltas([(r[2], r[3], float(r[4]), float(r[5]), r[6] or now, *r[7:8]) for r in rows])
+
+    @staticmethod
+    def _insert_persist(sql: str, rows: List[Tuple[Any, ...]], deltas: Counter) -> int:
+        """
+        INSERT del lote y upsert de sus incrementos en la misma transacción que
+        bloquea ResumenEstado. Un lote de la importación no trae sus Id; así
+        _swap() lo ve entero (y lo suma como fila tardía) o no lo ve (y lo suma
+        este upsert), nunca las dos cosas.
+        """
+        with db.get_pool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                _lock_state(cur)
+                try:
+                    cur.fast_executemany = True
+                    cur.executemany(sql, [list(p) for p in rows])
+                    n = cur.rowcount
+                    _upsert(cur, deltas, TABLES)
+                    cur.execute("COMMIT")
+                except Exception:
+                    _rollback(cur)
+                    raise
+                return n
+            finally:
+                cur.close()
+
+    async def insert_params(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        """Inserta un lote de la importación masiva y lo suma a los resúmenes (ver _insert_persist)."""
+        deltas = self._param_deltas(rows)
+        n = await arun(self._insert_persist, sql, rows, deltas)
+        self._apply(deltas)
+        self.recorded += len(rows)
+        return n
+
+    def insert_params_sync(self, sql: str, rows: List[Tuple[Any, ...]]) -> int:
+        """Igual que insert_params, para la CLI de importación (sin event loop)."""
+        return self._insert_persist(sql, rows, self._param_deltas(rows))
+
+    # ---- carga ----
+    async def ensure_schema(self) -> None:
+        # en SQLite (DB_BACKEND=sqlite:…) las tablas las crea db_sqlite.SCHEMA
+        if not db.DB_BACKEND.startswith("sqlite:"):
+            for table in (*TABLES.values(), *STAGING.values()):
+                await aexecute(SCHEMA_MSSQL.format(table=table))
+            await aexecute(STATE_MSSQL)
+
+    async def _state(self) -> Tuple[int, Optional[int], Optional[dt.datetime]]:
+        """(versión, marca de agua, fecha de la última reconstrucción) de ResumenEstado."""
+        rows = await aquery_rows("SELECT Version, MaxId, Reconstruido FROM ResumenEstado WHERE Id = 1")
+        if not rows:
+            return 0, None, None
+        version, watermark, rebuilt = rows[0]
+        self.watermark = int(watermark) if watermark is not None else None
+        return int(version or 0), self.watermark, rebuilt
+
+    async def needs_rebuild(self) -> bool:
+        """
+        Sí, si hay incidentes y los resúmenes nunca se reconstruyeron (BD con
+        historia anterior a los resúmenes), si cambió STATS_VERSION o si la
+        marca de agua pasa del último Id (tabla restaurada o vaciada).
+        """
+        top = await ascalar("SELECT MAX(Id) FROM Incidentes")
+        if top is None:
+            return False
+        version, watermark, _ = await self._state()
+        return version < STATS_VERSION or watermark is None or watermark > int(top)
+
+    async def load(self, since: Optional[dt.datetime] = None) -> None:
+        """Relee los resúmenes (desde `since`, o completos) de la BD a memoria."""
+        for grain, table in TABLES.items():
+            start = since
+            if grain == "hour":
+                start = max(since, self._hour_cutoff()) if since else self._hour_cutoff()
+            sql = f"SELECT Periodo, Severidad, Tipo, Departamento, Total FROM {table}"
+            rows = await aquery_rows(sql + " WHERE Periodo >= ?", (start,)) if start else await aquery_rows(sql)
+            g = self.grains[grain]
+            g.replace_since(start if since else None, rows)
+            if grain == "hour":
+                g.drop_before(self._hour_cutoff())
+        self.loaded_at = time.monotonic()
+        if since is None:
+            self._full_at = self.loaded_at
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(STATS_REFRESH)
+            try:
+                _, _, rebuilt = await self._state()
+                if rebuilt != self._rebuilt_at:
+                    # otro worker reconstruyó: relectura completa
+                    self._rebuilt_at = rebuilt
+                    await self.load()
+                elif time.monotonic() - self._full_at >= STATS_FULL_REFRESH:
+                    await self.load()
+                    await aexecute(f"DELETE FROM {TABLES['hour']} WHERE Periodo < ?", (self._hour_cutoff(),))
+                else:
+                    await self.load(floor_day(dt.datetime.now()) - dt.timedelta(days=1))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    async def start(self) -> None:
+        await self.ensure_schema()
+        _, _, self._rebuilt_at = await self._state()
+        await self.load()
+        if STATS_AUTO_REBUILD and await self.needs_rebuild():
+            await self.rebuild()
+
+    def schedule_start(self) -> None:
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self.start())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._task = loop.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    # ---- lote ----
+    @staticmethod
+    def _claim() -> Optional[int]:
+        """
+        Toma el turno de reconstruir (uno a la vez entre workers; vence a los
+        STATS_REBUILD_LEASE s si el dueño murió), vacía las *Nueva y devuelve
+        el corte = MAX(Id) actual. None si otro worker tiene el turno.
+        """
+        now = dt.datetime.now()
+        with db.get_pool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("UPDATE ResumenEstado SET Bloqueo = ? WHERE Id = 1 AND (Bloqueo IS NULL OR Bloqueo < ?)",
+                            [now + dt.timedelta(seconds=STATS_REBUILD_LEASE), now])
+                if cur.rowcount != 1:
+                    return None
+                for table in STAGING.values():
+                    cur.execute(f"DELETE FROM {table}")
+                cur.execute("SELECT COALESCE(MAX(Id), 0) FROM Incidentes")
+                return int(cur.fetchone()[0])
+            finally:
+                cur.close()
+
+    @staticmethod
+    def _release() -> None:
+        db.execute("UPDATE ResumenEstado SET Bloqueo = NULL WHERE Id = 1")
+
+    def _swap(self, cut: int) -> Tuple[int, int]:
+        """
+        Con ResumenEstado bloqueada (record() espera): suma a las *Nueva las
+        filas insertadas después del corte, reemplaza los resúmenes vigentes y
+        guarda la marca de agua. Devuelve (filas tardías, marca de agua).
+        """
+        with db.get_pool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                _lock_state(cur)
+                try:
+                    cur.execute("SELECT Severidad, Tipo, Lat, Lon, Fecha, Id FROM Incidentes WHERE Id > ?", [cut])
+                    late = cur.fetchall()
+                    watermark = max([cut, *(int(r[5]) for r in late)])
+                    _upsert(cur, self._deltas([(r[0], r[1], float(r[2]), float(r[3]), r[4]) for r in late]), STAGING)
+                    for grain, table in TABLES.items():
+                        cur.execute(f"DELETE FROM {table}")
+                        cur.execute(f"INSERT INTO {table} ({COLUMNS}) SELECT {COLUMNS} FROM {STAGING[grain]}")
+                        cur.execute(f"DELETE FROM {STAGING[grain]}")
+                    cur.execute("UPDATE ResumenEstado SET Version = ?, MaxId = ?, Reconstruido = ?, Bloqueo = NULL "
+                                "WHERE Id = 1", [STATS_VERSION, watermark, dt.datetime.now().replace(microsecond=0)])
+                    cur.execute("COMMIT")
+                except Exception:
+                    _rollback(cur)
+                    raise
+                return len(late), watermark
+            finally:
+                cur.close()
+
+    async def rebuild(self) -> Dict[str, Any]:
+        """
+        Recalcula ambos resúmenes desde Incidentes sin perder ni duplicar las
+        altas que llegan mientras tanto:
+        1. toma el turno y fija el corte (MAX(Id)),
+        2. agrega en streaming las filas con Id ≤ corte y las escribe en las *Nueva,
+        3. _swap: suma las filas posteriores al corte e intercambia las tablas en
+           una transacción; las altas con Id ≤ marca de agua que se registren
+           después se omiten (ya están contadas).
+        """
+        if self._rebuilding:
+            return self.stats()
+        self._rebuilding = True
+        t0 = time.perf_counter()
+        try:
+            cut = await arun(self._claim)
+            if cut is None:
+                self.last_rebuild = {"skipped": "otro worker está reconstruyendo"}
+                return self.stats()
+            try:
+                totals: Counter = Counter()
+                batch: List[Tuple[Any, Any, float, float, Any]] = []
+                n = 0
+                async for r in astream("SELECT Severidad, Tipo, Lat, Lon, Fecha FROM Incidentes WHERE Id <= ?",
+                                       (cut,), STATS_BATCH_SIZE):
+                    batch.append((r[0], r[1], float(r[2]), float(r[3]), r[4]))
+                    if len(batch) >= STATS_BATCH_SIZE:
+                        totals.update(self._deltas(batch))
+                        n += len(batch)
+                        batch = []
+                totals.update(self._deltas(batch))
+                n += len(batch)
+                t_read = time.perf_counter()
+
+                for grain, table in STAGING.items():
+                    rows = [(p, k[0], k[1], k[2], c) for (g, p, k), c in totals.items() if g == grain]
+                    for i in range(0, len(rows), STATS_BATCH_SIZE):
+                        await aexecutemany(f"INSERT INTO {table} ({COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                                           rows[i:i + STATS_BATCH_SIZE])
+                late, self.watermark = await arun(self._swap, cut)
+            except BaseException:
+                await arun(self._release)   # suelta el turno: otro worker (o un reintento) puede reconstruir
+                raise
+            self.last_rebuild = {
+                "rows": n + late,
+                "late_rows": late,
+                "cells": len(totals),
+                "watermark": self.watermark,
+                "read_s": round(t_read - t0, 2),
+                "write_s": round(time.perf_counter() - t_read, 2),
+            }
+        finally:
+            self._rebuilding = False
+        _, _, self._rebuilt_at = await self._state()
+        await self.load()
+        return self.stats()
+
+    def schedule_rebuild(self) -> None:
+        if self._rebuilding:
+            return
+        task = asyncio.get_running_loop().create_task(self.rebuild())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # ---- consulta ----
+    def query(self, bucket: str = "day", start: Optional[dt.datetime] = None, end: Optional[dt.datetime] = None,
+              severities: Optional[Set[str]] = None, types: Optional[Set[str]] = None,
+              departments: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """
+        Totales por severidad/tipo/departamento y serie temporal (hour|day|week)
+        en [start, end). La serie trae un objeto por periodo con `total` y una
+        clave por severidad (formato directo para Recharts), con ceros en los huecos.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket debe ser uno de {', '.join(BUCKETS)}")
+        floor, step = FLOOR[bucket], STEP[bucket]
+        end = floor(end or dt.datetime.now()) + step
+        start = floor(start) if start else end - DEFAULT_SPAN[bucket]
+        if bucket == "hour":
+            start = max(start, self._hour_cutoff())
+        if start >= end:
+            raise ValueError("rango vacío")
+        if (end - start) / step > STATS_MAX_BUCKETS:
+            raise ValueError(f"demasiados periodos (máx. {STATS_MAX_BUCKETS}); usa un bucket mayor")
+
+        grain = self.grains["hour" if bucket == "hour" else "day"]
+        filtered = bool(severities or types or departments)
+        series: Dict[dt.datetime, Counter] = {}
+        by_sev: Counter = Counter()
+        by_type: Counter = Counter()
+        by_dep: Counter = Counter()
+        for period, cells in grain.range(start, end):
+            point = series.get(floor(period))
+            if point is None:
+                point = series[floor(period)] = Counter()
+            for (sev, tipo, dep), n in cells.items():
+                if filtered and ((severities and sev not in severities) or (types and tipo not in types)
+                                 or (departments and dep not in departments)):
+                    continue
+                point[sev] += n
+                by_sev[sev] += n
+                by_type[tipo] += n
+                by_dep[dep] += n
+
+        out_series: List[Dict[str, Any]] = []
+        p = start
+        while p < end:
+            c = series.get(p, Counter())
+            out_series.append({"period": p.isoformat() if bucket == "hour" else p.date().isoformat(),
+                               "total": sum(c.values()), **c})
+            p += step
+        return {
+            "bucket": bucket,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "total": sum(by_sev.values()),
+            "by_severity": dict(by_sev.most_common()),
+            "by_type": dict(by_type.most_common()),
+            "by_department": dict(by_dep.most_common()),
+            "series": out_series,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": STATS_ENABLED,
+            "loaded": self.loaded_at is not None,
+            "age_s": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            "cells": {g: len(v) for g, v in self.grains.items()},
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "watermark": self.watermark,
+            "rebuilding": self._rebuilding,
+            "last_rebuild": self.last_rebuild,
+        }
+
+STATS = StatsRollups()
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Resúmenes de estadísticas (ResumenHora / ResumenDia).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="versión, marca de agua y tamaño de los resúmenes")
+    rb = sub.add_parser("rebuild", help="recalcula los resúmenes desde Incidentes")
+    rb.add_argument("--if-needed", action="store_true",
+                    help="sólo si nunca se construyeron, cambió la versión o la marca no corresponde")
+    args = ap.parse_args(argv)
+
+    async def run() -> int:
+        await STATS.ensure_schema()
+        if args.cmd == "status":
+            version, watermark, rebuilt = await STATS._state()
+            await STATS.load()
+            print(f"versión {version} (código {STATS_VERSION}), marca de agua {watermark}, "
+                  f"reconstruido {rebuilt or 'nunca'}, celdas {STATS.stats()['cells']}")
+            return 0
+        if args.if_needed and not await STATS.needs_rebuild():
+            print("Los resúmenes están al día.")
+            return 0
+        out = await STATS.rebuild()
+        last = out["last_rebuild"] or {}
+        if "skipped" in last:
+            print(f"No se reconstruyó: {last['skipped']}", file=sys.stderr)
+            return 2
+        print(f"{last['rows']} incidentes ({last['late_rows']} durante la lectura) → {last['cells']} celdas; "
+              f"lectura {last['read_s']}s, escritura {last['write_s']}s; marca de agua {last['watermark']}")
+        return 0
+
+    try:
+        return asyncio.run(run())
+    finally:
+        db.close_pool()
+
+if __name__ == "__main__":
+    sys.exit(main())
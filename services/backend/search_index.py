@@ -0,0 +1,586 @@
+"""
+Buscador local de GET /search: índice invertido con ranking BM25.
+
+Documentos: incidentes (Titulo/Descripcion), consejos de prevención y artículos
+locales (data/search_corpus.json). Cada documento tiene sección (incidentes,
+prevencion, articulos) e ítem (tipo de incidente, riesgo o tema) para acotar.
+
+- Tokens sin acentos (norm_text, igual que el asistente); el último término de
+  la consulta se expande por prefijo (type-ahead).
+- Segmento base congelado en arrays; se guarda como snapshot en disco
+  (SEARCH_SNAPSHOT_PATH) y al arrancar se abre con mmap, sin reconstruir.
+  Con varios workers sólo uno lo construye y escribe (turno en
+  SEARCH_SNAPSHOT_PATH.lock); los demás esperan y abren el suyo. Al abrirlo
+  se validan tamaños y offsets: un snapshot mezclado se descarta.
+- Segmento delta en memoria: altas de create_incident y las filas de la BD
+  posteriores al snapshot.
+"""
+import os
+import re
+import json
+import math
+import mmap
+import time
+import shutil
+import bisect
+import asyncio
+import datetime as dt
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from intents import norm_text
+from serializers import INCIDENT_SELECT, ID, TITULO, DESCRIPCION, SEVERIDAD, TIPO, FECHA, normalize_severity
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+SEARCH_ENABLED       = os.getenv("SEARCH_ENABLED", "1") != "0"
+SEARCH_CORPUS_PATH   = os.getenv("SEARCH_CORPUS_PATH", os.path.join(_HERE, "data", "search_corpus.json"))
+SEARCH_SNAPSHOT_PATH = os.getenv("SEARCH_SNAPSHOT_PATH", os.path.join(_HERE, ".cache", "search_index"))
+SEARCH_PREFIX_TERMS  = int(os.getenv("SEARCH_PREFIX_TERMS", "30"))   # expansiones por prefijo
+SEARCH_BATCH_SIZE    = int(os.getenv("SEARCH_BATCH_SIZE", "5000"))
+SEARCH_BUILD_LEASE   = float(os.getenv("SEARCH_BUILD_LEASE", "900"))  # s: vence el turno de un worker caído
+SEARCH_BUILD_POLL    = float(os.getenv("SEARCH_BUILD_POLL", "2"))     # s entre intentos de abrir el snapshot ajeno
+
+K1, B = 1.2, 0.75
+TITLE_BOOST = 2.0
+
+SECTIONS = ("incidentes", "prevencion", "articulos")
+# ids del menú / sinónimos → sección del índice
+SECTION_ALIASES = {
+    "alertas": "incidentes", "mapa": "incidentes", "incidencias": "incidentes", "incidents": "incidentes",
+    "tips": "prevencion", "consejos": "prevencion", "articles": "articulos",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "de la el en y a los las del se un una por con para al lo su sus es que o u "
+    "como mas pero sin sobre este esta ese esa hay muy ya le les me mi tu".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(norm_text(text or "")) if len(t) > 1 and t not in STOPWORDS]
+
+def section_of(value: str) -> str:
+    v = norm_text(value or "")
+    return SECTION_ALIASES.get(v, v)
+
+# ── Construcción ──────────────────────────────────────────────────────────────
+class _Builder:
+    """Segmento en memoria: postings como dicts; sirve para construir y como delta."""
+
+    def __init__(self, first_doc: int = 0):
+        self.first_doc = first_doc
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.docs: List[bytes] = []
+        self.lens: List[float] = []
+        self.secs: List[int] = []
+        self.items: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, doc: Dict[str, Any], sec: int, item: int) -> int:
+        idx = self.first_doc + len(self.docs)
+        tf: Dict[str, float] = {}
+        for t in tokenize(doc.get("title", "")):
+            tf[t] = tf.get(t, 0.0) + TITLE_BOOST
+        for t in tokenize(doc.get("text", "")):
+            tf[t] = tf.get(t, 0.0) + 1.0
+        for t, w in tf.items():
+            self.postings.setdefault(t, {})[idx] = w
+        self.docs.append(json.dumps(doc, ensure_ascii=False, default=str).encode("utf-8"))
+        self.lens.append(sum(tf.values()))
+        self.secs.append(sec)
+        self.items.append(item)
+        return idx
+
+class _Segment:
+    """Segmento congelado (arrays / memmap). Los términos están ordenados."""
+
+    def __init__(self, terms: Any, term_off: np.ndarray, post_off: np.ndarray, post_doc: np.ndarray,
+                 post_tf: np.ndarray, doc_len: np.ndarray, doc_sec: np.ndarray, doc_item: np.ndarray,
+                 docs: Any, doc_off: np.ndarray, files: Optional[List[Any]] = None):
+        self.terms, self.term_off = terms, term_off
+        self.post_off, self.post_doc, self.post_tf = post_off, post_doc, post_tf
+        self.doc_len, self.doc_sec, self.doc_item = doc_len, doc_sec, doc_item
+        self.docs, self.doc_off = docs, doc_off
+        self.n_terms = len(term_off) - 1
+        self.n_docs = len(doc_off) - 1
+        self._files = files or []
+
+    def term(self, i: int) -> str:
+        return bytes(self.terms[int(self.term_off[i]):int(self.term_off[i + 1])]).decode("utf-8")
+
+    def find(self, term: str) -> Optional[int]:
+        i = bisect.bisect_left(range(self.n_terms), term, key=self.term)
+        return i if i < self.n_terms and self.term(i) == term else None
+
+    def with_prefix(self, prefix: str, limit: int) -> List[str]:
+        out: List[str] = []
+        i = bisect.bisect_left(range(self.n_terms), prefix, key=self.term)
+        while i < self.n_terms and len(out) < limit:
+            t = self.term(i)
+            if not t.startswith(prefix):
+                break
+            out.append(t)
+            i += 1
+        return out
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.find(term)
+        if i is None:
+            return _EMPTY_I, _EMPTY_F
+        a, b = int(self.post_off[i]), int(self.post_off[i + 1])
+        return self.post_doc[a:b], self.post_tf[a:b]
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        return json.loads(bytes(self.docs[int(self.doc_off[i]):int(self.doc_off[i + 1])]))
+
+    def iter_terms(self) -> Iterable[str]:
+        for i in range(self.n_terms):
+            yield self.term(i)
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+        self._files = []
+
+_EMPTY_I = np.zeros(0, dtype=np.int32)
+_EMPTY_F = np.zeros(0, dtype=np.float32)
+
+def _offsets(lengths: Sequence[int]) -> np.ndarray:
+    off = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=off[1:])
+    return off
+
+def _freeze(base: Optional[_Segment], delta: _Builder) -> _Segment:
+    """base + delta → un único segmento en memoria (para guardar el snapshot)."""
+    terms = sorted(set(base.iter_terms() if base else ()) | set(delta.postings))
+    docs_l, tfs_l, plen = [], [], []
+    for t in terms:
+        bd, bt = base.postings(t) if base else (_EMPTY_I, _EMPTY_F)
+        dd = delta.postings.get(t, {})
+        docs_l.append(np.asarray(bd, dtype=np.int32))
+        tfs_l.append(np.asarray(bt, dtype=np.float32))
+        if dd:
+            docs_l.append(np.fromiter(dd.keys(), dtype=np.int32, count=len(dd)))
+            tfs_l.append(np.fromiter(dd.values(), dtype=np.float32, count=len(dd)))
+        plen.append(len(bd) + len(dd))
+    tblobs = [t.encode("utf-8") for t in terms]
+
+    def cat(a: Optional[np.ndarray], b: List[Any], dtype: Any) -> np.ndarray:
+        return np.concatenate([np.asarray(a if a is not None else [], dtype=dtype), np.asarray(b, dtype=dtype)])
+
+    base_docs = [bytes(base.docs[int(base.doc_off[i]):int(base.doc_off[i + 1])]) for i in range(base.n_docs)] \
+        if base else []
+    all_docs = base_docs + delta.docs
+    return _Segment(
+        b"".join(tblobs), _offsets([len(b) for b in tblobs]), _offsets(plen),
+        np.concatenate(docs_l) if docs_l else _EMPTY_I, np.concatenate(tfs_l) if tfs_l else _EMPTY_F,
+        cat(base.doc_len if base else None, delta.lens, np.float32),
+        cat(base.doc_sec if base else None, delta.secs, np.uint16),
+        cat(base.doc_item if base else None, delta.items, np.uint16),
+        b"".join(all_docs), _offsets([len(d) for d in all_docs]),
+    )
+
+# ── Snapshot en disco ─────────────────────────────────────────────────────────
+_ARRAYS = ("term_off", "post_off", "post_doc", "post_tf", "doc_len", "doc_sec", "doc_item", "doc_off")
+
+_FILES = (*(name + ".npy" for name in _ARRAYS), "terms.bin", "docs.bin")
+
+def _acquire_build(path: str) -> bool:
+    """Turno para construir y escribir el snapshot (archivo creado con O_EXCL; vence a los SEARCH_BUILD_LEASE s)."""
+    lock = path + ".lock"
+    os.makedirs(os.path.dirname(lock) or ".", exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock) < SEARCH_BUILD_LEASE:
+                    return False
+                os.remove(lock)   # el dueño murió sin soltarlo
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+def _release_build(path: str) -> None:
+    try:
+        os.remove(path + ".lock")
+    except FileNotFoundError:
+        pass
+
+def _write_snapshot(seg: _Segment, meta: Dict[str, Any], path: str) -> None:
+    # directorios propios del proceso: nunca se pisa el snapshot a medio escribir de otro
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp, name + ".npy"), np.asarray(getattr(seg, name)))
+    for name in ("terms", "docs"):
+        with open(os.path.join(tmp, name + ".bin"), "wb") as f:
+            f.write(bytes(getattr(seg, name)))
+    meta = dict(meta, files={name: os.path.getsize(os.path.join(tmp, name)) for name in _FILES})
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    old = f"{path}.old-{os.getpid()}"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+def _map(path: str) -> Tuple[Any, Optional[Any]]:
+    f = open(path, "rb")
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return b"", None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f
+
+def _read_snapshot(path: str) -> Tuple[_Segment, Dict[str, Any]]:
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in _ARRAYS}
+    terms, f1 = _map(os.path.join(path, "terms.bin"))
+    docs, f2 = _map(os.path.join(path, "docs.bin"))
+    files = [x for x in (terms, f1, docs, f2) if x is not None and not isinstance(x, bytes)]
+    seg = _Segment(terms=terms, docs=docs, files=files, **arrays)
+    try:
+        _validate(seg, meta, path)
+    except ValueError:
+        seg.close()
+        raise
+    return seg, meta
+
+def _validate(seg: _Segment, meta: Dict[str, Any], path: str) -> None:
+    """Los archivos son de la misma construcción que meta.json y los offsets cuadran; si no, ValueError."""
+    sizes = meta.get("files")
+    if not isinstance(sizes, dict):
+        raise ValueError("snapshot sin tamaños de archivo")
+    for name in _FILES:
+        if os.path.getsize(os.path.join(path, name)) != sizes.get(name):
+            raise ValueError(f"snapshot inconsistente: {name}")
+    n_docs = len(seg.doc_off) - 1
+    if int(seg.doc_off[-1]) != len(seg.docs) or int(seg.term_off[-1]) != len(seg.terms) \
+            or int(seg.post_off[-1]) != len(seg.post_doc) or len(seg.post_doc) != len(seg.post_tf) \
+            or len(seg.post_off) != len(seg.term_off) \
+            or not len(seg.doc_len) == len(seg.doc_sec) == len(seg.doc_item) == n_docs:
+        raise ValueError("snapshot inconsistente: offsets")
+
+# ── Índice ────────────────────────────────────────────────────────────────────
+class SearchIndex:
+    def __init__(self, snapshot_path: str = SEARCH_SNAPSHOT_PATH, corpus_path: str = SEARCH_CORPUS_PATH):
+        self.snapshot_path = snapshot_path
+        self.corpus_path = corpus_path
+        self.base: Optional[_Segment] = None
+        self.delta = _Builder()
+        self._delta_refs: set = set()
+        self._total_len = 0.0
+        self.sections: List[str] = list(SECTIONS)
+        self.items: List[str] = [""]
+        self.last_incident: Optional[List[Any]] = None   # [Fecha ISO, Id] del último incidente del base
+        self.source = "empty"
+        self._building = False
+        self.queries = 0
+        self.updates = 0
+
+    # ---- vocabularios ----
+    def _code(self, vocab: List[str], value: str) -> int:
+        try:
+            return vocab.index(value)
+        except ValueError:
+            vocab.append(value)
+            return len(vocab) - 1
+
+    @property
+    def n_docs(self) -> int:
+        return (self.base.n_docs if self.base else 0) + len(self.delta)
+
+    def _add(self, builder: _Builder, doc: Dict[str, Any]) -> int:
+        sec = self._code(self.sections, doc["section"])
+        item = self._code(self.items, norm_text(doc.get("item") or ""))
+        idx = builder.add(doc, sec, item)
+        if builder is self.delta:
+            self._total_len += builder.lens[-1]
+        return idx
+
+    # ---- documentos ----
+    @staticmethod
+    def incident_doc(r: Sequence[Any]) -> Dict[str, Any]:
+        ts = r[FECHA]
+        return {
+            "id": f"incidente:{r[ID]}", "ref": str(r[ID]), "section": "incidentes",
+            "item": r[TIPO] or "general", "title": r[TITULO] or "Incidente", "text": r[DESCRIPCION] or "",
+            "severity": normalize_severity(str(r[SEVERIDAD] or "")),
+            "timestamp": ts.isoformat() if hasattr(ts, "isoformat") else ts,
+        }
+
+    def _corpus_docs(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.corpus_path, encoding="utf-8") as f:
+                corpus = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[search] No se pudo leer {self.corpus_path}: {e}")
+            return []
+        docs = []
+        for t in corpus.get("tips", []):
+            docs.append({"id": f"prevencion:{t['risk']}", "ref": t["risk"], "section": "prevencion",
+                         "item": t["risk"], "title": t["title"], "text": " ".join(t["items"])})
+        for a in corpus.get("articles", []):
+            docs.append({"id": f"articulo:{a['id']}", "ref": a["id"], "section": "articulos",
+                         "item": a.get("topic", ""), "title": a["title"], "text": a["text"], "url": a.get("url")})
+        return docs
+
+    def add_incident(self, row: Sequence[Any]) -> None:
+        """Alta incremental (create_incident / puesta al día desde la BD)."""
+        ref = str(row[ID])
+        if ref in self._delta_refs:
+            return
+        self._delta_refs.add(ref)
+        self._add(self.delta, self.incident_doc(row))
+        self.updates += 1
+
+    # ---- consulta ----
+    def _doc_values(self, ids: np.ndarray, base_arr: Optional[np.ndarray], delta_list: List[Any],
+                    dtype: Any) -> np.ndarray:
+        nb = self.base.n_docs if self.base else 0
+        out = np.empty(len(ids), dtype=dtype)
+        in_base = ids < nb
+        if in_base.any():
+            out[in_base] = base_arr[ids[in_base]]
+        if (~in_base).any():
+            out[~in_base] = np.asarray(delta_list, dtype=dtype)[ids[~in_base] - nb]
+        return out
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        bd, bt = self.base.postings(term) if self.base else (_EMPTY_I, _EMPTY_F)
+        dd = self.delta.postings.get(term)
+        if not dd:
+            return bd, bt
+        d = np.fromiter(dd.keys(), dtype=np.int32, count=len(dd))
+        t = np.fromiter(dd.values(), dtype=np.float32, count=len(dd))
+        return (np.concatenate([bd, d]), np.concatenate([bt, t])) if len(bd) else (d, t)
+
+    def _expand(self, prefix: str) -> List[str]:
+        terms = self.base.with_prefix(prefix, SEARCH_PREFIX_TERMS) if self.base else []
+        extra = [t for t in self.delta.postings if t.startswith(prefix) and t not in terms]
+        return (terms + sorted(extra))[:SEARCH_PREFIX_TERMS]
+
+    def doc(self, i: int) -> Dict[str, Any]:
+        nb = self.base.n_docs if self.base else 0
+        return self.base.doc(i) if i < nb else json.loads(self.delta.docs[i - nb])
+
+    def search(self, q: str, section: str = "", item: str = "", limit: int = 20,
+               prefix: bool = True) -> List[Dict[str, Any]]:
+        self.queries += 1
+        tokens = tokenize(q)
+        n = self.n_docs
+        if not tokens or not n:
+            return []
+        groups = [[t] for t in tokens]
+        # type-ahead: el último término incompleto se expande por prefijo
+        if prefix and not q.endswith(" ") and len(tokens[-1]) >= 2:
+            groups[-1] = self._expand(tokens[-1]) or groups[-1]
+        avgdl = max(self._total_len / n, 1.0)
+
+        ids_l, sc_l = [], []
+        for group in groups:
+            for term in group:
+                docs, tf = self._postings(term)
+                if not len(docs):
+                    continue
+                df = len(docs)
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                dl = self._doc_values(docs, self.base.doc_len if self.base else None, self.delta.lens, np.float32)
+                tf = np.asarray(tf, dtype=np.float32)
+                ids_l.append(docs)
+                sc_l.append(idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl)))
+        if not ids_l:
+            return []
+        uniq, inv = np.unique(np.concatenate(ids_l), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(sc_l))
+
+        sec = section_of(section)
+        if sec:
+            if sec not in self.sections:
+                return []
+            code = self.sections.index(sec)
+            keep = self._doc_values(uniq, self.base.doc_sec if self.base else None, self.delta.secs, np.uint16) == code
+            uniq, scores = uniq[keep], scores[keep]
+        if item:
+            it = norm_text(item)
+            if it not in self.items:
+                return []
+            code = self.items.index(it)
+            keep = self._doc_values(uniq, self.base.doc_item if self.base else None, self.delta.items, np.uint16) == code
+            uniq, scores = uniq[keep], scores[keep]
+        if not len(uniq):
+            return []
+        k = min(limit, len(uniq))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        out = []
+        for i in top:
+            d = self.doc(int(uniq[i]))
+            text = d.pop("text", "")
+            d["snippet"] = _snippet(text, tokens)
+            d["score"] = round(float(scores[i]), 4)
+            out.append(d)
+        return out
+
+    # ---- carga / persistencia ----
+    def _meta(self) -> Dict[str, Any]:
+        return {"version": 1, "total_len": self._total_len, "sections": self.sections,
+                "items": self.items, "last_incident": self.last_incident,
+                "built_at": dt.datetime.now().isoformat()}
+
+    def load_snapshot(self) -> bool:
+        try:
+            seg, meta = _read_snapshot(self.snapshot_path)
+        except (OSError, ValueError, KeyError):
+            return False
+        self._swap(seg, meta, "snapshot")
+        return True
+
+    def _swap(self, seg: _Segment, meta: Dict[str, Any], source: str) -> None:
+        old = self.base
+        self.base = seg
+        self.delta = _Builder(seg.n_docs)
+        self._delta_refs = set()
+        self._total_len = float(meta["total_len"])
+        self.sections = list(meta["sections"])
+        self.items = list(meta["items"])
+        self.last_incident = meta.get("last_incident")
+        self.source = source
+        if old is not None:
+            old.close()
+
+    async def rebuild(self) -> Dict[str, Any]:
+        """
+        Reconstruye el índice completo (corpus + Incidentes), guarda el snapshot y
+        lo abre. Si otro worker tiene el turno de escritura queda sólo en memoria.
+        """
+        if self._building:
+            return self.stats()
+        owner = _acquire_build(self.snapshot_path)
+        try:
+            return await self._rebuild(owner)
+        finally:
+            if owner:
+                _release_build(self.snapshot_path)
+
+    async def _rebuild(self, write: bool) -> Dict[str, Any]:
+        from db_async import astream
+        if self._building:
+            return self.stats()
+        self._building = True
+        try:
+            builder = _Builder()
+            for doc in self._corpus_docs():
+                self._add(builder, doc)
+            last = None
+            async for r in astream(f"SELECT {INCIDENT_SELECT} FROM Incidentes ORDER BY Fecha, Id",
+                                   (), SEARCH_BATCH_SIZE):
+                self._add(builder, self.incident_doc(r))
+                last = r
+            total = float(sum(builder.lens))
+            meta = self._meta()
+            meta["total_len"] = total
+            if last is not None:
+                ref = last[ID] if isinstance(last[ID], int) else str(last[ID])
+                meta["last_incident"] = [last[FECHA].isoformat(), ref]
+            loop = asyncio.get_running_loop()
+            seg = await loop.run_in_executor(None, _freeze, None, builder)
+            source = "memory"
+            if write:
+                try:
+                    await loop.run_in_executor(None, _write_snapshot, seg, meta, self.snapshot_path)
+                    seg.close()
+                    seg, meta = _read_snapshot(self.snapshot_path)
+                    source = "snapshot"
+                except (OSError, ValueError) as e:
+                    print(f"[search] No se pudo guardar el snapshot: {e}")
+            self._swap(seg, meta, source)
+        finally:
+            self._building = False
+        await self.catch_up()
+        return self.stats()
+
+    async def catch_up(self) -> int:
+        """Incorpora al delta los incidentes posteriores al snapshot (mismo orden que la paginación)."""
+        from db_async import astream
+        if self.last_incident:
+            ts, last_id = dt.datetime.fromisoformat(self.last_incident[0]), self.last_incident[1]
+            sql = (f"SELECT {INCIDENT_SELECT} FROM Incidentes "
+                   "WHERE Fecha > ? OR (Fecha = ? AND Id > ?) ORDER BY Fecha, Id")
+            params: Tuple[Any, ...] = (ts, ts, last_id)
+        else:
+            sql, params = f"SELECT {INCIDENT_SELECT} FROM Incidentes ORDER BY Fecha, Id", ()
+        n = 0
+        async for r in astream(sql, params, SEARCH_BATCH_SIZE):
+            self.add_incident(r)
+            n += 1
+        return n
+
+    async def start(self) -> None:
+        """
+        Arranque: abre el snapshot (mmap) y se pone al día. Sin snapshot construye
+        sólo el worker que toma el turno; los demás esperan a abrir el suyo.
+        """
+        if self.load_snapshot():
+            await self.catch_up()
+            return
+        for doc in self._corpus_docs():   # el corpus local responde mientras se lee la BD
+            self._add(self.delta, doc)
+        self.source = "corpus"
+        while True:
+            if _acquire_build(self.snapshot_path):
+                try:
+                    # otro worker pudo terminarlo justo antes de soltar el turno
+                    if not self.load_snapshot():
+                        await self._rebuild(True)
+                        return
+                finally:
+                    _release_build(self.snapshot_path)
+                break
+            await asyncio.sleep(SEARCH_BUILD_POLL)
+            if self.load_snapshot():
+                break
+        await self.catch_up()
+
+    def _background(self, coro: Any) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def schedule_start(self) -> None:
+        self._background(self.start())
+
+    def schedule_catch_up(self) -> None:
+        """Tras una importación masiva: indexa en segundo plano lo nuevo."""
+        if not self._building:
+            self._background(self.catch_up())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": SEARCH_ENABLED, "source": self.source, "docs": self.n_docs,
+            "base_docs": self.base.n_docs if self.base else 0, "delta_docs": len(self.delta),
+            "terms": self.base.n_terms if self.base else len(self.delta.postings),
+            "building": self._building, "queries": self.queries, "updates": self.updates,
+        }
+
+def _snippet(text: str, tokens: List[str], width: int = 160) -> str:
+    if len(text) <= width:
+        return text
+    low = norm_text(text)
+    pos = min((p for p in (low.find(t) for t in tokens) if p >= 0), default=0)
+    start = max(0, min(pos - width // 4, len(text) - width))
+    s = text[start:start + width].strip()
+    return ("…" if start > 0 else "") + s + ("…" if start + width < len(text) else "")
+
+SEARCH = SearchIndex()
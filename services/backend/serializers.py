@@ -0,0 +1,109 @@
+import datetime as dt
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+
+from metrics import timed
+
+# ── Severidad ─────────────────────────────────────────────────────────────────
+# mapear etiquetas lógicas → color
+LOGICAL_TO_COLOR = {
+    "grave": "red",
+    "medio": "yellow",
+    "leve": "green",
+    "transito_menor": "blue",
+    "muy_grande": "purple",
+}
+COLOR_SET = {"red", "yellow", "green", "blue", "purple"}
+
+def normalize_severity(value: str) -> str:
+    v = (value or "").strip().lower()
+    if v in COLOR_SET:
+        return v
+    return LOGICAL_TO_COLOR.get(v, "yellow")
+
+# valor crudo de Severidad → color, memoizado (los valores distintos son pocos)
+_COLOR_OF: Dict[Any, str] = {}
+
+def _color(raw: Any) -> str:
+    c = _COLOR_OF.get(raw)
+    if c is None:
+        c = normalize_severity(str(raw or ""))
+        if len(_COLOR_OF) < 256:
+            _COLOR_OF[raw] = c
+    return c
+
+# código estable de cada color para la columna Incidentes.SevCode (ver migrations.py)
+SEVERITY_CODE = {"red": 1, "yellow": 2, "green": 3, "blue": 4, "purple": 5}
+
+def severity_code(value: Any) -> int:
+    return SEVERITY_CODE[_color(value)]
+
+# ── Filas de Incidentes ───────────────────────────────────────────────────────
+# Orden fijo de columnas: todas las consultas de incidentes seleccionan INCIDENT_SELECT
+INCIDENT_COLUMNS = ("Id", "Titulo", "Descripcion", "Severidad", "Tipo", "Lat", "Lon", "Fecha")
+INCIDENT_SELECT = ", ".join(INCIDENT_COLUMNS)
+INCIDENT_OUTPUT = ", ".join("INSERTED." + c for c in INCIDENT_COLUMNS)   # INSERT ... OUTPUT
+ID, TITULO, DESCRIPCION, SEVERIDAD, TIPO, LAT, LON, FECHA = range(len(INCIDENT_COLUMNS))
+# columna opcional tras INCIDENT_COLUMNS: reportes del cluster (GET /incidents?collapse=1)
+REPORTES = len(INCIDENT_COLUMNS)
+
+def _num(v: Any) -> float:
+    return v if type(v) is float else float(v)
+
+def _timestamp(ts: Any) -> Any:
+    # orjson serializa datetime como ISO 8601 (igual que isoformat) sin pasar por Python
+    if isinstance(ts, (dt.datetime, dt.date)):
+        return ts
+    return str(ts) if ts is not None else dt.datetime.utcnow().isoformat() + "Z"
+
+def incident_dict(r: Sequence[Any]) -> Dict[str, Any]:
+    """Tupla de BD (INCIDENT_COLUMNS [+ Reportes]) → incidente de la API."""
+    d = {
+        "id": str(r[ID]),
+        "title": r[TITULO] or "Incidente",
+        "description": r[DESCRIPCION] or "",
+        "severity": _color(r[SEVERIDAD]),
+        "type": r[TIPO] or "general",
+        "lat": _num(r[LAT]),
+        "lon": _num(r[LON]),
+        "timestamp": _timestamp(r[FECHA]),
+    }
+    if len(r) > REPORTES:
+        d["reports"] = int(r[REPORTES])
+    return d
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default)
+
+@timed("serialize.incidents")
+def incidents_payload(place: str, center: Dict[str, Any], rows: Iterable[Sequence[Any]],
+                      next_cursor: Optional[str] = None, **extra: Any) -> bytes:
+    """Respuesta completa de GET /incidents como bytes JSON (sin jsonable_encoder)."""
+    items: List[Dict[str, Any]] = [incident_dict(r) for r in rows]
+    return dumps({"place": place, "center": center, "incidents": items, "next_cursor": next_cursor, **extra})
+
+def incident_line(r: Sequence[Any]) -> bytes:
+    """Una línea NDJSON."""
+    return orjson.dumps(incident_dict(r), default=_default, option=orjson.OPT_APPEND_NEWLINE)
+
+@timed("serialize.incident")
+def incident_created_payload(r: Sequence[Any], **extra: Any) -> bytes:
+    """Respuesta de POST /incidents."""
+    return dumps({"incident": incident_dict(r), **extra})
+
+@timed("serialize.nearby")
+def nearby_payload(center: Dict[str, Any], items: Iterable[Tuple[Sequence[Any], float]], **extra: Any) -> bytes:
+    """Respuesta de GET /incidents/nearby: incidentes con `distance_km`, del más cercano al más lejano."""
+    out: List[Dict[str, Any]] = []
+    for r, km in items:
+        d = incident_dict(r)
+        d["distance_km"] = round(km, 3)
+        out.append(d)
+    return dumps({"center": center, "incidents": out, **extra})
@@ -0,0 +1,643 @@
+"""
+Caché local compartida entre procesos: workers de uvicorn, servidor de
+acciones de Rasa y CLIs de la misma máquina, sin servicios externos.
+
+    SHARED_CACHE_URL=sqlite:.cache/shared.sqlite3   (por defecto)
+    SHARED_CACHE_URL=redis://localhost:6379/1       (opcional: pip install redis)
+    SHARED_CACHE_URL=off
+
+Backend SQLite: un archivo en WAL leído por mmap (SHARED_CACHE_MMAP_MB). Todos
+los procesos ven las mismas páginas del page cache; SQLite serializa las
+escrituras con su bloqueo de archivo y los lectores no se bloquean.
+- Espacios de nombres (geocode, assistant, wikipedia, incidents, tiles,
+  rasa_places…) con TTL propio.
+- Tope de bytes (SHARED_CACHE_MAX_MB) para todo el archivo. Al superarlo se
+  borran primero las entradas vencidas y después las de uso más antiguo (LRU
+  aproximado: el último uso se actualiza como mucho cada SHARED_CACHE_TOUCH s).
+- Contadores por espacio (aciertos, fallos, bytes, tiempo de carga de los
+  fallos) que cada proceso vuelca en la misma base cada SHARED_CACHE_FLUSH s.
+  /health muestra los del worker y los de todos, y `saved_s` estima el tiempo
+  ahorrado: aciertos × coste medio de un fallo.
+- Nada de E/S en el event loop: las lecturas (`aget`) van a un pool de hilos
+  (SHARED_CACHE_THREADS) y las escrituras son diferidas: `set` encola y vuelve
+  al momento; un único hilo escritor aplica altas, últimos usos, vencidas,
+  expulsiones y contadores. Si la cola se llena (SHARED_CACHE_QUEUE) la
+  escritura se descarta: es una caché.
+
+Sólo biblioteca estándar (orjson si está): el servidor de acciones de Rasa lo
+carga desde esta ruta.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+    _dumps: Callable[[Any], bytes] = orjson.dumps
+    _loads: Callable[[bytes], Any] = orjson.loads
+except Exception:  # orjson es opcional (servidor de acciones de Rasa)
+    def _dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _loads = json.loads
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+SHARED_CACHE_URL     = os.getenv("SHARED_CACHE_URL", "sqlite:" + os.path.join(_HERE, ".cache", "shared.sqlite3"))
+SHARED_CACHE_MAX_MB  = float(os.getenv("SHARED_CACHE_MAX_MB", "256"))   # tope de bytes guardados
+SHARED_CACHE_MMAP_MB = int(os.getenv("SHARED_CACHE_MMAP_MB", "256"))    # lecturas por mmap
+SHARED_CACHE_TOUCH   = float(os.getenv("SHARED_CACHE_TOUCH", "30"))     # s: resolución del LRU
+SHARED_CACHE_FLUSH   = float(os.getenv("SHARED_CACHE_FLUSH", "10"))     # s entre volcados de contadores
+SHARED_CACHE_TIMEOUT = float(os.getenv("SHARED_CACHE_TIMEOUT", "0.5"))  # s de espera por el bloqueo
+SHARED_CACHE_HOT_TTL = float(os.getenv("SHARED_CACHE_HOT_TTL", "120"))  # s: respuestas por ETag
+SHARED_CACHE_THREADS = int(os.getenv("SHARED_CACHE_THREADS", "2"))      # hilos de lectura por proceso
+SHARED_CACHE_QUEUE   = int(os.getenv("SHARED_CACHE_QUEUE", "1000"))     # escrituras diferidas en cola
+
+# overhead aproximado de una fila (clave primaria, índices) sumado al tamaño del valor
+_ROW_OVERHEAD = 64
+# al superar el tope se libera hasta quedar en esta fracción
+_LOW_WATER = 0.9
+# escrituras encoladas que el hilo escritor aplica en una sola transacción
+_WRITE_BATCH = 256
+
+COUNTERS = ("hits", "misses", "sets", "errors", "bytes_read", "bytes_written", "loads", "load_ms")
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+class Store:
+    """Almacén de bytes por (espacio, clave) compartido entre procesos."""
+    kind = "off"
+
+    def get(self, ns: str, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, ns: str, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+    def delete(self, ns: str, key: str) -> None:
+        pass
+
+    def maintain(self) -> None:
+        """Tareas periódicas del hilo escritor (últimos usos, vencidas)."""
+
+    def batch(self) -> ContextManager[None]:
+        """Agrupa las escrituras de un lote del hilo escritor."""
+        return nullcontext()
+
+    def clear(self, ns: str) -> int:
+        return 0
+
+    def add_counters(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        pass
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        return {}
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Espacio → {entries, bytes} (vacío si el backend no lo sabe)."""
+        return {}
+
+    def close(self) -> None:
+        pass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns      TEXT    NOT NULL,
+    key     TEXT    NOT NULL,
+    value   BLOB    NOT NULL,
+    size    INTEGER NOT NULL,
+    expires REAL    NOT NULL,
+    used    REAL    NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_entries_used ON entries (used);
+CREATE INDEX IF NOT EXISTS ix_entries_expires ON entries (expires);
+CREATE TABLE IF NOT EXISTS usage (
+    ns      TEXT    PRIMARY KEY,
+    entries INTEGER NOT NULL,
+    bytes   INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS tr_entries_ins AFTER INSERT ON entries BEGIN
+    INSERT INTO usage (ns, entries, bytes) VALUES (NEW.ns, 1, NEW.size)
+    ON CONFLICT (ns) DO UPDATE SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_entries_upd AFTER UPDATE OF size ON entries BEGIN
+    UPDATE usage SET bytes = bytes - OLD.size + NEW.size WHERE ns = NEW.ns;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_entries_del AFTER DELETE ON entries BEGIN
+    UPDATE usage SET entries = entries - 1, bytes = bytes - OLD.size WHERE ns = OLD.ns;
+END;
+CREATE TABLE IF NOT EXISTS counters (
+    ns    TEXT    NOT NULL,
+    name  TEXT    NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (ns, name)
+) WITHOUT ROWID;
+"""
+
+class SQLiteStore(Store):
+    """
+    Archivo SQLite compartido. Cada hilo lector tiene su conexión (en WAL los
+    lectores no se bloquean entre sí ni por el escritor); las escrituras las
+    hace sólo el hilo escritor de SharedCache. Se reabre tras un fork. El total
+    de bytes por espacio lo mantienen triggers: el control del tope no recorre
+    la tabla.
+    """
+    kind = "sqlite"
+
+    def __init__(self, path: str, max_bytes: int, mmap_bytes: int, touch: float = SHARED_CACHE_TOUCH,
+                 timeout: float = SHARED_CACHE_TIMEOUT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_bytes = mmap_bytes
+        self.touch = touch
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._ready = False
+        # últimos usos vistos por los lectores; el escritor los aplica en maintain()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self.evictions = 0
+        self.expired = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            # hijo de un fork: las conexiones del padre no se usan ni se cierran
+            self._local, self._conns, self._ready, self._pid = threading.local(), [], False, os.getpid()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")   # una caché no necesita fsync por escritura
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            if not self._ready:
+                conn.executescript(_SCHEMA)
+                self._ready = True
+            self._conns.append(conn)
+        return conn
+
+    def get(self, ns: str, key: str) -> Optional[bytes]:
+        now = time.time()
+        row = self._db().execute("SELECT value, expires, used FROM entries WHERE ns = ? AND key = ?",
+                                 (ns, key)).fetchone()
+        if row is None or row[1] < now:
+            return None   # las vencidas se borran en maintain()
+        if now - row[2] > self.touch:
+            self._touched[(ns, key)] = now
+        return bytes(row[0])
+
+    def set(self, ns: str, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        size = len(value) + len(key) + _ROW_OVERHEAD
+        db = self._db()
+        db.execute(
+            "INSERT INTO entries (ns, key, value, size, expires, used) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (ns, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires = excluded.expires, used = excluded.used",
+            (ns, key, value, size, now + ttl, now),
+        )
+        if self._total(db) > self.max_bytes:
+            self._evict(db, now)
+
+    @staticmethod
+    def _total(db: sqlite3.Connection) -> int:
+        return int(db.execute("SELECT COALESCE(SUM(bytes), 0) FROM usage").fetchone()[0])
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Vencidas primero; después LRU hasta quedar en _LOW_WATER del tope."""
+        own = not db.in_transaction
+        if own:
+            db.execute("BEGIN IMMEDIATE")
+        try:
+            self.expired += db.execute("DELETE FROM entries WHERE expires < ?", (now,)).rowcount
+            total, target = self._total(db), int(self.max_bytes * _LOW_WATER)
+            while total > target:
+                rows = db.execute("SELECT ns, key, size FROM entries ORDER BY used LIMIT 256").fetchall()
+                if not rows:
+                    break
+                db.executemany("DELETE FROM entries WHERE ns = ? AND key = ?", [(r[0], r[1]) for r in rows])
+                self.evictions += len(rows)
+                total -= sum(r[2] for r in rows)
+            if own:
+                db.execute("COMMIT")
+        except Exception:
+            if own:
+                db.execute("ROLLBACK")
+            raise
+
+    def maintain(self) -> None:
+        touched, self._touched = self._touched, {}
+        db = self._db()
+        if touched:
+            db.executemany("UPDATE entries SET used = ? WHERE ns = ? AND key = ?",
+                           [(t, ns, key) for (ns, key), t in touched.items()])
+        self.expired += db.execute("DELETE FROM entries WHERE expires < ?", (time.time(),)).rowcount
+
+    def delete(self, ns: str, key: str) -> None:
+        self._db().execute("DELETE FROM entries WHERE ns = ? AND key = ?", (ns, key))
+
+    def clear(self, ns: str) -> int:
+        return self._db().execute("DELETE FROM entries WHERE ns = ?", (ns,)).rowcount
+
+    def add_counters(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        rows = [(ns, name, n) for ns, d in deltas.items() for name, n in d.items() if n]
+        if rows:
+            self._db().executemany(
+                "INSERT INTO counters (ns, name, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (ns, name) DO UPDATE SET value = value + excluded.value", rows)
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        for ns, name, value in self._db().execute("SELECT ns, name, value FROM counters"):
+            out.setdefault(ns, {})[name] = int(value)
+        return out
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        rows = self._db().execute("SELECT ns, entries, bytes FROM usage").fetchall()
+        return {ns: {"entries": int(n), "bytes": int(b)} for ns, n, b in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+class RedisStore(Store):
+    """
+    Servidor compatible con Redis. El tope y la expulsión LRU los aplica el
+    servidor (maxmemory + maxmemory-policy allkeys-lru); aquí sólo el TTL.
+    Cliente síncrono: cada operación es un ida y vuelta corto por la red local.
+    """
+    kind = "redis"
+
+    def __init__(self, url: str, prefix: str = "riaar:cache:", timeout: float = SHARED_CACHE_TIMEOUT):
+        import redis  # opcional: pip install redis
+        self._r = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+
+    def _k(self, ns: str, key: str) -> str:
+        return f"{self.prefix}{ns}:{key}"
+
+    def get(self, ns: str, key: str) -> Optional[bytes]:
+        return self._r.get(self._k(ns, key))
+
+    def set(self, ns: str, key: str, value: bytes, ttl: float) -> None:
+        self._r.set(self._k(ns, key), value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, ns: str, key: str) -> None:
+        self._r.delete(self._k(ns, key))
+
+    def clear(self, ns: str) -> int:
+        n = 0
+        batch: List[bytes] = []
+        for k in self._r.scan_iter(match=self._k(ns, "*"), count=500):
+            batch.append(k)
+            if len(batch) >= 500:
+                n += self._r.delete(*batch)
+                batch = []
+        if batch:
+            n += self._r.delete(*batch)
+        return n
+
+    def add_counters(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        pipe = self._r.pipeline(transaction=False)
+        for ns, d in deltas.items():
+            for name, n in d.items():
+                if n:
+                    pipe.hincrby(f"{self.prefix}stats:{ns}", name, n)
+        pipe.execute()
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        head = f"{self.prefix}stats:"
+        for k in self._r.scan_iter(match=head + "*", count=100):
+            name = k.decode() if isinstance(k, bytes) else k
+            out[name[len(head):]] = {(f.decode() if isinstance(f, bytes) else f): int(v)
+                                     for f, v in self._r.hgetall(k).items()}
+        return out
+
+    def close(self) -> None:
+        self._r.close()
+
+def make_store(url: str = SHARED_CACHE_URL) -> Store:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if not os.path.isabs(path):
+            path = os.path.join(_HERE, path)
+        return SQLiteStore(path, int(SHARED_CACHE_MAX_MB * 1024 * 1024), SHARED_CACHE_MMAP_MB * 1024 * 1024)
+    return Store()
+
+# ── Espacios de nombres ───────────────────────────────────────────────────────
+class Namespace:
+    """
+    Vista de un espacio con su TTL. Un error del almacén cuenta como fallo
+    (la caché nunca tumba la petición). None = no está: no se guardan nulos.
+    Desde el event loop: `await aget()` y `set()` (diferido); `get()` lee en el
+    hilo que llama (CLIs, benchmarks).
+    """
+
+    def __init__(self, cache: "SharedCache", name: str, ttl: float):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+        self.local = dict.fromkeys(COUNTERS, 0)   # de este proceso
+        self._pending = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()             # el hilo escritor también cuenta (errores)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.local[name] += n
+            self._pending[name] += n
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            return self.cache.store.get(self.name, key)
+        except Exception:
+            self._count("errors")
+            return None
+
+    def _seen(self, value: Optional[bytes]) -> Optional[bytes]:
+        if value is None:
+            self._count("misses")
+        else:
+            self._count("hits")
+            self._count("bytes_read", len(value))
+        self.cache.maybe_flush()
+        return value
+
+    def _decode(self, raw: Optional[bytes]) -> Any:
+        if raw is None:
+            return None
+        try:
+            return _loads(raw)
+        except ValueError:
+            self._count("errors")
+            return None
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        return self._seen(self._read(key))
+
+    async def aget_bytes(self, key: str) -> Optional[bytes]:
+        return self._seen(await self.cache.run(self._read, key))
+
+    def get(self, key: str) -> Any:
+        return self._decode(self.get_bytes(key))
+
+    async def aget(self, key: str) -> Any:
+        return self._decode(await self.aget_bytes(key))
+
+    def set_bytes(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """Encola la escritura y vuelve al momento."""
+        if self.cache.submit(self, self.cache.store.set, self.name, key, value, self.ttl if ttl is None else ttl):
+            self._count("sets")
+            self._count("bytes_written", len(value))
+        self.cache.maybe_flush()
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if value is not None:
+            self.set_bytes(key, _dumps(value), ttl)
+
+    def delete(self, key: str) -> None:
+        self.cache.submit(self, self.cache.store.delete, self.name, key)
+
+    def note_load(self, seconds: float) -> None:
+        """Coste de resolver un fallo (para estimar cuánto ahorra cada acierto)."""
+        self._count("loads")
+        self._count("load_ms", int(seconds * 1000))
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Valor en caché o `await load()` (guardado si no es None). Los errores de load se propagan."""
+        hit = await self.aget(key)
+        if hit is not None:
+            return hit
+        t0 = time.perf_counter()
+        value = await load()
+        self.note_load(time.perf_counter() - t0)
+        self.set(key, value, ttl)
+        return value
+
+    def take_pending(self) -> Dict[str, int]:
+        with self._lock:
+            out, self._pending = self._pending, dict.fromkeys(COUNTERS, 0)
+        return out
+
+    def give_back(self, pending: Dict[str, int]) -> None:
+        with self._lock:
+            for k, n in pending.items():
+                self._pending[k] += n
+
+    def unflushed(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._pending)
+
+def _summary(c: Dict[str, int]) -> Dict[str, Any]:
+    hits, misses = c.get("hits", 0), c.get("misses", 0)
+    out: Dict[str, Any] = {k: c.get(k, 0) for k in COUNTERS}
+    out["hit_rate"] = round(hits / (hits + misses), 3) if hits + misses else None
+    loads = c.get("loads", 0)
+    # aciertos × coste medio de un fallo: lo que la caché ahorra a los upstreams/BD
+    out["saved_s"] = round(hits * c.get("load_ms", 0) / loads / 1000, 1) if loads else None
+    return out
+
+class SharedCache:
+    """Almacén del proceso (perezoso), hilos de E/S y registro de espacios de nombres."""
+
+    def __init__(self, url: str = SHARED_CACHE_URL, flush_every: float = SHARED_CACHE_FLUSH,
+                 threads: int = SHARED_CACHE_THREADS, max_queue: int = SHARED_CACHE_QUEUE):
+        self.url = url
+        self.flush_every = flush_every
+        self.threads = threads
+        self.max_queue = max_queue
+        self._store: Optional[Store] = None
+        self.namespaces: Dict[str, Namespace] = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._writes: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._pid = 0
+        self.queued = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    @property
+    def store(self) -> Store:
+        if self._store is None:
+            try:
+                self._store = make_store(self.url)
+            except Exception as e:
+                print(f"[sharedcache] No se pudo abrir {self.url}: {e}; caché compartida deshabilitada")
+                self._store = Store()
+        return self._store
+
+    @property
+    def enabled(self) -> bool:
+        return self.store.kind != "off"
+
+    def namespace(self, name: str, ttl: float) -> Namespace:
+        """El mismo objeto para el mismo nombre (p.ej. geocode desde app.py y ai.py)."""
+        ns = self.namespaces.get(name)
+        if ns is None:
+            ns = self.namespaces[name] = Namespace(self, name, ttl)
+        return ns
+
+    # ---- hilos ----
+    def _start(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._readers is None or self._pid != os.getpid():
+                self._readers = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="sharedcache")
+                self._writes = queue.SimpleQueue()
+                self._writer = threading.Thread(target=self._write_loop, name="sharedcache-w", daemon=True)
+                self._writer.start()
+                self._pid, self.queued = os.getpid(), 0
+            return self._readers
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Lectura en el pool de hilos: el event loop no espera al archivo."""
+        if not self.enabled:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._start(), fn, *args)
+
+    def submit(self, ns: Optional[Namespace], fn: Callable[..., Any], *args: Any) -> bool:
+        """Escritura diferida en el hilo escritor; False si está deshabilitada o la cola está llena."""
+        if not self.enabled:
+            return False
+        self._start()
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.dropped += 1
+                return False
+            self.queued += 1
+        self._writes.put((ns, fn, args))
+        return True
+
+    def _write_loop(self) -> None:
+        """Vacía la cola en lotes de hasta _WRITE_BATCH escrituras por transacción."""
+        writes = self._writes
+        while True:
+            batch = [writes.get()]
+            while batch[-1] is not None and len(batch) < _WRITE_BATCH:
+                try:
+                    batch.append(writes.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._apply(batch)
+            if stop:
+                return
+
+    def _apply(self, batch: List[Tuple[Optional[Namespace], Callable[..., Any], Tuple[Any, ...]]]) -> None:
+        failed: List[Optional[Namespace]] = []
+        try:
+            with self.store.batch():
+                for ns, fn, args in batch:
+                    try:
+                        fn(*args)
+                    except sqlite3.OperationalError:
+                        raise   # bloqueo o disco: el lote entero se descarta
+                    except Exception:
+                        failed.append(ns)
+        except Exception:
+            failed = [ns for ns, _, _ in batch]
+        for ns in failed:
+            self.write_errors += 1
+            if ns is not None:
+                ns._count("errors")
+        with self._lock:
+            self.queued -= len(batch)
+
+    # ---- contadores y mantenimiento ----
+    def maybe_flush(self) -> None:
+        if time.monotonic() - self._flushed_at >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Encola el volcado de contadores y el mantenimiento del almacén."""
+        self._flushed_at = time.monotonic()
+        deltas = {name: ns.take_pending() for name, ns in self.namespaces.items()}
+        if not self.submit(None, self._maintain, deltas):
+            for name, d in deltas.items():   # se reintentan en el próximo volcado
+                self.namespaces[name].give_back(d)
+
+    def _maintain(self, deltas: Dict[str, Dict[str, int]]) -> None:
+        try:
+            self.store.add_counters(deltas)
+        except Exception:
+            for name, d in deltas.items():
+                self.namespaces[name].give_back(d)
+            raise
+        self.store.maintain()
+
+    def stats(self) -> Dict[str, Any]:
+        """Lee el almacén en el hilo que llama; desde el event loop, `await astats()`."""
+        store = self.store
+        try:
+            shared, usage = store.counters(), store.usage()
+        except Exception:
+            shared, usage = {}, {}
+        out: Dict[str, Any] = {"backend": store.kind, "max_mb": SHARED_CACHE_MAX_MB if store.kind == "sqlite" else None,
+                               "queued": self.queued, "dropped": self.dropped, "write_errors": self.write_errors}
+        if isinstance(store, SQLiteStore):
+            out["evictions"] = store.evictions
+            out["expired"] = store.expired
+        namespaces = {}
+        for name, ns in sorted(self.namespaces.items()):
+            # lo compartido + lo de este proceso que aún no se volcó
+            total = dict(shared.get(name, {}))
+            for k, n in ns.unflushed().items():
+                total[k] = total.get(k, 0) + n
+            namespaces[name] = {"ttl_s": ns.ttl, "worker": _summary(ns.local),
+                                "all": {**_summary(total), **usage.get(name, {})}}
+        out["namespaces"] = namespaces
+        return out
+
+    async def astats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return self.stats()
+        return await self.run(self.stats)
+
+    def close(self) -> None:
+        """Vuelca contadores, espera las escrituras encoladas y cierra el almacén."""
+        if self.enabled:
+            self.flush()
+        readers, writer = self._readers, self._writer
+        self._readers = self._writer = None
+        if writer is not None and self._pid == os.getpid():
+            self._writes.put(None)
+            writer.join()
+        if readers is not None:
+            readers.shutdown(wait=True)
+        if self._store is not None:
+            self._store.close()
+
+SHARED = SharedCache()
@@ -0,0 +1,267 @@
+import os
+import time
+import math
+import asyncio
+import datetime as dt
+from array import array
+from typing import Any, Container, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from changes import CHANGES, CHANGES_ENABLED
+from db_async import aquery_rows, ascalar
+from migrations import SCHEMA
+from serializers import INCIDENT_SELECT, ID, SEVERIDAD, LAT, LON, FECHA, normalize_severity
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+SPATIAL_INDEX_ENABLED     = os.getenv("SPATIAL_INDEX_ENABLED", "1") != "0"
+SPATIAL_INDEX_CELL_DEG    = float(os.getenv("SPATIAL_INDEX_CELL_DEG", "0.1"))    # ~11 km
+SPATIAL_INDEX_WINDOW_DAYS = int(os.getenv("SPATIAL_INDEX_WINDOW_DAYS", "30"))    # historia en memoria
+SPATIAL_INDEX_MAX_AGE     = float(os.getenv("SPATIAL_INDEX_MAX_AGE", "300"))     # s desde la última carga
+
+Cell = Tuple[int, int]
+Row = Tuple[Any, ...]   # columnas en el orden de INCIDENT_COLUMNS
+
+def _ts(value: Any) -> float:
+    if isinstance(value, dt.datetime):
+        return value.timestamp()
+    if isinstance(value, dt.date):
+        return dt.datetime(value.year, value.month, value.day).timestamp()
+    return 0.0
+
+class IncidentIndex:
+    """
+    Índice espacial en memoria de los incidentes recientes.
+    - Rejilla regular de celdas de `cell_deg` grados → posiciones de fila.
+    - Columnas en arrays (lat, lon, fecha) para filtrar sin tocar los dicts.
+    - Sólo responde si está fresco (cargado hace menos de `max_age`) y si puede
+      garantizar el mismo resultado que el SQL: o bien tiene `limit` filas en la
+      ventana, o bien la tabla no tiene historia más antigua que la ventana.
+      En cualquier otro caso devuelve None y el llamador va a la BD.
+    - `token`: token de cambio (changes.py) hasta el que el índice tiene todas
+      las filas; lo mantienen las filas que entrega CHANGES. Sólo con
+      `current(token)` una respuesta armada desde el índice puede llevar ETag.
+    """
+
+    def __init__(self, cell_deg: float = 0.1, window_days: int = 30, max_age: float = 300.0):
+        self.cell_deg = cell_deg
+        self.window_days = window_days
+        self.max_age = max_age
+        self.version = 0   # cambia con cada alta/recarga (invalida copias derivadas)
+        self._reset()
+        self.loaded_at: Optional[float] = None
+        self.has_history = True
+        self.hits = 0
+        self.misses = 0
+        self._rebuilding = False
+        self._pending: List[Row] = []
+        self.token: Optional[int] = None
+        self._pending_token: Optional[int] = None
+        self._lost = False   # CHANGES pidió recargar durante la reconstrucción
+
+    def _reset(self) -> None:
+        self._rows: List[Row] = []
+        self._ids: Set[str] = set()
+        self._lat = array("d")
+        self._lon = array("d")
+        self._ts = array("d")
+        self._sev: List[str] = []
+        self._grid: Dict[Cell, array] = {}
+        self.version += 1
+
+    # ---- construcción ----
+    def _cell(self, lat: float, lon: float) -> Cell:
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def _append(self, row: Sequence[Any]) -> None:
+        key = str(row[ID])
+        if key in self._ids:
+            return
+        row = tuple(row)
+        lat, lon = float(row[LAT]), float(row[LON])
+        pos = len(self._rows)
+        self._rows.append(row)
+        self._ids.add(key)
+        self._lat.append(lat)
+        self._lon.append(lon)
+        self._ts.append(_ts(row[FECHA]))
+        self._sev.append(str(row[SEVERIDAD] or "").lower())
+        self._grid.setdefault(self._cell(lat, lon), array("l")).append(pos)
+        self.version += 1
+
+    def replace(self, rows: Iterable[Sequence[Any]], has_history: bool, token: Optional[int] = None) -> None:
+        """Reconstruye el índice completo (carga inicial o refresco); `token` = el de la lectura."""
+        self._reset()
+        for r in rows:
+            self._append(r)
+        # filas insertadas mientras se leía la BD
+        for r in self._pending:
+            self._append(r)
+        self._pending = []
+        self.has_history = has_history
+        self.loaded_at = time.monotonic()
+        if token is not None and self._pending_token is not None:
+            token = max(token, self._pending_token)
+        self.token = None if self._lost else token
+
+    def add(self, row: Sequence[Any]) -> None:
+        """Incorpora una fila recién insertada (create_incident) o cambiada en otro worker."""
+        if self._rebuilding:
+            self._pending.append(row)
+        if self.loaded_at is not None:
+            self._append(row)
+
+    def on_changes(self, rows: Optional[List[Sequence[Any]]], token: int) -> None:
+        """Oyente de CHANGES: filas cambiadas hasta `token`, o None si hay que recargar."""
+        if rows is None:
+            if self._rebuilding:
+                self._lost = True
+            elif self.token is not None:
+                self.token = None
+                self.schedule_rebuild()
+            return
+        for r in rows:
+            self.add(r)
+        if self._rebuilding:
+            self._pending_token = token
+        elif self.token is not None:
+            self.token = max(self.token, token)
+
+    def current(self, token: Optional[int]) -> bool:
+        """¿Tiene el índice todas las filas hasta `token`?"""
+        return token is not None and self.token is not None and self.token >= token
+
+    # ---- consulta ----
+    def is_fresh(self) -> bool:
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at <= self.max_age
+
+    def query(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+              severities: Optional[Set[str]] = None, limit: int = 200,
+              before: Optional[Tuple[Any, Any]] = None,
+              exclude: Optional[Container[Any]] = None,
+              colors: Optional[Set[str]] = None) -> Optional[List[Row]]:
+        """
+        Filas del bbox ordenadas por (Fecha, Id) DESC, o None si hay que ir a la BD.
+        `before` = (Fecha, Id) del cursor de paginación: sólo filas estrictamente anteriores.
+        `exclude` = Ids a omitir (p.ej. reportes duplicados que no representan a su cluster).
+        `colors` = filtro por color normalizado (como SevCode en el SQL migrado);
+        `severities` compara el valor crudo en minúsculas (como LOWER(Severidad)).
+        """
+        if not self.is_fresh():
+            self.misses += 1
+            return None
+        c0 = self._cell(lat_min, lon_min)
+        c1 = self._cell(lat_max, lon_max)
+        lat, lon, sev, ts, rows = self._lat, self._lon, self._sev, self._ts, self._rows
+        bound = (_ts(before[0]), before[1]) if before else None
+        found: List[int] = []
+        for ci in range(c0[0], c1[0] + 1):
+            for cj in range(c0[1], c1[1] + 1):
+                bucket = self._grid.get((ci, cj))
+                if not bucket:
+                    continue
+                for p in bucket:
+                    if lat_min <= lat[p] <= lat_max and lon_min <= lon[p] <= lon_max \
+                            and (severities is None or sev[p] in severities) \
+                            and (colors is None or normalize_severity(sev[p]) in colors) \
+                            and (bound is None or (ts[p], rows[p][ID]) < bound) \
+                            and (exclude is None or rows[p][ID] not in exclude):
+                        found.append(p)
+        if len(found) < limit and self.has_history:
+            # puede haber filas más antiguas que la ventana: que responda la BD
+            self.misses += 1
+            return None
+        self.hits += 1
+        found.sort(key=lambda p: (ts[p], rows[p][ID]), reverse=True)
+        return [rows[p] for p in found[:limit]]
+
+    def candidates(self, lat_min: float, lat_max: float, lon_min: float,
+                   lon_max: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Posiciones de las celdas que tocan el bbox y sus (lat, lon, fecha) como
+        arrays numpy (copias: las vistas sobre los array() se sueltan antes de
+        volver, si no bloquearían las altas).
+        """
+        c0 = self._cell(lat_min, lon_min)
+        c1 = self._cell(lat_max, lon_max)
+        parts = []
+        for ci in range(c0[0], c1[0] + 1):
+            for cj in range(c0[1], c1[1] + 1):
+                bucket = self._grid.get((ci, cj))
+                if bucket:
+                    parts.append(np.frombuffer(bucket, dtype=np.dtype(f"i{bucket.itemsize}")))
+        if not parts:
+            empty = np.empty(0, dtype=np.float64)
+            return np.empty(0, dtype=np.int64), empty, empty, empty
+        pos = np.concatenate(parts).astype(np.int64, copy=False)
+        del parts
+        lat = np.frombuffer(self._lat, dtype=np.float64)[pos]
+        lon = np.frombuffer(self._lon, dtype=np.float64)[pos]
+        ts = np.frombuffer(self._ts, dtype=np.float64)[pos]
+        return pos, lat, lon, ts
+
+    def row(self, pos: int) -> Row:
+        return self._rows[pos]
+
+    def severity_at(self, pos: int) -> str:
+        return self._sev[pos]
+
+    def columns(self) -> Tuple[array, array, array, List[str]]:
+        """Copias de las columnas (lat, lon, fecha, severidad) para cálculo vectorizado."""
+        return array("d", self._lat), array("d", self._lon), array("d", self._ts), list(self._sev)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": SPATIAL_INDEX_ENABLED,
+            "rows": len(self._rows),
+            "cells": len(self._grid),
+            "fresh": self.is_fresh(),
+            "age_s": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+            "has_history": self.has_history,
+            "rebuilding": self._rebuilding,
+            "token": self.token,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # ---- carga desde la BD ----
+    async def rebuild(self) -> Dict[str, Any]:
+        """Relee de Incidentes la ventana reciente y reemplaza el índice."""
+        if self._rebuilding:
+            return self.stats()
+        self._rebuilding = True
+        self._pending = []
+        try:
+            if CHANGES.synced is None and CHANGES_ENABLED:
+                # primer token del worker antes de leer: el índice nace con token
+                try:
+                    if SCHEMA.version is None:
+                        await SCHEMA.refresh()
+                    await CHANGES.poll()
+                except Exception:
+                    pass
+            # lo entregado hasta aquí ya lo trae la lectura de abajo
+            self._pending_token = None
+            self._lost = False
+            token = CHANGES.synced
+            since = dt.datetime.now() - dt.timedelta(days=self.window_days)
+            rows = await aquery_rows(
+                f"SELECT {INCIDENT_SELECT} FROM Incidentes WHERE Fecha >= ?",
+                (since,),
+            )
+            older = await ascalar("SELECT TOP 1 1 AS x FROM Incidentes WHERE Fecha < ?", (since,))
+            self.replace(rows, has_history=bool(older), token=token)
+        finally:
+            self._rebuilding = False
+        if self._lost:
+            self.schedule_rebuild()   # demasiados cambios durante la lectura: otra pasada
+        return self.stats()
+
+    def schedule_rebuild(self) -> None:
+        """Refresco en segundo plano (no bloquea la petición que lo detecta)."""
+        if self._rebuilding:
+            return
+        task = asyncio.get_running_loop().create_task(self.rebuild())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+INDEX = IncidentIndex(SPATIAL_INDEX_CELL_DEG, SPATIAL_INDEX_WINDOW_DAYS, SPATIAL_INDEX_MAX_AGE)
@@ -0,0 +1,205 @@
+import os
+import math
+import time
+import datetime as dt
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from db_async import aquery_rows
+from migrations import SCHEMA, bbox_where
+from serializers import LAT, LON, dumps, normalize_severity
+from spatial_index import INDEX, SPATIAL_INDEX_ENABLED, IncidentIndex
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+TILE_GRID       = int(os.getenv("TILE_GRID", "8"))             # celdas por lado dentro de cada tesela
+TILE_MAX_ZOOM   = int(os.getenv("TILE_MAX_ZOOM", "18"))
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "4096"))    # teselas en memoria
+TILE_CACHE_TTL  = float(os.getenv("TILE_CACHE_TTL", "60"))     # s (cubre altas hechas en otros workers)
+
+# orden de desempate para la severidad dominante: la más grave primero
+SEVERITY_ORDER = ("purple", "red", "yellow", "blue", "green")
+_SEV_CODE = {c: i for i, c in enumerate(SEVERITY_ORDER)}
+
+Bounds = Tuple[float, float, float, float]   # (west, south, east, north)
+
+# ── Geometría de teselas (XYZ / Web Mercator) ─────────────────────────────────
+def tile_bounds(z: int, x: int, y: int) -> Bounds:
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> Tuple[int, int]:
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    r = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def _merc_y(lat: np.ndarray) -> np.ndarray:
+    return np.arcsinh(np.tan(np.radians(lat)))
+
+def severity_codes(values: List[Any]) -> np.ndarray:
+    return np.fromiter((_SEV_CODE[normalize_severity(str(v or ""))] for v in values),
+                       dtype=np.int8, count=len(values))
+
+# ── Agregación vectorizada ────────────────────────────────────────────────────
+def cluster_points(lat: np.ndarray, lon: np.ndarray, sev: np.ndarray, bounds: Bounds,
+                   grid: int = TILE_GRID, severities: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Agrupa los puntos de la tesela en una rejilla grid×grid (en Mercator, celdas
+    cuadradas en pantalla). Por celda: cantidad, centroide y severidad dominante.
+    """
+    west, south, east, north = bounds
+    m = (lon >= west) & (lon < east) & (lat >= south) & (lat < north)
+    if severities:
+        m &= np.isin(sev, [_SEV_CODE[s] for s in severities if s in _SEV_CODE])
+    if not m.any():
+        return []
+    la, lo, sv = lat[m], lon[m], sev[m].astype(np.int64)
+
+    y0, y1 = _merc_y(np.array([north, south]))
+    cx = np.clip(((lo - west) / (east - west) * grid).astype(np.int64), 0, grid - 1)
+    cy = np.clip(((y0 - _merc_y(la)) / (y0 - y1) * grid).astype(np.int64), 0, grid - 1)
+    cell = cy * grid + cx
+
+    size = grid * grid
+    counts = np.bincount(cell, minlength=size)
+    sum_lat = np.bincount(cell, weights=la, minlength=size)
+    sum_lon = np.bincount(cell, weights=lo, minlength=size)
+    per_sev = np.bincount(cell * len(SEVERITY_ORDER) + sv, minlength=size * len(SEVERITY_ORDER))
+    dominant = per_sev.reshape(size, len(SEVERITY_ORDER)).argmax(axis=1)
+
+    idx = np.nonzero(counts)[0]
+    n = counts[idx]
+    lats = np.round(sum_lat[idx] / n, 5).tolist()
+    lons = np.round(sum_lon[idx] / n, 5).tolist()
+    return [
+        {"lat": a, "lon": b, "count": c, "severity": SEVERITY_ORDER[d]}
+        for a, b, c, d in zip(lats, lons, n.tolist(), dominant[idx].tolist())
+    ]
+
+# ── Caché por tesela ──────────────────────────────────────────────────────────
+class TileCache:
+    """
+    LRU de teselas ya serializadas; se invalida la pirámide de teselas de cada
+    alta. `generation` cambia con cada invalidación: una tesela leída de la BD
+    mientras llegaba un cambio no se guarda (podría no incluirlo).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._data: "OrderedDict[Tuple[int, int, int], Dict[str, Tuple[bytes, float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Tuple[int, int, int], variant: str) -> Optional[bytes]:
+        entry = self._data.get(key, {}).get(variant)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Tuple[int, int, int], variant: str, payload: bytes) -> None:
+        self._data.setdefault(key, {})[variant] = (payload, time.monotonic())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate_point(self, lat: float, lon: float, max_zoom: int = TILE_MAX_ZOOM) -> None:
+        self.generation += 1
+        for z in range(max_zoom + 1):
+            x, y = lonlat_to_tile(lon, lat, z)
+            if self._data.pop((z, x, y), None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tiles": len(self._data), "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations, "generation": self.generation}
+
+# ── Servicio ──────────────────────────────────────────────────────────────────
+class TileService:
+    """
+    Teselas desde la caché, el índice espacial o la BD. `token`: token de
+    cambio (changes.py) hasta el que la caché está invalidada; sólo con
+    `current(token)` la tesela servida puede llevar ETag.
+    """
+
+    def __init__(self, index: Optional[IncidentIndex], cache: TileCache, grid: int = TILE_GRID):
+        self.index = index
+        self.cache = cache
+        self.grid = grid
+        self.token: Optional[int] = None
+        self._cols: Optional[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def _index_columns(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Columnas numpy del índice espacial, recalculadas sólo si cambió su versión."""
+        if self._cols is None or self._cols[0] != self.index.version:
+            lat, lon, _, sev = self.index.columns()
+            self._cols = (self.index.version, np.frombuffer(lat, dtype=np.float64),
+                          np.frombuffer(lon, dtype=np.float64), severity_codes(sev))
+        return self._cols[1], self._cols[2], self._cols[3]
+
+    async def _db_columns(self, bounds: Bounds) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        west, south, east, north = bounds
+        days = self.index.window_days if self.index else 30
+        where, params = bbox_where(south, north, west, east, cells=SCHEMA.cells)
+        rows = await aquery_rows(
+            f"SELECT Lat, Lon, Severidad FROM Incidentes WHERE {where} AND Fecha >= ?",
+            (*params, dt.datetime.now() - dt.timedelta(days=days)),
+        )
+        lat = np.fromiter((float(r[0]) for r in rows), dtype=np.float64, count=len(rows))
+        lon = np.fromiter((float(r[1]) for r in rows), dtype=np.float64, count=len(rows))
+        return lat, lon, severity_codes([r[2] for r in rows])
+
+    def on_changes(self, rows: Optional[List[Any]], token: int) -> None:
+        """Oyente de CHANGES: invalida las teselas de las filas cambiadas (o todas)."""
+        if rows is None:
+            self.cache.clear()
+        else:
+            for r in rows:
+                self.cache.invalidate_point(float(r[LAT]), float(r[LON]))
+        self.token = token
+
+    def current(self, token: Optional[int]) -> bool:
+        return token is not None and self.token is not None and self.token >= token
+
+    async def tile(self, z: int, x: int, y: int, severities: Optional[Set[str]] = None) -> bytes:
+        key = (z, x, y)
+        variant = ",".join(sorted(severities)) if severities else "*"
+        payload = self.cache.get(key, variant)
+        if payload is not None:
+            return payload
+        bounds = tile_bounds(z, x, y)
+        generation = self.cache.generation
+        # el índice sólo si está al día con los mismos cambios que la caché
+        if self.index is not None and self.index.is_fresh() and self.index.token == self.token:
+            lat, lon, sev = self._index_columns()
+        else:
+            lat, lon, sev = await self._db_columns(bounds)
+        clusters = cluster_points(lat, lon, sev, bounds, self.grid, severities)
+        payload = dumps({
+            "z": z, "x": x, "y": y,
+            "bbox": {"west": bounds[0], "south": bounds[1], "east": bounds[2], "north": bounds[3]},
+            "total": sum(c["count"] for c in clusters),
+            "clusters": clusters,
+        })
+        if self.cache.generation == generation:
+            self.cache.put(key, variant, payload)
+        return payload
+
+TILES = TileService(INDEX if SPATIAL_INDEX_ENABLED else None, TileCache(TILE_CACHE_SIZE, TILE_CACHE_TTL))
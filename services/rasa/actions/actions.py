@@ -6,17 +6,15 @@ from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.interfaces import Tracker
 
 from geopy.geocoders import Nominatim
-from rapidfuzz import process as rf
 import unicodedata, re
 
+from .places import PlaceResolver, load_index, load_shared
+
 # User-Agent con contacto real (cumplir política de Nominatim)
 _GEO = Nominatim(user_agent="Riaar/1.0 (soporte@mint.gob.ni)")
 
-# Puedes reemplazar/expandir por tu gazetteer real de NI.
-GAZETTEER = [
-    "Managua", "León", "Santa Teresa, Carazo", "Masaya", "Granada",
-    "Chinandega", "Estelí", "Matagalpa", "Jinotepe", "Tipitapa", "Masatepe"
-]
+# Gazetteer nacional (mismo catálogo que el backend; RASA_GAZETTEER_PATH para GeoNames)
+PLACES = PlaceResolver(load_index(), _GEO, shared=load_shared())
 
 PREV = {
     "terremoto": [
@@ -56,55 +54,41 @@ class ActionGeocodeAndRoute(Action):
     def name(self) -> str:
         return "action_geocode_and_route"
 
-    def run(self,
-            dispatcher: CollectingDispatcher,
-            tracker: Tracker,
-            domain: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def run(self,
+                  dispatcher: CollectingDispatcher,
+                  tracker: Tracker,
+                  domain: Dict[str, Any]) -> List[Dict[str, Any]]:
 
         # 1) toma location del slot o del último mensaje
         place = tracker.get_slot("location") or (tracker.latest_message.get("text") or "")
         place = clean_place(place)
 
-        # 2) autocorrección por gazetteer (typos tipo "satan"→"santa")
-        match = rf.extractOne(place, GAZETTEER, score_cutoff=86)
-        if match:
-            place = match[0]
-
-        # 3) geocodificar con sesgo a Nicaragua y español
-        try:
-            locs = _GEO.geocode(
-                place,
-                country_codes="ni",
-                language="es",
-                addressdetails=True,
-                exactly_one=False,
-                limit=3
-            )
-        except Exception:
-            locs = None
+        # 2) gazetteer (exacto / prefijo / typos tipo "satan"→"santa") y, si no, Nominatim
+        #    en un hilo aparte: el servidor sigue atendiendo otras conversaciones
+        locs = await PLACES.resolve(place)
 
         if not locs:
             dispatcher.utter_message(text=f"No pude verificar «{place}». Prueba con municipio y departamento.")
             return []
 
-        # 4) desambiguación si hay varias coincidencias
+        # 3) desambiguación si hay varias coincidencias
         if len(locs) > 1:
-            chips = [{"type": "suggest", "text": f"Ir a {l.address}"} for l in locs[:3]]
+            chips = [{"type": "suggest", "text": f"Ir a {l['place']}"} for l in locs[:3]]
             dispatcher.utter_message(
                 text="¿A cuál te refieres?",
                 custom={"type": "suggestions", "items": chips}
             )
             return []
 
-        # 5) único destino → enviar payload de navegación
+        # 4) único destino → enviar payload de navegación
         l = locs[0]
-        pretty = l.address
+        pretty = l["place"]
         dispatcher.utter_message(
             text=f"Te llevo a **{pretty}**.",
             custom={
                 "type": "navigate",
                 "place": pretty,
-                "destination": {"lat": l.latitude, "lon": l.longitude}
+                "destination": {"lat": l["lat"], "lon": l["lon"]}
             }
         )
         return [SlotSet("location", pretty)]
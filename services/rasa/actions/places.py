@@ -0,0 +1,173 @@
+"""
+Gazetteer del servidor de acciones: resuelve nombres de lugar sin bloquear.
+
+- Usa el gazetteer del backend (services/backend/gazetteer.py, cargado por
+  ruta): mismo catálogo, misma normalización y mismas reglas exacto → prefijo
+  → difuso; aquí sólo se agrega lo propio del servidor de acciones.
+- Lee services/backend/data/gazetteer_ni.csv o un volcado nacional de GeoNames
+  (NI.txt, miles de poblados) vía RASA_GAZETTEER_PATH.
+- Índice por bloques (dos primeras letras de cada palabra) para acotar los
+  candidatos antes de la comparación difusa.
+- LRU acotado de lugares ya resueltos (gazetteer o Nominatim). Lo que
+  resuelve Nominatim va además al espacio "rasa_places" de la caché compartida
+  del backend (services/backend/sharedcache.py): lo reutilizan los demás
+  procesos y sobrevive reinicios.
+- Nominatim (geopy, síncrono) corre en un pool de hilos propio: el event loop
+  del servidor de acciones sigue atendiendo mientras hay geocodificaciones en curso.
+"""
+import os
+import time
+import asyncio
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Set
+
+# ── Parámetros ────────────────────────────────────────────────────────────────
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_BACKEND = os.path.normpath(os.path.join(_HERE, "..", "..", "backend"))
+RASA_GAZETTEER_PATH = os.getenv("RASA_GAZETTEER_PATH", os.path.join(_BACKEND, "data", "gazetteer_ni.csv"))
+# módulo gazetteer del backend (normalización y búsqueda compartidas)
+RASA_GAZETTEER_MODULE = os.getenv("RASA_GAZETTEER_MODULE", os.path.join(_BACKEND, "gazetteer.py"))
+RASA_FUZZY_CUTOFF    = float(os.getenv("RASA_FUZZY_CUTOFF", "86"))
+RASA_PLACE_CACHE     = int(os.getenv("RASA_PLACE_CACHE", "2048"))    # lugares resueltos en memoria
+RASA_GEOCODE_WORKERS = int(os.getenv("RASA_GEOCODE_WORKERS", "4"))   # hilos para Nominatim
+RASA_GEOCODE_TIMEOUT = float(os.getenv("RASA_GEOCODE_TIMEOUT", "8"))
+# caché compartida del backend; vacío = sólo el LRU del proceso
+RASA_SHARED_CACHE    = os.getenv("RASA_SHARED_CACHE", os.path.join(_BACKEND, "sharedcache.py"))
+RASA_PLACE_TTL       = float(os.getenv("RASA_PLACE_TTL", "86400"))   # s en la caché compartida
+
+def _load_backend(name: str, path: str) -> ModuleType:
+    """Módulo del backend cargado por ruta (el servidor de acciones no es un paquete del backend)."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"no se puede cargar {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+gazetteer = _load_backend("gazetteer", RASA_GAZETTEER_MODULE)
+norm_key = gazetteer.norm_key
+
+def _result(place: Any) -> Dict[str, Any]:
+    label = place.name
+    if place.department and place.kind not in ("department", "country") and place.department != place.name:
+        label = f"{place.name}, {place.department}"
+    return {"place": label, "lat": place.lat, "lon": place.lon, "source": "gazetteer"}
+
+# ── Índice ────────────────────────────────────────────────────────────────────
+class PlaceIndex:
+    """Gazetteer del backend + bloques que acotan los candidatos de la búsqueda difusa."""
+
+    def __init__(self, gaz: Any):
+        self.gaz = gaz
+        # bloques: dos primeras letras de cada palabra de la clave → claves
+        self._blocks: Dict[str, List[str]] = {}
+        for k in gaz.keys:
+            for b in self._block_ids(k):
+                self._blocks.setdefault(b, []).append(k)
+        self.size = len(gaz)
+
+    @classmethod
+    def from_file(cls, path: str) -> "PlaceIndex":
+        return cls(gazetteer.Gazetteer.from_file(path))
+
+    @staticmethod
+    def _block_ids(key: str) -> Set[str]:
+        return {w[:2] for w in key.replace(",", " ").split() if len(w) >= 2}
+
+    def candidates(self, key: str) -> List[str]:
+        """Claves que comparten bloque y cuya longitud permite alcanzar el umbral de ratio."""
+        c = RASA_FUZZY_CUTOFF / 100.0
+        lo, hi = len(key) * c / (2 - c), len(key) * (2 - c) / c
+        out: Set[str] = set()
+        for b in self._block_ids(key):
+            out.update(k for k in self._blocks.get(b, ()) if lo <= len(k) <= hi)
+        return list(out)
+
+    def lookup(self, text: str) -> Optional[Any]:
+        """Exacto → prefijo único → difuso sobre los candidatos del bloque."""
+        return self.gaz.lookup(text, RASA_FUZZY_CUTOFF, self.candidates)
+
+# ── Resolución con caché ──────────────────────────────────────────────────────
+class PlaceResolver:
+    """
+    Gazetteer primero; si no hay coincidencia, caché compartida y después
+    Nominatim en el pool de hilos. Los resultados (incluidas las listas
+    ambiguas) quedan en un LRU acotado.
+    """
+
+    def __init__(self, index: Optional[PlaceIndex], geocoder: Any = None,
+                 maxsize: int = RASA_PLACE_CACHE, workers: int = RASA_GEOCODE_WORKERS, shared: Any = None):
+        self.index = index
+        self.geocoder = geocoder
+        self.shared = shared
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocode")
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return value
+
+    def _nominatim(self, place: str) -> List[Dict[str, Any]]:
+        locs = self.geocoder.geocode(place, country_codes="ni", language="es", addressdetails=True,
+                                     exactly_one=False, limit=3, timeout=RASA_GEOCODE_TIMEOUT)
+        return [{"place": l.address, "lat": l.latitude, "lon": l.longitude, "source": "nominatim"}
+                for l in (locs or [])]
+
+    async def resolve(self, text: str) -> List[Dict[str, Any]]:
+        """0, 1 o varias (ambiguo) coincidencias como {place, lat, lon, source}."""
+        key = norm_key(text)
+        if not key:
+            return []
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        place = self.index.lookup(key) if self.index else None
+        if place is not None:
+            return self._remember(key, [_result(place)])
+        if self.shared is not None:
+            found = await self.shared.aget(key)
+            if found is not None:
+                return self._remember(key, found)
+        if self.geocoder is None:
+            return []
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        try:
+            found = await loop.run_in_executor(self._executor, self._nominatim, text)
+        except Exception:
+            return []   # error de red: no se cachea, el siguiente intento vuelve a consultar
+        if self.shared is not None:
+            self.shared.note_load(time.perf_counter() - t0)
+            self.shared.set(key, found)
+        return self._remember(key, found)
+
+def load_index(path: str = RASA_GAZETTEER_PATH) -> Optional[PlaceIndex]:
+    try:
+        return PlaceIndex.from_file(path)
+    except OSError as e:
+        print(f"[actions] No se pudo cargar el gazetteer {path}: {e}")
+        return None
+
+def load_shared(path: str = RASA_SHARED_CACHE, ttl: float = RASA_PLACE_TTL) -> Any:
+    """Espacio "rasa_places" de la caché compartida; None si no está disponible."""
+    if not path:
+        return None
+    try:
+        module = _load_backend("sharedcache", path)
+    except (OSError, ImportError) as e:
+        print(f"[actions] Sin caché compartida ({path}): {e}")
+        return None
+    cache = module.SHARED
+    return cache.namespace("rasa_places", ttl) if cache.enabled else None
@@ -0,0 +1,91 @@
+"""
+Prueba de concurrencia del servidor de acciones.
+
+Lanza N navegaciones a lugares que no están en el gazetteer (van a un Nominatim
+simulado que bloquea `--delay` segundos, como geopy) y, mientras están en vuelo,
+mide:
+  - el retraso máximo del event loop (latido cada 10 ms),
+  - la latencia de una navegación resuelta por el gazetteer ("Managua").
+Falla (código 1) si el loop se bloqueó o si la petición rápida tuvo que esperar
+a las lentas.
+
+Uso (desde services/rasa, con rasa_sdk instalado):
+    python bench/bench_action_concurrency.py [--n 20] [--delay 1.0]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actions.actions import ActionGeocodeAndRoute, PLACES  # noqa: E402
+
+class SlowGeocoder:
+    """Nominatim simulado: bloquea el hilo como la llamada HTTP real de geopy."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def geocode(self, query, **kwargs):
+        time.sleep(self.delay)
+        return [SimpleNamespace(address=f"{query}, Nicaragua", latitude=12.1, longitude=-86.2)]
+
+class Dispatcher:
+    def __init__(self):
+        self.messages = []
+
+    def utter_message(self, text=None, **kwargs):
+        self.messages.append({"text": text, **kwargs})
+
+class Tracker:
+    def __init__(self, text: str):
+        self.latest_message = {"text": text}
+
+    def get_slot(self, name):
+        return None
+
+async def navigate(text: str) -> float:
+    t0 = time.perf_counter()
+    await ActionGeocodeAndRoute().run(Dispatcher(), Tracker(text), {})
+    return time.perf_counter() - t0
+
+async def heartbeat(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - t0 - 0.01)
+
+async def main_async(n: int, delay: float) -> int:
+    PLACES.geocoder = SlowGeocoder(delay)
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    t0 = time.perf_counter()
+    slow = [asyncio.create_task(navigate(f"Lugar inexistente {i}")) for i in range(n)]
+    await asyncio.sleep(0.05)
+    fast = await navigate("ir a Managua")
+    slow_times = await asyncio.gather(*slow)
+    total = time.perf_counter() - t0
+    stop.set()
+    await beat
+
+    max_lag = max(lags) if lags else 0.0
+    print(f"{n} geocodificaciones lentas ({delay}s c/u) en {total:.2f}s "
+          f"(máx. individual {max(slow_times):.2f}s)")
+    print(f"navegación por gazetteer durante la carga: {fast * 1000:.1f} ms")
+    print(f"retraso máximo del event loop: {max_lag * 1000:.1f} ms")
+    ok = max_lag < 0.1 and fast < delay / 2
+    print("OK" if ok else "FALLO: el servidor de acciones se bloqueó")
+    return 0 if ok else 1
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20)
+    ap.add_argument("--delay", type=float, default=1.0)
+    args = ap.parse_args()
+    return asyncio.run(main_async(args.n, args.delay))
+
+if __name__ == "__main__":
+    sys.exit(main())